@@ -0,0 +1,1310 @@
+# ####################################################################
+#
+# Program:  ProcessHUDfilesForVizWithFnV7.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This script processes census tract-level HUD input files by creating
+# summary statistics of individual variables at multiple spatial scales
+# (nation, state, county).  Census tract level is already included in the
+# files.
+#
+# The purpose in doing this is to develop visualizations of these
+# statistics over time at multiple spatial scales (national, state,
+# county, and the original census tract level).
+#
+# These multiple spatial scales might then be served for analysis
+# using R Shiny or other methods.
+#
+# Updates in this version:
+#
+# - the row-by-row iterrows loop has been replaced by the grouped
+#   summaries in hudAggregate.py
+# - each file is partitioned by state FIPS prefix, and the states are
+#   summarized by a pool of worker processes (--workers).  This helps
+#   most when only a single new quarter is being processed.
+# - the partial results are merged and written in GEOID order, so the
+#   output files are the same as a serial run (--workers 1)
+# - the files are processed in order by year/quarter
+# - a run can write its county level sums as a "partial aggregate"
+#   (--partial).  To spread the archive across several machines, run
+#   each machine with --shard K/N and --partial, and combine the
+#   partials with the merge command.  A shard writes only its tract
+#   rows, to tract_KofN.csv (and its sketches to state_sketch_KofN.npz),
+#   so shards can share an output directory;  merge interleaves the
+#   shards' tract files by quarter into tract.csv
+# - pipelined mode (--pipeline) reads the next files while the current
+#   one is summarized, and writes the output files from a background
+#   thread (see hudPipeline.py)
+# - the time, records/s, bytes and memory of every stage of every file
+#   are recorded (see hudMetrics.py), written as JSON lines (--metrics)
+#   and summarized at the end of the run
+# - the records of each quarter are checked as they are read (buckets
+#   adding up to RES_VAC, negative counts, RES_VAC > AMS_RES, duplicate
+#   GEOIDs; see hudValidate.py).  The anomaly reports can be written
+#   as JSON lines (--anomalies), and the failing records can be left
+#   out of the summaries (--quarantine).
+# - the quarter of each file is parsed from its name with a pattern
+#   (MMYYYY or YYYY_MM) instead of fixed slices, and the headings are
+#   checked from the .dbf header (uppercase or lowercase, all columns
+#   present) before the run starts.  The headers are cached in a
+#   catalog manifest (--catalog, see hudCatalog.py), and the catalog
+#   command prints it.
+# - the input can be the zip archives HUD delivers (--input '*.zip'):
+#   the *Data.dbf member is read straight out of the archive, without
+#   extracting it
+# - the shards command writes one JSON document per GEOID per level,
+#   shaped for the stacked bar plot, with a manifest (see hudShards.py)
+# - the output files can be compressed with gzip or zstd (--compress,
+#   --compressLevel), written as tract.csv.gz or tract.csv.zst.  The
+#   compression is done by the background writer thread, so it overlaps
+#   with the summaries of the next file.
+# - the long command writes the four files as one long file with one
+#   schema (level, GEOID, quarter, metrics), sorted by level, GEOID and
+#   quarter, with an offset index per GEOID (see hudLong.py)
+# - every run records a fingerprint of each input (revisions.json).
+#   When HUD reissues a quarter, the revise command finds the changed
+#   file, compares it tract by tract with tract.csv, and patches only
+#   the affected tract, county, state and national rows into the
+#   output files, logging the changes to revisions.jsonl (see
+#   hudRevise.py)
+# - the spatial command calculates the global Moran's I of the tract
+#   vacancy rate for every quarter (moran.csv), and the local Moran's
+#   I and cluster of every tract (lisa.csv), from contiguity weights
+#   built once from the shapefile next to the .dbf (see hudSpatial.py)
+# - the hotspots command calculates the Getis-Ord Gi* z-score and hot
+#   or cold spot class of the long term (24+ months) vacancy rate of
+#   every tract and quarter (gistar.csv), from the same weights
+# - the geometry command writes simplified GeoJSON and TopoJSON of the
+#   four levels (dissolved from the tract shapefile) for choropleth
+#   maps, keyed by the GEOIDs of the output files, and only writes them
+#   again when the shapefile changes (see hudGeometry.py)
+# - the locate command adds the tract GEOID to a .csv file of points
+#   (e.g. property coordinates), optionally with the tract's rows of
+#   every quarter, using an STR-tree over the tract shapefile which is
+#   saved next to the outputs (see hudLocate.py)
+# - the trend command fits the vacancy rate of every tract against
+#   time (slope, intercept, R-squared, significance) in closed form,
+#   for all tracts at once, and writes trend.csv (see hudTrend.py)
+# - the forecast command forecasts the vacancy rate and the vacant
+#   addresses of the next quarter, with intervals, for every GEOID of
+#   every level (forecast.csv) from a seasonal model fit to all series
+#   at once.  With --backtest it replays the archive quarter by quarter
+#   instead and reports the errors and run time (backtest.csv, see
+#   hudForecast.py)
+# - the changes command finds the level shifts of the tract and county
+#   vacancy rate series (binary segmentation, all series at once) and
+#   writes the break quarters and magnitudes to changes.csv (see
+#   hudChange.py)
+# - the clusters command groups the tracts by the course of their
+#   vacancy rate (normalized series, mini-batch k-means, seeded) and
+#   writes the cluster of every tract (clusters.csv) and the centers
+#   (centroids.csv, see hudCluster.py)
+# - the breaks command calculates the map legend classes (Jenks natural
+#   breaks, quantiles and equal intervals) of every mapped metric per
+#   level and quarter, and over all quarters (breaks.csv, see
+#   hudBreaks.py)
+# - every run saves a quantile sketch of the tract vacancy rates of each
+#   state and quarter next to state.csv (state_sketch.npz), so the
+#   percentile of a tract within its state can be looked up without
+#   tract.csv (see hudSketch.py).  A run with --shard K/N writes
+#   state_sketch_KofN.npz instead, and merge combines the shards'
+#   sketch files into state_sketch.npz
+#
+# Usage:
+#
+#   python ProcessHUDfilesForVizWithFnV7.py [run] [--input GLOB]
+#                  [--outdir DIR] [--workers N] [--shard K/N]
+#                  [--partial FILE] [--pipeline] [--prefetch N]
+#                  [--metrics FILE] [--anomalies FILE] [--quarantine]
+#                  [--catalog FILE] [--compress gzip|zstd]
+#                  [--compressLevel N]
+#   python ProcessHUDfilesForVizWithFnV7.py merge [--outdir DIR]
+#                  [--compress gzip|zstd] [--compressLevel N]
+#                  [--tracts FILE] ... [--sketches FILE] ... FILE ...
+#   python ProcessHUDfilesForVizWithFnV7.py catalog [--input GLOB]
+#                  [--outdir DIR] [--catalog FILE]
+#   python ProcessHUDfilesForVizWithFnV7.py shards [--outdir DIR]
+#                  [--shardDir DIR] [--levels LEVEL,...]
+#   python ProcessHUDfilesForVizWithFnV7.py long [--outdir DIR]
+#                  [--longFile FILE]
+#   python ProcessHUDfilesForVizWithFnV7.py revise [--input GLOB]
+#                  [--outdir DIR] [--catalog FILE] [--quarantine]
+#   python ProcessHUDfilesForVizWithFnV7.py spatial [--input GLOB]
+#                  [--outdir DIR] [--shapefile FILE] [--rule queen|rook]
+#                  [--alpha P] [--weightsDir DIR]
+#   python ProcessHUDfilesForVizWithFnV7.py hotspots [--input GLOB]
+#                  [--outdir DIR] [--shapefile FILE] [--rule queen|rook]
+#                  [--weightsDir DIR]
+#   python ProcessHUDfilesForVizWithFnV7.py geometry [--input GLOB]
+#                  [--outdir DIR] [--shapefile FILE] [--geoDir DIR]
+#                  [--tolerances T,...] [--quantize N] [--force]
+#   python ProcessHUDfilesForVizWithFnV7.py locate --points FILE
+#                  [--input GLOB] [--outdir DIR] [--shapefile FILE]
+#                  [--xCol NAME] [--yCol NAME] [--locations FILE]
+#                  [--history] [--indexDir DIR]
+#   python ProcessHUDfilesForVizWithFnV7.py trend [--outdir DIR]
+#                  [--alpha P] [--minQuarters N]
+#   python ProcessHUDfilesForVizWithFnV7.py forecast [--outdir DIR]
+#                  [--window N] [--level P] [--backtest] [--minTrain N]
+#   python ProcessHUDfilesForVizWithFnV7.py changes [--outdir DIR]
+#                  [--levels LEVEL,...] [--maxBreaks N] [--minSize N]
+#                  [--penalty X]
+#   python ProcessHUDfilesForVizWithFnV7.py clusters [--outdir DIR]
+#                  [--clusters K] [--batchSize N] [--iterations N]
+#                  [--seed N] [--levelWeight W] [--minQuarters N]
+#   python ProcessHUDfilesForVizWithFnV7.py breaks [--outdir DIR]
+#                  [--levels LEVEL,...] [--methods METHOD,...]
+#                  [--classes K]
+#
+# This script was built with Python 3.6.0
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import sys
+import json
+import argparse
+from glob import glob
+from datetime import datetime     # time tracking
+import hudAggregate as ha
+import hudPipeline as hp
+import hudMetrics as hm
+import hudValidate as hv
+import hudCatalog as hc
+import hudShards as hsh
+import hudLong as hl
+import hudRevise as hr
+import hudSpatial as hsp
+import hudGeometry as hg
+import hudLocate as hlo
+import hudTrend as ht
+import hudForecast as hfc
+import hudChange as hch
+import hudCluster as hcl
+import hudBreaks as hb
+import hudSketch as hsk
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+defaultInput = os.path.join('..', 'Shapefiles', '*Data.dbf')
+defaultOutdir = os.path.join('..', 'HUD')
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+qtrYearFromName
+
+This function: returns the Month/Year label for a HUD file, using the
+quarter found in the filename (see hudCatalog.parseQuarter).
+
+Arguments
+---------
+myFile  : string - HUD filename
+'''
+
+def qtrYearFromName(myFile):
+
+    return hc.qtrLabel(*hc.parseQuarter(myFile))
+
+# ####################################################################
+'''
+sortKey
+
+This function: returns a (year, month) key used to process the files
+in date order, beginning with the earliest file.
+
+Arguments
+---------
+myFile  : string - HUD filename
+'''
+
+def sortKey(myFile):
+
+    return hc.parseQuarter(myFile)
+
+# ####################################################################
+'''
+readFile
+
+This function: reads one HUD .dbf file, converts it to the pandas
+data frame used by the summaries and checks the records (see
+hudValidate.py), recording the read, decode and validate stages.
+
+Returns the data frame to be summarized, the anomaly report, and the
+quarantined records (None unless quarantine is set).
+
+Arguments
+---------
+myFile      : string - HUD .dbf filename
+metrics     : RunMetrics - Stage measurements
+quarantine  : boolean - Remove records which fail a check
+'''
+
+def readFile(myFile, metrics, quarantine=False):
+
+    with metrics.stage(myFile, "read",
+                       bytesRead=os.path.getsize(hc.splitInput(myFile)[0])
+                       ) as m:
+        rawDF = ha.readDBF(myFile)
+        m["records"] = len(rawDF)
+
+    with metrics.stage(myFile, "decode", records=len(rawDF)):
+        mypandasDF = ha.projectDF(rawDF)
+
+    with metrics.stage(myFile, "validate", records=len(mypandasDF)):
+        mypandasDF, report, badDF = hv.validateDF(mypandasDF,
+                                                  qtrYearFromName(myFile),
+                                                  quarantine)
+
+    return mypandasDF, report, badDF
+
+# ####################################################################
+'''
+processFiles
+
+This function: summarizes every file in fileNames and writes the
+national, state, county and tract files to outdir.  Returns the
+number of records written to each level.
+
+Arguments
+---------
+fileNames  : list - HUD .dbf filenames, in processing order
+outdir     : string - Output directory
+workers    : int - Number of worker processes per file
+startTime  : datetime - Start of the run (for progress messages)
+partialFile : string - If given, also write the partial aggregate here
+pipeline   : boolean - Read ahead and write in background threads
+prefetch   : int - Number of files read ahead in pipelined mode
+metrics    : RunMetrics - Stage measurements (optional)
+quarantine : boolean - Leave out (and save) records which fail a check
+anomalyFile : string - If given, write the anomaly reports here
+compression : string - Output compression:  "none", "gzip" or "zstd"
+compressLevel : int - Compression level (None for the codec default)
+shard      : string - "K/N" if the files are one shard of a run:  only
+             the tract rows are written, to tract_KofN.csv
+'''
+
+def processFiles(fileNames, outdir, workers=1, startTime=None,
+                 partialFile=None, pipeline=False, prefetch=2,
+                 metrics=None, quarantine=False, anomalyFile=None,
+                 compression="none", compressLevel=None, shard=None):
+
+    if startTime is None:
+        startTime = datetime.now()
+
+    if metrics is None:
+        metrics = hm.RunMetrics()
+
+    def reader(myFile):
+        return readFile(myFile, metrics, quarantine)
+
+    # open four files for output and write the headers
+    # one for each scale:  national, state, county, tract (a shard
+    # writes only its tract file, the rest comes from the partials)
+    outNames = dict((level, level) for level in ha.levels)
+    sketchName = hsk.sketchFile
+    if shard:
+        outNames = {"tract": ha.shardLevel % shardNumbers(shard)}
+        sketchName = hsk.shardSketchFile % shardNumbers(shard)
+    outFiles = {}
+    for level, name in outNames.items():
+        ha.removeSiblings(outdir, name, compression)
+        outFiles[level], _ = ha.openWriter(ha.levelFile(outdir, name,
+                                                        compression),
+                                           compression, compressLevel)
+
+    # the quarantined records, and the anomaly reports
+    badFile = None
+    if quarantine:
+        badFile = open(os.path.join(outdir, 'quarantine.csv'), "w")
+        ha.newWriter(badFile).writerow(['Month/Year'] + ha.colsList)
+    reportFile = open(anomalyFile, "w") if anomalyFile else None
+
+    numRecords = dict((level, 0) for level in ha.levels)
+    partials = []
+    sketches = {}
+
+    pool = ha.newPool(workers)
+    writer = None
+    finished = False
+    try:
+        if pipeline:
+            # read ahead, and write from a background thread
+            inFiles = hp.prefetchFiles(fileNames, reader, prefetch)
+        else:
+            # open and convert each .dbf file to pandas data frame
+            inFiles = ((myFile, reader(myFile)) for myFile in fileNames)
+
+        # compress in the background, while the next file is summarized
+        if pipeline or compression != "none":
+            writer = hp.BackgroundWriter(outFiles, metrics=metrics)
+
+        for myFile, (mypandasDF, report, badDF) in inFiles:
+
+            # get current month/year for this file
+            myQtrYear = qtrYearFromName(myFile)
+            print("Month/Year: %s" % (myQtrYear))
+
+            # report (and save) the records which failed a check
+            if report["anomalies"]:
+                print(hv.reportLine(report))
+            if reportFile is not None:
+                reportFile.write(json.dumps(report) + "\n")
+            if badDF is not None and len(badDF):
+                ha.newWriter(badFile).writerows(
+                    [myQtrYear] + row
+                    for row in badDF[ha.colsList].values.tolist())
+
+            with metrics.stage(myFile, "aggregate",
+                               records=len(mypandasDF)) as m:
+                result = ha.aggregateFile(mypandasDF, myQtrYear, pool)
+                m["workerCPU"] = result["workerCPU"]
+
+            for level in ha.levels:
+                count = result["counts"][level]
+                numRecords[level] += count
+                if level not in outFiles:
+                    continue
+                if writer is None:
+                    with metrics.stage(myFile, "write." + level,
+                                       records=count,
+                                       bytesWritten=hm.textBytes(
+                                           result[level])):
+                        outFiles[level].write(result[level])
+                else:
+                    writer.put(level, result[level], myFile, count)
+
+            if partialFile is not None:
+                partials.append(result["partial"])
+
+            with metrics.stage(myFile, "sketch", records=len(mypandasDF)):
+                for key, sketch in hsk.quarterSketches(
+                        myQtrYear, mypandasDF).items():
+                    sketches[(myQtrYear,) + key] = sketch
+
+            print(" ")
+            print("The file %s has completed processing." % (myFile))
+            print("Time interval to this file: %s" %
+                  (str(datetime.now() - startTime)))
+        finished = True
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        # wait for the background writer to finish (its error must not
+        # hide an error which is already on its way out)
+        if writer is not None:
+            writer.close(raiseError=finished)
+
+        # close all files
+        for level in outFiles:
+            outFiles[level].close()
+        if badFile is not None:
+            badFile.close()
+        if reportFile is not None:
+            reportFile.close()
+
+    if partialFile is not None and partials:
+        ha.writePartial(ha.mergePartials(partials), partialFile)
+
+    if sketches:
+        hsk.writeSketches(outdir, sketches, sketchName)
+
+    return numRecords
+
+# ####################################################################
+'''
+shardNumbers
+
+This function: returns K and N of a shard "K/N" of a run.
+
+Arguments
+---------
+shard  : string - "K/N" (shard K of N, counting from 1)
+'''
+
+def shardNumbers(shard):
+
+    k, n = [int(x) for x in shard.split("/")]
+    if not 1 <= k <= n:
+        raise ValueError("shard must be K/N with 1 <= K <= N: %s" % (shard))
+
+    return k, n
+
+# ####################################################################
+'''
+shardFiles
+
+This function: returns the files belonging to one shard of a run, so
+that the quarters can be spread across several machines.  Each
+machine runs with --shard K/N and --partial, and the partials and
+tract files are then combined with the merge command.
+
+Arguments
+---------
+fileNames  : list - HUD .dbf filenames, in processing order
+shard      : string - "K/N" (shard K of N, counting from 1)
+'''
+
+def shardFiles(fileNames, shard):
+
+    k, n = shardNumbers(shard)
+
+    return fileNames[k - 1::n]
+
+# ####################################################################
+'''
+runCommand
+
+This function: the "run" command.  Summarizes the HUD files and writes
+the four output files (and optionally a partial aggregate).  A shard
+(--shard) writes its tract file and needs --partial for the rest.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def runCommand(args):
+
+    if args.shard and not args.partial:
+        raise ValueError("--shard needs --partial:  the national, state "
+                         "and county files are merged from the partials")
+
+    # Start the timer
+    startTime = datetime.now()
+    print("Start time: ")
+    print(startTime)
+
+    # get list of all .dbf filenames, in year/quarter order, and check
+    # their headings (from the catalog, without reading any records)
+    entries = hc.buildCatalog(hc.expandInputs(glob(args.input)),
+                              catalogName(args))
+    hc.checkCatalog(entries)
+    fileNames = [entry["path"] for entry in entries]
+    if args.shard:
+        fileNames = shardFiles(fileNames, args.shard)
+    print(" ")
+    print(fileNames)
+
+    metrics = hm.RunMetrics(args.metrics)
+    try:
+        numRecords = processFiles(fileNames, args.outdir, args.workers,
+                                  startTime, args.partial, args.pipeline,
+                                  args.prefetch, metrics, args.quarantine,
+                                  args.anomalies, args.compress,
+                                  args.compressLevel, args.shard)
+
+        print("Total number of records processed: %i" %
+              (numRecords["tract"]))
+        print("Number of national records: %i" % (numRecords["national"]))
+        print("Number of state records: %i" % (numRecords["state"]))
+        print("Number of county records: %i" % (numRecords["county"]))
+        print("Number of tract records: %i" % (numRecords["tract"]))
+
+        # fingerprints of the inputs, to find reissued quarters later
+        hr.recordInputs(fileNames, [qtrYearFromName(f) for f in fileNames],
+                        args.outdir)
+    finally:
+        # time spent in each stage (also of a failed run)
+        metrics.close()
+
+    # End the timer
+    print(" ")
+    print("Finished all processing")
+    print(datetime.now() - startTime)
+
+# ####################################################################
+'''
+catalogName
+
+This function: returns the catalog manifest used by a command:
+--catalog if given, otherwise catalog.json in the output directory.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def catalogName(args):
+
+    if args.catalog:
+        return args.catalog
+
+    return os.path.join(args.outdir, 'catalog.json')
+
+# ####################################################################
+'''
+catalogCommand
+
+This function: the "catalog" command.  Updates the catalog of the HUD
+files (from their headers only) and prints it.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def catalogCommand(args):
+
+    entries = hc.buildCatalog(hc.expandInputs(glob(args.input)),
+                              catalogName(args))
+
+    print("%-8s %-6s %10s %7s  %s" %
+          ("Quarter", "Case", "Records", "Fields", "File"))
+    for entry in entries:
+        print("%-8s %-6s %10i %7i  %s" %
+              (entry["label"], entry["case"], entry["numRecords"],
+               len(entry["fields"]), entry["path"]))
+        if entry["missing"]:
+            print("         missing:  %s" % (", ".join(entry["missing"])))
+
+    print("%i files, %i records" %
+          (len(entries), sum(entry["numRecords"] for entry in entries)))
+
+# ####################################################################
+'''
+mergeCommand
+
+This function: the "merge" command.  Reduces any number of partial
+aggregates into the national, state and county files, and combines the
+tract and sketch files of the shards (by default the tract_KofN.csv
+and state_sketch_KofN.npz files in the output directory) into
+tract.csv and state_sketch.npz.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def mergeCommand(args):
+
+    partial = ha.mergePartials(ha.readPartial(f) for f in args.partials)
+    numRecords = ha.writeSummaries(partial, args.outdir, args.compress,
+                                   args.compressLevel)
+
+    print("Merged %i partial files" % (len(args.partials)))
+    print("Number of national records: %i" % (numRecords["national"]))
+    print("Number of state records: %i" % (numRecords["state"]))
+    print("Number of county records: %i" % (numRecords["county"]))
+
+    tractFiles = args.tracts
+    if tractFiles is None:
+        tractFiles = sorted(glob(os.path.join(args.outdir, ha.shardGlob)))
+    if tractFiles:
+        numTracts = ha.mergeTractFiles(tractFiles, args.outdir,
+                                       args.compress, args.compressLevel)
+        print("Merged %i tract files (%i tract records)" %
+              (len(tractFiles), numTracts))
+
+    sketchFiles = args.sketches
+    if sketchFiles is None:
+        sketchFiles = sorted(glob(os.path.join(args.outdir,
+                                               hsk.shardSketchGlob)))
+    if sketchFiles:
+        sketches = hsk.combineSketches(sketchFiles)
+        hsk.writeSketches(args.outdir, sketches)
+        print("Merged %i sketch files (%i sketches)" %
+              (len(sketchFiles), len(sketches)))
+
+# ####################################################################
+'''
+shardsCommand
+
+This function: the "shards" command.  Writes the per GEOID JSON shards
+of the output files.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def shardsCommand(args):
+
+    shardDir = args.shardDir or os.path.join(args.outdir, 'shards')
+    levels = args.levels.split(",") if args.levels else None
+    numShards = hsh.writeShards(args.outdir, shardDir, levels)
+
+    for level, count in numShards.items():
+        print("Number of %s shards: %i" % (level, count))
+
+# ####################################################################
+'''
+longCommand
+
+This function: the "long" command.  Writes the long file and its
+offset index from the output files.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def longCommand(args):
+
+    numRows = hl.writeLong(args.outdir, args.longFile)
+
+    for level, count in numRows.items():
+        print("Number of %s rows: %i" % (level, count))
+
+# ####################################################################
+'''
+reviseCommand
+
+This function: the "revise" command.  Finds the inputs which have
+changed since they were processed (by fingerprint) and patches their
+changes into the output files.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def reviseCommand(args):
+
+    entries = hc.buildCatalog(hc.expandInputs(glob(args.input)),
+                              catalogName(args))
+    hc.checkCatalog(entries)
+    fileNames = [entry["path"] for entry in entries]
+
+    changed, unknown = hr.changedInputs(
+        fileNames, [qtrYearFromName(f) for f in fileNames], args.outdir)
+
+    if unknown:
+        print("Not processed yet (use the run command): %s" %
+              (", ".join(unknown)))
+    if not changed:
+        print("No reissued quarters")
+        return
+
+    metrics = hm.RunMetrics()
+    for myFile, myQtrYear, entry in changed:
+        mypandasDF, report, badDF = readFile(myFile, metrics,
+                                             args.quarantine)
+        if report["anomalies"]:
+            print(hv.reportLine(report))
+
+        record = hr.reviseQuarter(args.outdir, myQtrYear, mypandasDF)
+        hr.logRevision(args.outdir, record, entry)
+
+        print("Month/Year: %s (%s)" % (myQtrYear, myFile))
+        print("Tracts changed: %i, added: %i, removed: %i" %
+              tuple(record["tracts"][change]["count"]
+                    for change in ["changed", "added", "removed"]))
+        for level, counts in record["rows"].items():
+            print("Number of %s rows replaced: %i, inserted: %i, "
+                  "removed: %i" % (level, counts["replaced"],
+                                   counts["inserted"], counts["removed"]))
+
+    print(" ")
+    print("Write the long file and the shards again if they are used")
+
+# ####################################################################
+'''
+shapefileArg
+
+This function: returns the tract shapefile for the spatial, hotspots,
+geometry and locate commands:  --shapefile, or the shapefile next to
+the latest quarter.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def shapefileArg(args):
+
+    if args.shapefile is not None:
+        return args.shapefile
+
+    fileNames = sorted(hc.expandInputs(glob(args.input)), key=sortKey)
+    if not fileNames:
+        raise ValueError("no input matches %s" % (args.input))
+
+    return hsp.shapefileFor(fileNames[-1])
+
+# ####################################################################
+'''
+spatialWeights
+
+This function: returns the contiguity weights for the spatial and
+hotspots commands.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def spatialWeights(args):
+
+    weights = hsp.loadWeights(shapefileArg(args),
+                              args.weightsDir or args.outdir, args.rule)
+    print("Contiguity weights (%s): %i tracts, %i links, %s" %
+          (args.rule, len(weights["geoids"]), len(weights["indices"]),
+           weights["cache"]))
+
+    return weights
+
+# ####################################################################
+'''
+spatialCommand
+
+This function: the "spatial" command.  Calculates the global and
+local Moran's I of the tract vacancy rates of every quarter.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def spatialCommand(args):
+
+    startTime = datetime.now()
+
+    weights = spatialWeights(args)
+    numRows = hsp.writeSpatial(args.outdir, weights, args.alpha)
+
+    print("Number of moran.csv rows: %i" % (numRows["moran"]))
+    print("Number of lisa.csv rows: %i" % (numRows["lisa"]))
+    print(datetime.now() - startTime)
+
+# ####################################################################
+'''
+hotspotsCommand
+
+This function: the "hotspots" command.  Calculates the Getis-Ord Gi*
+hot and cold spots of the tract long term vacancy rates of every
+quarter.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def hotspotsCommand(args):
+
+    startTime = datetime.now()
+
+    weights = spatialWeights(args)
+    numRows = hsp.writeHotspots(args.outdir, weights)
+
+    print("Number of gistar.csv rows: %i" % (numRows))
+    print(datetime.now() - startTime)
+
+# ####################################################################
+'''
+geometryCommand
+
+This function: the "geometry" command.  Writes the simplified geometry
+of the four levels, unless it is up to date.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def geometryCommand(args):
+
+    startTime = datetime.now()
+
+    geoDir = args.geoDir or os.path.join(args.outdir, "geometry")
+    tolerances = [float(t) for t in args.tolerances.split(",")]
+    manifest = hg.writeGeometry(shapefileArg(args), geoDir, tolerances,
+                                args.quantize, args.force)
+
+    if manifest["cached"]:
+        print("Geometry in %s is up to date" % (geoDir))
+    else:
+        print("Number of arcs: %i" % (manifest["arcs"]))
+        for level in ha.levels:
+            print("Number of %s features: %i" %
+                  (level, manifest["features"][level]))
+        print("Files written to %s: %i" % (geoDir, len(manifest["files"])))
+    print(datetime.now() - startTime)
+
+# ####################################################################
+'''
+locateCommand
+
+This function: the "locate" command.  Adds the tract GEOID (and with
+--history the tract rows) to a .csv file of points.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def locateCommand(args):
+
+    startTime = datetime.now()
+
+    locator = hlo.loadLocator(shapefileArg(args),
+                              args.indexDir or args.outdir)
+    print("Tract index: %i rings, %s" % (len(locator["ringRecords"]),
+                                         locator["cache"]))
+
+    outName = args.locations or \
+        os.path.splitext(args.points)[0] + "_tracts.csv"
+    counts = hlo.locateFile(locator, args.points, outName, args.xCol,
+                            args.yCol, args.outdir if args.history else None)
+
+    print("Number of points: %i" % (counts["points"]))
+    print("Number of points in a tract: %i" % (counts["located"]))
+    print("Written to %s" % (outName))
+    print(datetime.now() - startTime)
+
+# ####################################################################
+'''
+trendCommand
+
+This function: the "trend" command.  Fits the vacancy rate trend of
+every tract.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def trendCommand(args):
+
+    startTime = datetime.now()
+
+    counts = ht.writeTrends(args.outdir, args.alpha, args.minQuarters)
+
+    for trend in ["rising", "falling", "flat"]:
+        print("Number of %s tracts: %i" % (trend, counts[trend]))
+    print("Number of tracts with too few quarters: %i" % (counts["none"]))
+    print(datetime.now() - startTime)
+
+# ####################################################################
+'''
+forecastCommand
+
+This function: the "forecast" command.  Forecasts the next quarter of
+every level, or backtests the forecasts over the archive.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def forecastCommand(args):
+
+    startTime = datetime.now()
+
+    if args.backtest:
+        rows = hfc.backtest(args.outdir, args.window, args.level,
+                            args.minTrain)
+        print("%-9s %-7s %8s %12s %12s %9s %12s %9s" %
+              ("Level", "Series", "Quarters", "MAE", "RMSE", "Coverage",
+               "Naive MAE", "Seconds"))
+        for row in hfc.backtestSummary(rows):
+            print("%-9s %-7s %8i %12.6g %12.6g %9.3f %12.6g %9.3f" %
+                  tuple(row))
+    else:
+        numRows = hfc.writeForecasts(args.outdir, args.window, args.level)
+        for level in ha.levels:
+            print("Number of %s forecasts: %i" % (level, numRows[level]))
+    print(datetime.now() - startTime)
+
+# ####################################################################
+'''
+changesCommand
+
+This function: the "changes" command.  Finds the level shifts of the
+vacancy rate series.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def changesCommand(args):
+
+    startTime = datetime.now()
+
+    levels = args.levels.split(",")
+    for level in levels:
+        if level not in ha.levels:
+            raise ValueError("unknown level %s" % (level))
+
+    counts = hch.writeChanges(args.outdir, levels, args.maxBreaks,
+                              args.minSize, args.penalty)
+
+    for level in levels:
+        print("Number of %s breaks: %i (%i series)" %
+              (level, counts[level]["breaks"], counts[level]["series"]))
+    print(datetime.now() - startTime)
+
+# ####################################################################
+'''
+clustersCommand
+
+This function: the "clusters" command.  Groups the tracts by their
+vacancy rate trajectories.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def clustersCommand(args):
+
+    startTime = datetime.now()
+
+    summary = hcl.writeClusters(args.outdir, args.clusters, args.batchSize,
+                                args.iterations, args.seed,
+                                args.levelWeight, args.minQuarters)
+
+    print("Number of tracts clustered: %i" % (summary["tracts"]))
+    for cluster, size in enumerate(summary["clusters"]):
+        print("Cluster %i: %i tracts" % (cluster, size))
+    print("Iterations: %i, inertia: %.6g, k-means time: %.3f s" %
+          (summary["iterations"], summary["inertia"], summary["seconds"]))
+    print(datetime.now() - startTime)
+
+# ####################################################################
+'''
+breaksCommand
+
+This function: the "breaks" command.  Calculates the class breaks of
+the map legends.
+
+Arguments
+---------
+args  : Namespace - Parsed command line arguments
+'''
+
+def breaksCommand(args):
+
+    startTime = datetime.now()
+
+    levels = args.levels.split(",")
+    for level in levels:
+        if level not in ha.levels:
+            raise ValueError("unknown level %s" % (level))
+
+    summary = hb.writeBreaks(args.outdir, levels, args.methods.split(","),
+                             args.classes)
+
+    for level in levels:
+        print("Number of %s class breaks: %i (%.3f s)" %
+              (level, summary[level]["breaks"], summary[level]["seconds"]))
+    print(datetime.now() - startTime)
+
+# ####################################################################
+# main()
+# ####################################################################
+
+def main(argv=None):
+
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # "run" is the default command
+    if not argv or argv[0] not in ("run", "merge", "catalog", "shards",
+                                   "long", "revise", "spatial",
+                                   "hotspots", "geometry", "locate",
+                                   "trend", "forecast", "changes",
+                                   "clusters", "breaks", "-h", "--help"):
+        argv = ["run"] + list(argv)
+
+    parser = argparse.ArgumentParser(
+        description="Summarize HUD vacancy files by nation, state and county")
+    commands = parser.add_subparsers(dest="command")
+
+    run = commands.add_parser("run", help="summarize HUD .dbf files")
+    run.add_argument("--input", default=defaultInput,
+                     help="glob of HUD .dbf files or .zip archives")
+    run.add_argument("--outdir", default=defaultOutdir,
+                     help="directory for the output .csv files")
+    run.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                     help="worker processes per file (1 = serial)")
+    run.add_argument("--shard", default=None,
+                     help="only process shard K/N of the (sorted) files")
+    run.add_argument("--partial", default=None,
+                     help="also write the partial aggregate to this file")
+    run.add_argument("--pipeline", action="store_true",
+                     help="read ahead and write in background threads")
+    run.add_argument("--prefetch", type=int, default=2,
+                     help="files read ahead in pipelined mode")
+    run.add_argument("--metrics", default=None,
+                     help="write per file/stage timings as JSON lines")
+    run.add_argument("--catalog", default=None,
+                     help="catalog manifest (default: catalog.json in "
+                          "the output directory)")
+    run.add_argument("--anomalies", default=None,
+                     help="write the per quarter anomaly reports as "
+                          "JSON lines")
+    run.add_argument("--quarantine", action="store_true",
+                     help="leave records which fail a check out of the "
+                          "summaries (saved in quarantine.csv)")
+    run.add_argument("--compress", default="none",
+                     choices=sorted(ha.compressionExts),
+                     help="compress the output files")
+    run.add_argument("--compressLevel", type=int, default=None,
+                     help="compression level (default: 6 for gzip, 3 for "
+                          "zstd)")
+    run.set_defaults(func=runCommand)
+
+    catalog = commands.add_parser("catalog",
+                                  help="catalog the HUD .dbf headers")
+    catalog.add_argument("--input", default=defaultInput,
+                         help="glob of HUD .dbf files or .zip archives")
+    catalog.add_argument("--outdir", default=defaultOutdir,
+                         help="directory holding catalog.json")
+    catalog.add_argument("--catalog", default=None,
+                         help="catalog manifest (default: catalog.json in "
+                              "the output directory)")
+    catalog.set_defaults(func=catalogCommand)
+
+    merge = commands.add_parser("merge",
+                                help="merge partial aggregates into the "
+                                     "national, state and county files")
+    merge.add_argument("--outdir", default=defaultOutdir,
+                       help="directory for the output .csv files")
+    merge.add_argument("--compress", default="none",
+                       choices=sorted(ha.compressionExts),
+                       help="compress the output files")
+    merge.add_argument("--compressLevel", type=int, default=None,
+                       help="compression level (default: 6 for gzip, 3 "
+                            "for zstd)")
+    merge.add_argument("--tracts", action="append", default=None,
+                       help="tract file of a shard, repeated for each "
+                            "(default: tract_*of*.csv in the output "
+                            "directory)")
+    merge.add_argument("--sketches", action="append", default=None,
+                       help="sketch file of a shard, repeated for each "
+                            "(default: state_sketch_*of*.npz in the "
+                            "output directory)")
+    merge.add_argument("partials", nargs="+",
+                       help="partial aggregate files written by run")
+    merge.set_defaults(func=mergeCommand)
+
+    shards = commands.add_parser("shards",
+                                 help="write a JSON document per GEOID "
+                                      "per level for the dashboard")
+    shards.add_argument("--outdir", default=defaultOutdir,
+                        help="directory holding the output .csv files")
+    shards.add_argument("--shardDir", default=None,
+                        help="directory for the shards (default: shards "
+                             "in the output directory)")
+    shards.add_argument("--levels", default=None,
+                        help="comma separated levels (default: all)")
+    shards.set_defaults(func=shardsCommand)
+
+    long = commands.add_parser("long",
+                               help="write the output files as one long "
+                                    "file with an offset index")
+    long.add_argument("--outdir", default=defaultOutdir,
+                      help="directory holding the output .csv files")
+    long.add_argument("--longFile", default=None,
+                      help="long output file (default: %s in the output "
+                           "directory)" % (hl.defaultLongName))
+    long.set_defaults(func=longCommand)
+
+    revise = commands.add_parser("revise",
+                                 help="patch reissued quarters into the "
+                                      "output files")
+    revise.add_argument("--input", default=defaultInput,
+                        help="glob of HUD .dbf files or .zip archives")
+    revise.add_argument("--outdir", default=defaultOutdir,
+                        help="directory holding the output .csv files")
+    revise.add_argument("--catalog", default=None,
+                        help="catalog manifest (default: catalog.json in "
+                             "the output directory)")
+    revise.add_argument("--quarantine", action="store_true",
+                        help="leave records which fail a check out of the "
+                             "summaries (as in the run)")
+    revise.set_defaults(func=reviseCommand)
+
+    spatial = commands.add_parser("spatial",
+                                  help="Moran's I and LISA of the tract "
+                                       "vacancy rates")
+    spatial.add_argument("--input", default=defaultInput,
+                         help="glob of HUD .dbf files or .zip archives "
+                              "(the shapefile of the latest is used)")
+    spatial.add_argument("--outdir", default=defaultOutdir,
+                         help="directory holding tract.csv")
+    spatial.add_argument("--shapefile", default=None,
+                         help="tract shapefile (.shp) for the weights")
+    spatial.add_argument("--rule", default="queen",
+                         choices=["queen", "rook"],
+                         help="contiguity rule")
+    spatial.add_argument("--alpha", type=float, default=hsp.defaultAlpha,
+                         help="significance level of the LISA clusters")
+    spatial.add_argument("--weightsDir", default=None,
+                         help="directory for the cached weights (default: "
+                              "the output directory)")
+    spatial.set_defaults(func=spatialCommand)
+
+    hotspots = commands.add_parser("hotspots",
+                                   help="Getis-Ord Gi* hot spots of the "
+                                        "tract long term vacancy rates")
+    hotspots.add_argument("--input", default=defaultInput,
+                          help="glob of HUD .dbf files or .zip archives "
+                               "(the shapefile of the latest is used)")
+    hotspots.add_argument("--outdir", default=defaultOutdir,
+                          help="directory holding tract.csv")
+    hotspots.add_argument("--shapefile", default=None,
+                          help="tract shapefile (.shp) for the weights")
+    hotspots.add_argument("--rule", default="queen",
+                          choices=["queen", "rook"],
+                          help="contiguity rule")
+    hotspots.add_argument("--weightsDir", default=None,
+                          help="directory for the cached weights (default: "
+                               "the output directory)")
+    hotspots.set_defaults(func=hotspotsCommand)
+
+    geometry = commands.add_parser("geometry",
+                                   help="simplified GeoJSON and TopoJSON of "
+                                        "the four levels")
+    geometry.add_argument("--input", default=defaultInput,
+                          help="glob of HUD .dbf files or .zip archives "
+                               "(the shapefile of the latest is used)")
+    geometry.add_argument("--outdir", default=defaultOutdir,
+                          help="output directory")
+    geometry.add_argument("--shapefile", default=None,
+                          help="tract shapefile (.shp)")
+    geometry.add_argument("--geoDir", default=None,
+                          help="directory for the geometry (default: "
+                               "geometry in the output directory)")
+    geometry.add_argument("--tolerances",
+                          default=",".join("%g" % t for t in
+                                           hg.defaultTolerances),
+                          help="comma separated simplification tolerances "
+                               "(shapefile units)")
+    geometry.add_argument("--quantize", type=int, default=hg.defaultQuantize,
+                          help="points per side of the TopoJSON grid")
+    geometry.add_argument("--force", action="store_true",
+                          help="write the geometry even if it is up to date")
+    geometry.set_defaults(func=geometryCommand)
+
+    locate = commands.add_parser("locate",
+                                 help="add the tract GEOID to a .csv file "
+                                      "of points")
+    locate.add_argument("--points", required=True,
+                        help=".csv file of points")
+    locate.add_argument("--input", default=defaultInput,
+                        help="glob of HUD .dbf files or .zip archives "
+                             "(the shapefile of the latest is used)")
+    locate.add_argument("--outdir", default=defaultOutdir,
+                        help="directory holding tract.csv")
+    locate.add_argument("--shapefile", default=None,
+                        help="tract shapefile (.shp)")
+    locate.add_argument("--xCol", default="longitude",
+                        help="column of the point longitudes")
+    locate.add_argument("--yCol", default="latitude",
+                        help="column of the point latitudes")
+    locate.add_argument("--locations", default=None,
+                        help="output .csv file "
+                             "(default: <points>_tracts.csv)")
+    locate.add_argument("--history", action="store_true",
+                        help="add the tract rows of every quarter")
+    locate.add_argument("--indexDir", default=None,
+                        help="directory for the saved index (default: the "
+                             "output directory)")
+    locate.set_defaults(func=locateCommand)
+
+    trend = commands.add_parser("trend",
+                                help="vacancy rate trend of every tract")
+    trend.add_argument("--outdir", default=defaultOutdir,
+                       help="directory holding tract.csv")
+    trend.add_argument("--alpha", type=float, default=ht.defaultAlpha,
+                       help="significance level of the rising and falling "
+                            "classes")
+    trend.add_argument("--minQuarters", type=int,
+                       default=ht.defaultMinQuarters,
+                       help="fewest quarters with a rate for a fit")
+    trend.set_defaults(func=trendCommand)
+
+    forecast = commands.add_parser("forecast",
+                                   help="next quarter forecast of every "
+                                        "level")
+    forecast.add_argument("--outdir", default=defaultOutdir,
+                          help="directory holding the output .csv files")
+    forecast.add_argument("--window", type=int, default=hfc.defaultWindow,
+                          help="quarters each series is fit to")
+    forecast.add_argument("--level", type=float, default=hfc.defaultLevel,
+                          help="coverage of the prediction intervals")
+    forecast.add_argument("--backtest", action="store_true",
+                          help="replay the archive and report the errors "
+                               "instead")
+    forecast.add_argument("--minTrain", type=int,
+                          default=hfc.defaultMinTrain,
+                          help="fewest quarters before the first backtest "
+                               "quarter")
+    forecast.set_defaults(func=forecastCommand)
+
+    changes = commands.add_parser("changes",
+                                  help="level shifts of the vacancy rate "
+                                       "series")
+    changes.add_argument("--outdir", default=defaultOutdir,
+                         help="directory holding the output .csv files")
+    changes.add_argument("--levels", default=",".join(hch.defaultLevels),
+                         help="comma separated levels to segment")
+    changes.add_argument("--maxBreaks", type=int,
+                         default=hch.defaultMaxBreaks,
+                         help="most breaks per series")
+    changes.add_argument("--minSize", type=int, default=hch.defaultMinSize,
+                         help="fewest quarters with a rate in a segment")
+    changes.add_argument("--penalty", type=float, default=hch.defaultPenalty,
+                         help="penalty of a break (times the variance and "
+                              "the log of the quarters)")
+    changes.set_defaults(func=changesCommand)
+
+    clusters = commands.add_parser("clusters",
+                                   help="group the tracts by their vacancy "
+                                        "rate trajectories")
+    clusters.add_argument("--outdir", default=defaultOutdir,
+                          help="directory holding tract.csv")
+    clusters.add_argument("--clusters", type=int, default=hcl.defaultClusters,
+                          help="number of clusters")
+    clusters.add_argument("--batchSize", type=int,
+                          default=hcl.defaultBatchSize,
+                          help="tracts per mini-batch")
+    clusters.add_argument("--iterations", type=int,
+                          default=hcl.defaultIterations,
+                          help="most mini-batches")
+    clusters.add_argument("--seed", type=int, default=hcl.defaultSeed,
+                          help="seed of the random numbers")
+    clusters.add_argument("--levelWeight", type=float,
+                          default=hcl.defaultLevelWeight,
+                          help="weight of the vacancy level against the "
+                               "shape (0:  shape only)")
+    clusters.add_argument("--minQuarters", type=int,
+                          default=hcl.defaultMinQuarters,
+                          help="fewest quarters with a rate for a tract")
+    clusters.set_defaults(func=clustersCommand)
+
+    breaks = commands.add_parser("breaks",
+                                 help="class breaks of the map legends")
+    breaks.add_argument("--outdir", default=defaultOutdir,
+                        help="directory holding the output .csv files")
+    breaks.add_argument("--levels", default=",".join(hb.defaultLevels),
+                        help="comma separated levels")
+    breaks.add_argument("--methods", default=",".join(hb.breakMethods),
+                        help="comma separated methods (jenks, quantile, "
+                             "equal)")
+    breaks.add_argument("--classes", type=int, default=hb.defaultClasses,
+                        help="number of classes")
+    breaks.set_defaults(func=breaksCommand)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,664 @@
+# ####################################################################
+#
+# Program:  benchHUD.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This script benchmarks ProcessHUDfilesForVizWithFnV7.py on synthetic
+# HUD files (see hudSynthetic.py) at several multiples of national
+# scale (by default 1x, 10x and 100x, i.e. about 74 thousand, 737
+# thousand and 7.4 million tracts per quarter).
+#
+# For each scale it reports the throughput of the three stages:
+#
+# - ingest     read and decode the .dbf files (records/s, MB/s)
+# - aggregate  the national, state and county summaries (records/s)
+# - export     writing the four .csv files (records/s, MB/s)
+#
+# together with the peak memory of the run.  With --codecs, the output
+# files of each scale are also written again with each compression
+# codec and level (see hudAggregate.openOutput), reporting the output
+# size and the write throughput (MB/s of .csv text) of each.
+#
+# With --hotspots, the Getis-Ord Gi* statistics (see
+# hudSpatial.giStarStats) are benchmarked instead of the pipeline:  for
+# each scale, on a lattice of that many tracts with queen contiguity,
+# for each of the given numbers of quarters, so that the time per
+# quarter shows how the batched calculation scales with the panel.
+# --changes does the same for the change point detection (see
+# hudChange.changePoints), on synthetic rate series of which a third
+# have a level shift, reporting the time per tract and quarter.  A
+# tenth of the series are constant but for a one quarter blip, and the
+# breaks found in them (which should be none) are reported as well.
+# --clusters times the trajectory clustering (see hudCluster.py) the
+# same way, on synthetic tracts of four kinds of trajectory.  These
+# modes share one timing loop and one table printer:  each is an entry
+# of quarterBenches, with a function which makes the data of one
+# number of quarters (see benchQuarters).
+#
+# Each scale runs in a fresh Python process, so that the peak memory
+# belongs to that scale alone.  The synthetic files are kept in the
+# work directory and only written again when they are missing.
+#
+# Results are printed as a table and appended to a JSON lines file so
+# that runs can be compared over time.
+#
+# Usage:
+#
+#   python benchHUD.py [--scales 1,10,100] [--quarters N]
+#                      [--workers N] [--pipeline] [--workdir DIR]
+#                      [--results FILE]
+#                      [--codecs none,gzip:1,gzip:6,zstd:3,...]
+#   python benchHUD.py --hotspots 4,8,16,32,64 [--scales 1,10]
+#                      [--results FILE]
+#   python benchHUD.py --changes 16,32,64 [--scales 1,10]
+#                      [--results FILE]
+#   python benchHUD.py --clusters 16,32,64 [--scales 1,10]
+#                      [--results FILE]
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import tempfile
+from datetime import datetime
+from glob import glob
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+defaultWorkdir = os.path.join(tempfile.gettempdir(), "hudbench")
+defaultResults = "bench_results.jsonl"
+
+# text written per write() call in the codec benchmark
+codecChunk = 1 << 20
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+stageTotals
+
+This function: combines the per-stage summary of a run (see
+hudMetrics.RunMetrics.summary) into the ingest, aggregate and export
+stages reported by the benchmark.
+
+Arguments
+---------
+summary  : dictionary - Summary of the run
+'''
+
+def stageTotals(summary):
+
+    groups = {"ingest": ["read", "decode"],
+              "aggregate": ["aggregate"],
+              "export": [s for s in summary["stages"]
+                         if s.startswith("write.")]}
+    totals = {}
+
+    for group, stages in groups.items():
+        wall = sum(summary["stages"][s]["wall"] for s in stages
+                   if s in summary["stages"])
+        bytesMoved = sum(summary["stages"][s]["bytesRead"] +
+                         summary["stages"][s]["bytesWritten"]
+                         for s in stages if s in summary["stages"])
+        totals[group] = {"wall": wall, "bytes": bytesMoved}
+
+    return totals
+
+# ####################################################################
+'''
+benchScale
+
+This function: runs the benchmark for one scale in this process, and
+returns the result as a dictionary.
+
+Arguments
+---------
+scale     : float - Multiple of national scale
+quarters  : int - Number of quarters
+workers   : int - Worker processes per file
+pipeline  : boolean - Use the pipelined mode
+workdir   : string - Directory for the synthetic and output files
+'''
+
+def benchScale(scale, quarters, workers, pipeline, workdir):
+
+    import hudSynthetic as hs
+    import hudMetrics as hm
+    import ProcessHUDfilesForVizWithFnV7 as v7
+
+    numTracts = int(round(scale * hs.nationalTracts))
+    indir = os.path.join(workdir, "tracts%i_q%i" % (numTracts, quarters))
+    outdir = os.path.join(workdir, "out")
+    for d in [indir, outdir]:
+        if not os.path.isdir(d):
+            os.makedirs(d)
+
+    fileNames = sorted(glob(os.path.join(indir, "*Data.dbf")),
+                       key=v7.sortKey)
+    if len(fileNames) != quarters:
+        fileNames = hs.writeHUDFiles(indir, numTracts, quarters)
+
+    metrics = hm.RunMetrics()
+    numRecords = v7.processFiles(fileNames, outdir, workers,
+                                 pipeline=pipeline, metrics=metrics)
+    summary = metrics.summary()
+
+    records = numRecords["tract"]
+    totals = stageTotals(summary)
+    result = {"date": str(datetime.now()),
+              "scale": scale,
+              "tracts": numTracts,
+              "quarters": quarters,
+              "records": records,
+              "workers": workers,
+              "pipeline": pipeline,
+              "wall": summary["wall"],
+              "peakRSSMB": summary["peakRSSMB"],
+              "stages": summary["stages"]}
+
+    for group, total in totals.items():
+        result[group + "RecordsPerSec"] = (records / total["wall"]
+                                           if total["wall"] > 0 else None)
+        result[group + "MBPerSec"] = (total["bytes"] / 1e6 / total["wall"]
+                                      if total["wall"] > 0 else None)
+
+    return result
+
+# ####################################################################
+'''
+benchCodecs
+
+This function: writes the output files of a run again with each codec
+and returns the output size and write throughput of each.
+
+Arguments
+---------
+outdir   : string - Directory holding the uncompressed output files
+codecs   : list - (codec, level) pairs, level None for the default
+workdir  : string - Directory for the compressed files
+'''
+
+def benchCodecs(outdir, codecs, workdir):
+
+    import time
+    import hudAggregate as ha
+
+    texts = {}
+    for level in ha.levels:
+        with open(ha.levelFile(outdir, level)) as inFile:
+            texts[level] = inFile.read()
+    textBytes = sum(len(text) for text in texts.values())
+
+    codecDir = os.path.join(workdir, "codecs")
+    if not os.path.isdir(codecDir):
+        os.makedirs(codecDir)
+
+    results = []
+    for codec, codecLevel in codecs:
+        outBytes = 0
+        startTime = time.perf_counter()
+        for level, text in texts.items():
+            fileName = ha.levelFile(codecDir, level, codec)
+            outFile = ha.openOutput(fileName, codec, codecLevel)
+            for pos in range(0, len(text), codecChunk):
+                outFile.write(text[pos:pos + codecChunk])
+            outFile.close()
+            outBytes += os.path.getsize(fileName)
+        wall = time.perf_counter() - startTime
+        results.append({"codec": codec,
+                        "level": codecLevel,
+                        "textMB": textBytes / 1e6,
+                        "outputMB": outBytes / 1e6,
+                        "ratio": textBytes / outBytes if outBytes else None,
+                        "wall": wall,
+                        "MBPerSec": textBytes / 1e6 / wall if wall > 0
+                        else None})
+
+    return results
+
+# ####################################################################
+'''
+latticeWeights
+
+This function: returns the queen contiguity of numTracts tracts laid
+out on a square lattice, as row pointers and column indices (as
+hudSpatial.contiguity).
+
+Arguments
+---------
+numTracts  : int - Number of tracts
+'''
+
+def latticeWeights(numTracts):
+
+    import numpy as np
+
+    side = int(np.ceil(np.sqrt(numTracts)))
+    cells = np.arange(numTracts)
+    row, col = divmod(cells, side)
+
+    pairs = []
+    for dr in (-1, 0, 1):
+        for dc in (-1, 0, 1):
+            if dr == 0 and dc == 0:
+                continue
+            r, c = row + dr, col + dc
+            ok = (r >= 0) & (c >= 0) & (c < side) & (r * side + c < numTracts)
+            pairs.append((cells[ok], (r * side + c)[ok]))
+
+    rows = np.concatenate([p[0] for p in pairs])
+    cols = np.concatenate([p[1] for p in pairs])
+    order = np.lexsort((cols, rows))
+    indptr = np.r_[0, np.cumsum(np.bincount(rows, minlength=numTracts))]
+
+    return indptr, cols[order]
+
+# ####################################################################
+'''
+benchQuarters
+
+This function: times one of the quarterBenches at one scale, for each
+number of quarters, and returns the scale, the number of tracts, the
+setup's details and the timings (under the bench's flag).
+
+The bench's case function makes the data of one number of quarters and
+returns the function to time and a function which measures its output
+(given the output and the wall time).
+
+Arguments
+---------
+bench     : dictionary - Entry of quarterBenches
+scale     : float - Multiple of national scale
+quarters  : list - Numbers of quarters
+'''
+
+def benchQuarters(bench, scale, quarters):
+
+    import time
+    import numpy as np
+    import hudSynthetic as hs
+
+    numTracts = int(round(scale * hs.nationalTracts))
+    result = {"scale": scale, "tracts": numTracts}
+    context = None
+    if bench["setup"] is not None:
+        context, details = bench["setup"](numTracts)
+        result.update(details)
+
+    rng = np.random.default_rng(0)
+    timings = []
+    for numQuarters in quarters:
+        run, measure = bench["case"](rng, numTracts, numQuarters, context)
+        startTime = time.perf_counter()
+        output = run()
+        wall = time.perf_counter() - startTime
+        timing = {"quarters": numQuarters, "wall": wall}
+        timing.update(measure(output, wall))
+        timings.append(timing)
+    result[bench["flag"]] = timings
+
+    return result
+
+# ####################################################################
+'''
+hotspotSetup
+
+This function: returns the lattice weights of numTracts tracts for
+the --hotspots mode, and the number of links.
+
+Arguments
+---------
+numTracts  : int - Number of tracts
+'''
+
+def hotspotSetup(numTracts):
+
+    indptr, indices = latticeWeights(numTracts)
+
+    return (indptr, indices), {"links": len(indices)}
+
+# ####################################################################
+'''
+hotspotCase
+
+This function: makes the long term vacancy rates of one number of
+quarters for the --hotspots mode, and returns the batched Gi*
+statistics to time and their measures.
+
+Arguments
+---------
+rng          : Generator - Random numbers
+numTracts    : int - Number of tracts
+numQuarters  : int - Number of quarters
+weights      : tuple - Lattice weights (see hotspotSetup)
+'''
+
+def hotspotCase(rng, numTracts, numQuarters, weights):
+
+    import numpy as np
+    import hudSpatial as hsp
+
+    X = rng.beta(1, 30, (numTracts, numQuarters))
+    X[rng.random(X.shape) < 0.01] = np.nan
+
+    def run():
+        return hsp.hotspotClasses(hsp.giStarStats(weights[0], weights[1],
+                                                  X)["z"])
+
+    def measure(output, wall):
+        return {"msPerQuarter": wall / numQuarters * 1e3,
+                "cellsPerSec": numTracts * numQuarters / wall
+                if wall > 0 else None}
+
+    return run, measure
+
+# ####################################################################
+'''
+changeCase
+
+This function: makes numTracts series of one number of quarters for
+the --changes mode, a third with a shift and every tenth constant with
+a blip of one quarter, and returns the change point detection to time
+and its measures (with the number of breaks found in the blips).
+
+Arguments
+---------
+rng          : Generator - Random numbers
+numTracts    : int - Number of series
+numQuarters  : int - Number of quarters
+context      : None - Unused (no setup)
+'''
+
+def changeCase(rng, numTracts, numQuarters, context):
+
+    import numpy as np
+    import hudChange as hch
+
+    Y = rng.normal(0.05, 0.005, (numTracts, numQuarters))
+    shifted = rng.random(numTracts) < 1 / 3.0
+    at = rng.integers(1, numQuarters, numTracts)
+    Y += shifted[:, None] * (np.arange(numQuarters) >= at[:, None]) * 0.02
+    Y[rng.random(Y.shape) < 0.01] = np.nan
+
+    # constant series with a blip of one quarter
+    blips = np.arange(0, numTracts, 10)
+    Y[blips] = 0.05
+    Y[blips, at[blips]] += 0.0008
+
+    def run():
+        return hch.changePoints(Y)
+
+    def measure(breaks, wall):
+        return {"breaks": len(breaks["series"]),
+                "blipBreaks": int(np.isin(breaks["series"], blips).sum()),
+                "nsPerCell": wall / numTracts / numQuarters * 1e9}
+
+    return run, measure
+
+# ####################################################################
+'''
+clusterCase
+
+This function: makes numTracts tracts of four kinds of trajectory of
+one number of quarters for the --clusters mode, and returns the
+trajectory clustering to time and its measures.
+
+Arguments
+---------
+rng          : Generator - Random numbers
+numTracts    : int - Number of tracts
+numQuarters  : int - Number of quarters
+context      : None - Unused (no setup)
+'''
+
+def clusterCase(rng, numTracts, numQuarters, context):
+
+    import numpy as np
+    import hudCluster as hcl
+
+    # stable, rising, recovering and chronically vacant tracts
+    t = np.arange(numQuarters) / numQuarters
+    curves = np.array([0.03 + 0 * t, 0.03 + 0.05 * t, 0.08 - 0.05 * t,
+                       0.2 + 0 * t])
+    Y = curves[rng.integers(0, 4, numTracts)] + \
+        rng.normal(0, 0.004, (numTracts, numQuarters))
+    Y[rng.random(Y.shape) < 0.01] = np.nan
+
+    def run():
+        X, rows = hcl.trajectoryFeatures(Y)
+        return hcl.miniBatchKMeans(X, 4)
+
+    def measure(output, wall):
+        centers, labels, dist2, iterations = output
+        return {"iterations": iterations, "inertia": float(dist2.sum())}
+
+    return run, measure
+
+# ####################################################################
+# the benchmarks by number of quarters:  command line flag, help, case
+# and setup functions, table title and columns (heading, key, width,
+# format) after the quarters and wall time
+# ####################################################################
+
+quarterBenches = [
+    {"flag": "hotspots",
+     "help": "benchmark the Gi* hot spots instead, for these numbers of "
+             "quarters, e.g. 4,8,16,32,64",
+     "case": hotspotCase,
+     "setup": hotspotSetup,
+     "title": "Gi* hot spots at %(scale)gx (%(tracts)i tracts, "
+              "%(links)i links)",
+     "columns": [("ms/quarter", "msPerQuarter", 14, ".1f"),
+                 ("Cells/s", "cellsPerSec", 16, ".0f")]},
+    {"flag": "changes",
+     "help": "benchmark the change points instead, for these numbers of "
+             "quarters, e.g. 16,32,64",
+     "case": changeCase,
+     "setup": None,
+     "title": "Change points at %(scale)gx (%(tracts)i series)",
+     "columns": [("Breaks", "breaks", 10, "i"),
+                 ("Blip breaks", "blipBreaks", 12, "i"),
+                 ("ns/cell", "nsPerCell", 14, ".1f")]},
+    {"flag": "clusters",
+     "help": "benchmark the trajectory clusters instead, for these "
+             "numbers of quarters, e.g. 16,32,64",
+     "case": clusterCase,
+     "setup": None,
+     "title": "Trajectory clusters at %(scale)gx (%(tracts)i tracts)",
+     "columns": [("Iterations", "iterations", 12, "i"),
+                 ("Inertia", "inertia", 14, ".1f")]},
+]
+
+# ####################################################################
+'''
+parseCodecs
+
+This function: parses a --codecs list such as "none,gzip:6,zstd:3"
+into (codec, level) pairs.
+
+Arguments
+---------
+codecs  : string - Comma separated codec[:level] list
+'''
+
+def parseCodecs(codecs):
+
+    pairs = []
+    for item in codecs.split(","):
+        codec, _, level = item.partition(":")
+        pairs.append((codec, int(level) if level else None))
+
+    return pairs
+
+# ####################################################################
+'''
+printResults
+
+This function: prints a table of benchmark results.
+
+Arguments
+---------
+results  : list - Results from benchScale
+'''
+
+def printResults(results):
+
+    for bench in quarterBenches:
+        if results and bench["flag"] in results[0]:
+            return printQuarterBench(results, bench)
+
+    print(" ")
+    print("%8s %10s %10s %12s %12s %12s %10s %10s" %
+          ("Scale", "Records", "Wall (s)", "Ingest r/s", "Aggr r/s",
+           "Export r/s", "Export MB/s", "Peak MB"))
+
+    def num(x, fmt="%.0f"):
+        return fmt % x if x is not None else "-"
+
+    for r in results:
+        print("%8s %10i %10.2f %12s %12s %12s %10s %10s" %
+              ("%gx" % r["scale"], r["records"], r["wall"],
+               num(r["ingestRecordsPerSec"]),
+               num(r["aggregateRecordsPerSec"]),
+               num(r["exportRecordsPerSec"]),
+               num(r["exportMBPerSec"], "%.1f"),
+               num(r["peakRSSMB"], "%.0f")))
+
+    for r in results:
+        if not r.get("codecs"):
+            continue
+        print(" ")
+        print("Compressed output at %gx (%.1f MB of .csv text)" %
+              (r["scale"], r["codecs"][0]["textMB"]))
+        print("%8s %6s %12s %8s %12s" %
+              ("Codec", "Level", "Output MB", "Ratio", "Write MB/s"))
+        for c in r["codecs"]:
+            print("%8s %6s %12.2f %8s %12s" %
+                  (c["codec"], num(c["level"], "%i"), c["outputMB"],
+                   num(c["ratio"], "%.2f"), num(c["MBPerSec"], "%.1f")))
+
+# ####################################################################
+'''
+printQuarterBench
+
+This function: prints a table of the results of one of the
+quarterBenches, one row per number of quarters ("-" where a measure
+is None).
+
+Arguments
+---------
+results  : list - Results of benchQuarters
+bench    : dictionary - Entry of quarterBenches
+'''
+
+def printQuarterBench(results, bench):
+
+    columns = [("Quarters", "quarters", 10, "i"),
+               ("Wall (s)", "wall", 10, ".3f")] + bench["columns"]
+
+    for r in results:
+        print(" ")
+        print(bench["title"] % r)
+        print(" ".join("%*s" % (width, heading)
+                       for heading, key, width, fmt in columns))
+        for timing in r[bench["flag"]]:
+            print(" ".join("%*s" % (width, "-") if timing[key] is None
+                           else "%*{}".format(fmt) % (width, timing[key])
+                           for heading, key, width, fmt in columns))
+
+# ####################################################################
+# main()
+# ####################################################################
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the HUD pipeline on synthetic data")
+    parser.add_argument("--scales", default="1,10,100",
+                        help="comma separated multiples of national scale")
+    parser.add_argument("--quarters", type=int, default=2,
+                        help="number of quarters at each scale")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes per file")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="use the pipelined mode")
+    parser.add_argument("--workdir", default=defaultWorkdir,
+                        help="directory for the synthetic and output files")
+    parser.add_argument("--results", default=defaultResults,
+                        help="JSON lines file the results are appended to")
+    parser.add_argument("--codecs", default=None,
+                        help="also benchmark the output codecs, e.g. "
+                             "none,gzip:1,gzip:6,gzip:9,zstd:1,zstd:3")
+    for bench in quarterBenches:
+        parser.add_argument("--" + bench["flag"], default=None,
+                            help=bench["help"])
+    parser.add_argument("--one-scale", type=float, default=None,
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # child process:  run one scale and print the result as JSON
+    if args.one_scale is not None:
+        result = benchScale(args.one_scale, args.quarters, args.workers,
+                            args.pipeline, args.workdir)
+        if args.codecs:
+            result["codecs"] = benchCodecs(os.path.join(args.workdir,
+                                                        "out"),
+                                           parseCodecs(args.codecs),
+                                           args.workdir)
+        sys.stdout.flush()
+        print("RESULT " + json.dumps(result))
+        return
+
+    # a benchmark by number of quarters instead of the pipeline
+    quarterBench = None
+    for bench in quarterBenches:
+        if getattr(args, bench["flag"]):
+            quarterBench = bench
+            break
+
+    results = []
+    for scale in [float(s) for s in args.scales.split(",")]:
+        print("Scale %gx ..." % (scale))
+        if quarterBench is not None:
+            quarters = getattr(args, quarterBench["flag"])
+            results.append(benchQuarters(quarterBench, scale,
+                                         [int(q) for q in
+                                          quarters.split(",")]))
+            continue
+        command = [sys.executable, os.path.abspath(__file__),
+                   "--one-scale", str(scale),
+                   "--quarters", str(args.quarters),
+                   "--workers", str(args.workers),
+                   "--workdir", args.workdir]
+        if args.pipeline:
+            command.append("--pipeline")
+        if args.codecs:
+            command += ["--codecs", args.codecs]
+        output = subprocess.check_output(command,
+                                         universal_newlines=True)
+        for line in output.splitlines():
+            if line.startswith("RESULT "):
+                results.append(json.loads(line[len("RESULT "):]))
+
+    printResults(results)
+
+    with open(args.results, "a") as outFile:
+        for result in results:
+            outFile.write(json.dumps(result) + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,461 @@
+# ####################################################################
+#
+# Program:  compareHUDOutputs.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This script checks that a candidate version of the processing
+# script writes the same national, state, county and tract files as
+# the legacy iterrows implementation (ProcessHUDfilesForVizWithFnV6Py36.py),
+# and how much faster it is.
+#
+# Both scripts are run on the same input files, each in its own Python
+# process, and the outputs are compared row by row:
+#
+# - every (Month/Year, GEOID) row must appear exactly once in both
+# - the counts must match exactly
+# - the Average Days Vacant statistic (AVG_VAC_R) must match within a
+#   tolerance, since the candidate may add the values in another order
+#
+# The speedup (legacy wall time / candidate wall time) and the memory
+# ratio (candidate peak / legacy peak) are reported.  Any divergent
+# row is printed and the script exits with status 1.
+#
+# The candidate is started from a small wrapper process, which
+# measures the memory of the candidate together with its worker pool
+# (--workers):  the peak of the summed resident memory of the whole
+# process tree, sampled every sampleInterval seconds with psutil, and
+# at least the largest peak of any one of the processes (RUSAGE_CHILDREN
+# of the wrapper).
+#
+# The legacy script has hard coded Windows paths ('..\\Shapefiles\\'
+# and '..\\HUD\\'); these are pointed at the input and output
+# directories of the comparison, and nothing else is changed.  Note
+# that the legacy script doesn't sort the records, so unsorted input
+# files (e.g. HUD files from 2015 on) give duplicate county and state
+# rows, which are reported as divergent.
+#
+# Without --input, synthetic (sorted) HUD files are generated with
+# hudSynthetic.py.
+#
+# Usage:
+#
+#   python compareHUDOutputs.py [--input GLOB | --tracts N --quarters N]
+#                  [--legacy SCRIPT] [--candidate SCRIPT]
+#                  [--candidate-args "ARGS"] [--avg-tolerance X]
+#                  [--workdir DIR]
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import sys
+import csv
+import json
+import time
+import shlex
+import shutil
+import argparse
+import subprocess
+import tempfile
+from glob import glob
+
+try:
+    import resource     # not available on Windows
+except ImportError:
+    resource = None
+
+try:
+    import psutil       # optional, used for the memory of a process tree
+except ImportError:
+    psutil = None
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+here = os.path.dirname(os.path.abspath(__file__))
+defaultLegacy = os.path.join(here, "ProcessHUDfilesForVizWithFnV6Py36.py")
+defaultCandidate = os.path.join(here, "ProcessHUDfilesForVizWithFnV7.py")
+
+levels = ["national", "state", "county", "tract"]
+
+# the Average Days Vacant column (3rd value column) of the output files
+avgColumn = 4
+
+# seconds between the memory samples of the candidate's process tree
+sampleInterval = 0.05
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+runLegacy
+
+This function: runs the legacy script with its input and output paths
+pointed at indir and outdir.  This is the body of the child process
+started by runTimed.
+
+Arguments
+---------
+script  : string - Legacy script filename
+indir   : string - Directory holding the *Data.dbf files
+outdir  : string - Directory for the output files
+'''
+
+def runLegacy(script, indir, outdir):
+
+    with open(script) as inFile:
+        source = inFile.read()
+
+    source = source.replace("'..\\\\Shapefiles\\\\",
+                            repr(indir + os.sep)[:-1])
+    source = source.replace("'..\\\\HUD\\\\", repr(outdir + os.sep)[:-1])
+
+    # the legacy script writes numpy scalars with the csv module, which
+    # relies on their repr() being a plain number (numpy 2 changed it)
+    try:
+        import numpy
+        if int(numpy.__version__.split(".")[0]) >= 2:
+            numpy.set_printoptions(legacy="1.25")
+    except ImportError:
+        pass
+
+    code = compile(source, script, "exec")
+    exec(code, {"__name__": "__main__", "__file__": script})
+
+# ####################################################################
+'''
+childPeakRSS
+
+This function: returns the peak resident memory (MB) of this process
+and of its finished child processes (e.g. a worker pool).
+'''
+
+def childPeakRSS():
+
+    if resource is None:
+        return None
+
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    if sys.platform == "darwin":
+        return peak / (1024.0 * 1024.0)
+    return peak / 1024.0
+
+# ####################################################################
+'''
+runCandidate
+
+This function: runs the candidate command and returns its exit status
+and the peak memory (MB) of the candidate and its worker processes
+together.  This is the body of the wrapper process started by
+runTimed.
+
+Arguments
+---------
+command  : list - Candidate command line
+'''
+
+def runCandidate(command):
+
+    child = subprocess.Popen(command)
+
+    # the summed memory of the process tree, while it runs
+    peak = 0
+    if psutil is not None:
+        while child.poll() is None:
+            try:
+                tree = psutil.Process(child.pid)
+                processes = [tree] + tree.children(recursive=True)
+            except psutil.Error:
+                break
+            total = 0
+            for process in processes:
+                try:
+                    total += process.memory_info().rss
+                except psutil.Error:
+                    pass
+            peak = max(peak, total)
+            time.sleep(sampleInterval)
+
+    status = child.wait()
+
+    largest = childPeakRSS()
+    peak = max(peak / (1024.0 * 1024.0), largest or 0.0)
+
+    return status, (peak or None)
+
+# ####################################################################
+'''
+runTimed
+
+This function: runs a command in a child process and returns its wall
+time and peak memory.  The child's output is written to logFile, and
+an error is raised if it fails.
+
+Arguments
+---------
+command  : list - Command line
+logFile  : string - File for the child's output
+'''
+
+def runTimed(command, logFile):
+
+    start = time.time()
+    with open(logFile, "w") as log:
+        status = subprocess.call(command, stdout=log,
+                                 stderr=subprocess.STDOUT)
+    wall = time.time() - start
+
+    if status != 0:
+        raise RuntimeError("%s failed (status %i), see %s" %
+                           (" ".join(command), status, logFile))
+
+    peak = None
+    with open(logFile) as log:
+        for line in log:
+            if line.startswith("PEAKRSS "):
+                peak = json.loads(line[len("PEAKRSS "):])
+
+    return wall, peak
+
+# ####################################################################
+'''
+qtrKey
+
+This function: returns a (year, month) key for a Month/Year label, so
+that "3/2008" and "03/2008" compare as the same quarter.
+
+Arguments
+---------
+qtrYear  : string - Month/Year label
+'''
+
+def qtrKey(qtrYear):
+
+    month, year = qtrYear.split("/")
+
+    return (int(year), int(month))
+
+# ####################################################################
+'''
+readOutput
+
+This function: reads one output file and returns its column headings
+and a dictionary of rows keyed by (quarter, GEOID).  Keys that appear
+more than once are returned separately.
+
+Arguments
+---------
+fileName  : string - Output .csv filename
+'''
+
+def readOutput(fileName):
+
+    rows = {}
+    duplicates = []
+
+    with open(fileName) as inFile:
+        reader = csv.reader(inFile)
+        headings = next(reader)
+        for line in reader:
+            key = (qtrKey(line[0]), line[1])
+            if key in rows:
+                duplicates.append(key)
+            rows[key] = [float(x) for x in line[2:]]
+
+    return headings, rows, duplicates
+
+# ####################################################################
+'''
+compareLevel
+
+This function: compares the legacy and candidate files of one level.
+Returns a dictionary with the number of rows, the maximum differences
+and a list of divergent rows (as printable strings).
+
+Arguments
+---------
+legacyFile     : string - Legacy output filename
+candidateFile  : string - Candidate output filename
+avgTolerance   : float - Relative tolerance for AVG_VAC_R
+'''
+
+def compareLevel(legacyFile, candidateFile, avgTolerance):
+
+    legacyHeadings, legacy, legacyDups = readOutput(legacyFile)
+    candHeadings, candidate, candDups = readOutput(candidateFile)
+
+    divergent = []
+    if len(legacyHeadings) != len(candHeadings):
+        divergent.append("column count %i != %i" %
+                         (len(legacyHeadings), len(candHeadings)))
+
+    for key in legacyDups:
+        divergent.append("%s: duplicate row in legacy output" % (key,))
+    for key in candDups:
+        divergent.append("%s: duplicate row in candidate output" % (key,))
+    for key in sorted(set(legacy) - set(candidate)):
+        divergent.append("%s: missing from candidate output" % (key,))
+    for key in sorted(set(candidate) - set(legacy)):
+        divergent.append("%s: not in legacy output" % (key,))
+
+    maxCountDiff = 0.0
+    maxAvgDiff = 0.0
+    for key in sorted(set(legacy) & set(candidate)):
+        a = legacy[key]
+        b = candidate[key]
+        for i, (x, y) in enumerate(zip(a, b)):
+            diff = abs(x - y)
+            if i + 2 == avgColumn:
+                maxAvgDiff = max(maxAvgDiff, diff)
+                ok = diff <= avgTolerance * max(abs(x), abs(y), 1.0)
+            else:
+                maxCountDiff = max(maxCountDiff, diff)
+                ok = diff == 0.0
+            if not ok:
+                divergent.append("%s: %s legacy %r candidate %r" %
+                                 (key, legacyHeadings[i + 2], x, y))
+
+    return {"rows": len(legacy),
+            "maxCountDiff": maxCountDiff,
+            "maxAvgDiff": maxAvgDiff,
+            "divergent": divergent}
+
+# ####################################################################
+# main()
+# ####################################################################
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Compare a candidate HUD processing script with the "
+                    "legacy iterrows implementation")
+    parser.add_argument("--input", default=None,
+                        help="glob of HUD .dbf files (default: synthetic)")
+    parser.add_argument("--tracts", type=int, default=None,
+                        help="tracts per synthetic file (default: national)")
+    parser.add_argument("--quarters", type=int, default=2,
+                        help="number of synthetic quarters")
+    parser.add_argument("--legacy", default=defaultLegacy,
+                        help="legacy script")
+    parser.add_argument("--candidate", default=defaultCandidate,
+                        help="candidate script")
+    parser.add_argument("--candidate-args", default="",
+                        help="extra arguments for the candidate script")
+    parser.add_argument("--avg-tolerance", type=float, default=1e-9,
+                        help="relative tolerance for AVG_VAC_R")
+    parser.add_argument("--workdir", default=None,
+                        help="directory for the outputs (default: temporary)")
+    parser.add_argument("--max-report", type=int, default=20,
+                        help="divergent rows printed per level")
+    parser.add_argument("--run-legacy", nargs=3, default=None,
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--run-candidate", default=None,
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # wrapper process:  run the candidate and report its memory
+    if args.run_candidate is not None:
+        status, peak = runCandidate(json.loads(args.run_candidate))
+        sys.stdout.flush()
+        print("PEAKRSS " + json.dumps(peak))
+        sys.exit(status)
+
+    # child process:  run the legacy script and report its memory
+    if args.run_legacy is not None:
+        try:
+            runLegacy(*args.run_legacy)
+        finally:
+            sys.stdout.flush()
+            print("PEAKRSS " + json.dumps(childPeakRSS()))
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="hudcompare")
+    indir = os.path.join(workdir, "Shapefiles")
+    legacyOut = os.path.join(workdir, "legacy")
+    candidateOut = os.path.join(workdir, "candidate")
+    for d in [indir, legacyOut, candidateOut]:
+        if not os.path.isdir(d):
+            os.makedirs(d)
+
+    # both scripts read the same copies of the input files
+    if args.input is None:
+        import hudSynthetic as hs
+        hs.writeHUDFiles(indir, args.tracts or hs.nationalTracts,
+                         args.quarters)
+    else:
+        for fileName in glob(args.input):
+            shutil.copy(fileName, indir)
+
+    legacyWall, legacyPeak = runTimed(
+        [sys.executable, os.path.abspath(__file__), "--run-legacy",
+         os.path.abspath(args.legacy), indir, legacyOut],
+        os.path.join(workdir, "legacy.log"))
+
+    # the wrapper reports the memory of the candidate and its workers
+    candidateCommand = [sys.executable, os.path.abspath(args.candidate),
+                        "--input", os.path.join(indir, "*Data.dbf"),
+                        "--outdir", candidateOut,
+                        "--metrics", os.path.join(workdir,
+                                                  "candidate.jsonl")]
+    candidateCommand += shlex.split(args.candidate_args)
+    candidateWall, candidatePeak = runTimed(
+        [sys.executable, os.path.abspath(__file__), "--run-candidate",
+         json.dumps(candidateCommand)],
+        os.path.join(workdir, "candidate.log"))
+
+    # compare the outputs, level by level
+    failed = False
+    print(" ")
+    print("%-10s %10s %14s %14s %10s" %
+          ("Level", "Rows", "Max count diff", "Max avg diff", "Divergent"))
+    reports = {}
+    for level in levels:
+        report = compareLevel(os.path.join(legacyOut, level + ".csv"),
+                              os.path.join(candidateOut, level + ".csv"),
+                              args.avg_tolerance)
+        reports[level] = report
+        failed = failed or bool(report["divergent"])
+        print("%-10s %10i %14g %14g %10i" %
+              (level, report["rows"], report["maxCountDiff"],
+               report["maxAvgDiff"], len(report["divergent"])))
+
+    for level in levels:
+        divergent = reports[level]["divergent"]
+        if divergent:
+            print(" ")
+            print("DIVERGENT ROWS in %s.csv:" % (level))
+            for line in divergent[:args.max_report]:
+                print("  " + line)
+            if len(divergent) > args.max_report:
+                print("  ... and %i more" %
+                      (len(divergent) - args.max_report))
+
+    print(" ")
+    print("Legacy wall time:    %.2f s" % (legacyWall))
+    print("Candidate wall time: %.2f s" % (candidateWall))
+    print("Speedup:             %.2fx" % (legacyWall / candidateWall))
+    if legacyPeak and candidatePeak:
+        print("Peak memory:         %.0f MB legacy, %.0f MB candidate "
+              "(ratio %.2f)" % (legacyPeak, candidatePeak,
+                                candidatePeak / legacyPeak))
+    print("Outputs in %s" % (workdir))
+
+    if failed:
+        print(" ")
+        print("FAILED:  the candidate output differs from the legacy output")
+        sys.exit(1)
+
+    print("OK:  the candidate output matches the legacy output")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,836 @@
+# ####################################################################
+#
+# Program:  hudAggregate.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module holds the aggregation logic used by
+# ProcessHUDfilesForVizWithFnV7.py.  It produces the same national,
+# state, county and tract records as the iterrows loop in
+# ProcessHUDfilesForVizWithFnV6Py36.py, but each quarter is split by
+# state FIPS prefix so that the states can be summarized (and their
+# output rows formatted) in parallel by a pool of worker processes.
+#
+# The partial results coming back from the workers are merged in
+# GEOID order, so the output files are identical to a serial run.
+#
+# The county level sums can also be kept as a "partial aggregate"
+# (see countyPartial).  Partials for different quarters or machines
+# are merged by simple addition, and then reduced to the national,
+# state and county files.  The tract files of a run split into shards
+# (tract_KofN.csv) hold different quarters, and are interleaved by
+# quarter into tract.csv (see mergeTractFiles).
+#
+# The output files can be compressed with gzip or zstd (see
+# openWriter).  The text is compressed as it is written, so nothing
+# but the current chunk is held in memory.  zstd needs the optional
+# zstandard package.  Writing a level removes its files of the other
+# codecs (see removeSiblings), so a directory never holds two versions
+# of a level and readers can't pick up a stale one.
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import csv              # for writing .csv files
+import io               # for formatting rows in the workers
+import os
+import gzip
+import heapq
+import time
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+from dbfread import DBF
+import hudCatalog as hc
+
+try:
+    import zstandard    # optional, for zstd compressed output
+except ImportError:
+    zstandard = None
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# columns we keep from every HUD file (after converting to uppercase)
+colsList = ["GEOID",
+            "AMS_RES",
+            "RES_VAC",
+            "AVG_VAC_R",
+            "VAC_3_RES",
+            "VAC_3_6_R",
+            "VAC_6_12R",
+            "VAC_12_24R",
+            "VAC_24_36R",
+            "VAC_36_RES"]
+
+# the numeric columns, in output order
+valueCols = colsList[1:]
+
+# keep record layouts consistent across all levels
+colHeadings = ['Month/Year',
+                'GEOID',
+                'totalAMS_RES',
+                'totalRES_VAC',
+                'totalAVG_VAC_R',
+                'totalVAC_3_RES',
+                'totalVAC_3_6_R',
+                'totalVAC_6_12R',
+                'totalVAC_12_24R',
+                'totalVAC_24_36R',
+                'totalVAC_36_RES']
+
+# an "invented" geoid for the USA
+nationalGEOID = "01"
+
+# the four output levels, in the order they are written
+levels = ["national", "state", "county", "tract"]
+
+# layout of a partial aggregate (AVG_VAC_R holds a sum, see countyPartial)
+partialHeadings = ['Month/Year', 'GEOID'] + valueCols + ['COUNT']
+
+# output compression:  filename extension of each codec
+compressionExts = {"none": ".csv",
+                   "gzip": ".csv.gz",
+                   "zstd": ".csv.zst"}
+
+# default compression level of each codec
+defaultLevels = {"gzip": 6, "zstd": 3}
+
+# the tract file of shard K of N of a run, and the files of all shards
+shardLevel = "tract_%iof%i"
+shardGlob = "tract_*of*.csv*"
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+dbf2DF
+
+This function: accepts and opens a DBF file, converts it to a Pandas
+data frame, makes the column headings uppercase and keeps only the
+selected columns.  The data frame is sorted by GEOID (some of the
+newer HUD files aren't sorted) and the counts are stored as floats.
+
+Arguments
+---------
+dbfile  : string - Filename to be imported
+mycols  : list - List of columns to keep (uppercase)
+'''
+
+def dbf2DF(dbfile, mycols=colsList):
+
+    return projectDF(readDBF(dbfile), mycols)
+
+# ####################################################################
+'''
+readDBF
+
+This function: accepts and opens a DBF file (or the *Data.dbf member
+of a zip archive, see hudCatalog.openInput), and returns all of its
+records as a Pandas data frame, with the original column headings.
+
+Arguments
+---------
+dbfile  : string - Filename to be imported
+'''
+
+def readDBF(dbfile):
+
+    # zip archives are read as a stream, without extracting them
+    if hc.isZip(dbfile):
+        inFile = hc.openInput(dbfile)
+        try:
+            return readDBFStream(inFile)
+        finally:
+            inFile.close()
+            inFile.archive.close()
+
+    # dbfread to open DBF file
+    db = DBF(dbfile)
+
+    # Convert to Pandas DF
+    return pd.DataFrame(iter(db))
+
+# ####################################################################
+'''
+readDBFStream
+
+This function: reads a DBF file from a binary stream (e.g. a member of
+a zip archive, which dbfread can't open) and returns all of its
+records as a Pandas data frame, with the original column headings.
+
+The records are decoded with numpy, one field at a time.  As with
+dbfread, character fields have trailing blanks removed, blank numeric
+fields are missing values, and deleted records are skipped.  Numeric
+fields are returned as floats.
+
+Arguments
+---------
+inFile  : file - Binary stream positioned at the start of the file
+'''
+
+def readDBFStream(inFile):
+
+    header = hc.parseHeader(inFile)
+    recordLen = header["recordLen"]
+
+    # a stream may return less than asked for, so read until done
+    size = header["numRecords"] * recordLen
+    chunks = []
+    while size > 0:
+        chunk = inFile.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    data = b"".join(chunks)
+
+    numRecords = len(data) // recordLen
+    records = np.frombuffer(data[:numRecords * recordLen],
+                            dtype=np.uint8).reshape(numRecords, recordLen)
+    records = records[records[:, 0] != ord("*")]
+
+    columns = {}
+    pos = 1
+    for name, fieldType, length, decimals in header["fields"]:
+        raw = np.ascontiguousarray(records[:, pos:pos + length])
+        strings = raw.view("S%i" % (length)).ravel()
+        if fieldType in "NF":
+            strings = np.char.strip(strings)
+            strings[strings == b""] = b"nan"
+            columns[name] = strings.astype(float)
+        else:
+            columns[name] = [value.rstrip(b"\0 ").decode("latin-1")
+                             for value in strings.tolist()]
+        pos += length
+
+    return pd.DataFrame(columns,
+                        columns=[field[0] for field in header["fields"]])
+
+# ####################################################################
+'''
+projectDF
+
+This function: accepts a raw HUD data frame (with either uppercase
+or lowercase headings), and returns a data frame of the selected
+columns, with uppercase headings, string GEOIDs and float counts,
+sorted by GEOID.
+
+Arguments
+---------
+pandasDF  : data frame - Records as read from the .dbf file
+mycols    : list - List of columns to keep (uppercase)
+'''
+
+def projectDF(pandasDF, mycols=colsList):
+
+    # Make columns all uppercase
+    pandasDF.columns = [str(c).upper() for c in pandasDF.columns]
+    pandasDF = pandasDF[mycols].copy()
+
+    pandasDF["GEOID"] = pandasDF["GEOID"].astype(str)
+    for col in mycols:
+        if col != "GEOID":
+            pandasDF[col] = pandasDF[col].astype(float)
+
+    # sort the data frame (because some of the newer HUD files aren't sorted)
+    pandasDF = pandasDF.sort_values("GEOID", kind='mergesort')
+    return pandasDF.reset_index(drop=True)
+
+# ####################################################################
+'''
+levelFile
+
+This function: returns the output filename of a level, e.g.
+county.csv, or county.csv.gz with gzip compression.  With compression
+None, returns the first of the level's files (uncompressed, gzip,
+zstd) found in outdir.
+
+Arguments
+---------
+outdir       : string - Output directory
+level        : string - national, state, county or tract
+compression  : string - "none", "gzip", "zstd" or None
+'''
+
+def levelFile(outdir, level, compression="none"):
+
+    if compression is None:
+        for ext in [compressionExts[c] for c in ["none", "gzip", "zstd"]]:
+            if os.path.exists(os.path.join(outdir, level + ext)):
+                return os.path.join(outdir, level + ext)
+        compression = "none"
+
+    return os.path.join(outdir, level + compressionExts[compression])
+
+# ####################################################################
+'''
+removeSiblings
+
+This function: removes the files of a level written with the other
+codecs from outdir, e.g. county.csv when county.csv.gz is written, so
+that levelFile(outdir, level, None) finds the new file.
+
+Arguments
+---------
+outdir       : string - Output directory
+level        : string - national, state, county or tract
+compression  : string - The codec being written
+'''
+
+def removeSiblings(outdir, level, compression="none"):
+
+    for codec in compressionExts:
+        if codec != compression:
+            fileName = levelFile(outdir, level, codec)
+            if os.path.exists(fileName):
+                os.remove(fileName)
+
+# ####################################################################
+'''
+openOutput
+
+This function: opens an output file for writing text, compressing it
+as it is written when compression is "gzip" or "zstd".
+
+Arguments
+---------
+fileName      : string - Output filename
+compression   : string - "none", "gzip" or "zstd"
+compressLevel : int - Compression level (None for the codec default)
+'''
+
+def openOutput(fileName, compression="none", compressLevel=None):
+
+    if compression not in compressionExts:
+        raise ValueError("unknown compression: %s" % (compression))
+
+    if compression == "none":
+        return open(fileName, "w")
+
+    if compressLevel is None:
+        compressLevel = defaultLevels[compression]
+
+    if compression == "gzip":
+        return gzip.open(fileName, "wt", compresslevel=compressLevel)
+
+    if zstandard is None:
+        raise ValueError("zstd compression needs the zstandard package")
+    rawFile = open(fileName, "wb")
+    compressor = zstandard.ZstdCompressor(level=compressLevel)
+    writer = compressor.stream_writer(rawFile)
+
+    return io.TextIOWrapper(writer)
+
+# ####################################################################
+'''
+compressionOf
+
+This function: returns the compression of an output file ("none",
+"gzip" or "zstd"), from its filename extension.
+
+Arguments
+---------
+fileName  : string - Output filename
+'''
+
+def compressionOf(fileName):
+
+    for compression in ["gzip", "zstd"]:
+        if fileName.endswith(compressionExts[compression]):
+            return compression
+
+    return "none"
+
+# ####################################################################
+'''
+openText
+
+This function: opens an output file (compressed or not) for reading
+text.
+
+Arguments
+---------
+fileName  : string - Output filename
+'''
+
+def openText(fileName):
+
+    compression = compressionOf(fileName)
+
+    if compression == "gzip":
+        return gzip.open(fileName, "rt")
+
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("reading %s needs the zstandard package" %
+                             (fileName))
+        rawFile = open(fileName, "rb")
+        return io.TextIOWrapper(
+            zstandard.ZstdDecompressor().stream_reader(rawFile))
+
+    return open(fileName)
+
+# ####################################################################
+'''
+openWriter
+
+This function: opens an output .csv file, writes the column headings
+and returns the open file together with its csv writer.  All of the
+output files share the same dialect.
+
+Arguments
+---------
+fileName      : string - Output filename
+compression   : string - "none", "gzip" or "zstd"
+compressLevel : int - Compression level (None for the codec default)
+'''
+
+def openWriter(fileName, compression="none", compressLevel=None):
+
+    outFile = openOutput(fileName, compression, compressLevel)
+    outWriter = newWriter(outFile)
+    outWriter.writerow(colHeadings)
+
+    return outFile, outWriter
+
+# ####################################################################
+'''
+newWriter
+
+This function: returns a csv writer with the dialect used by every
+output file.
+
+Arguments
+---------
+outFile  : file - Open file (or StringIO) to write to
+'''
+
+def newWriter(outFile):
+
+    return csv.writer(outFile, delimiter=',',
+                        lineterminator='\n',
+                        quotechar='"',
+                        quoting=csv.QUOTE_NONNUMERIC)
+
+# ####################################################################
+'''
+formatRows
+
+This function: formats a list of output records as .csv text so that
+the text can be built in a worker process and simply copied into the
+output file by the parent.
+
+Arguments
+---------
+rows  : list - Output records (lists)
+'''
+
+def formatRows(rows):
+
+    buf = io.StringIO()
+    newWriter(buf).writerows(rows)
+
+    return buf.getvalue()
+
+# ####################################################################
+'''
+countyPartial
+
+This function: sums the value columns of one state's records by
+county and returns the partial aggregate for those counties.
+
+A partial aggregate is a data frame with one row per Month/Year and
+GEOID, holding the sums of every value column and the number of tract
+records (COUNT).  The AVG_VAC_R column holds the sum of the Average
+Days Vacant statistic, not the mean, so that partials can be added
+together in any order and any grouping (see mergePartials).
+
+Arguments
+---------
+qtrYear  : string - Month/Year label for this file
+stateDF  : data frame - Records for one state (sorted by GEOID)
+'''
+
+def countyPartial(qtrYear, stateDF):
+
+    grouped = stateDF[valueCols].groupby(stateDF["GEOID"].str[0:5],
+                                         sort=True)
+    partial = grouped.sum()
+    partial["COUNT"] = grouped.size()
+    partial.index.name = "GEOID"
+    partial = partial.reset_index()
+    partial.insert(0, "Month/Year", qtrYear)
+
+    return partial[partialHeadings]
+
+# ####################################################################
+'''
+qtrSortKey
+
+This function: returns a (year, month) key for a Month/Year label so
+that quarters sort in date order.
+
+Arguments
+---------
+qtrYear  : string - Month/Year label (e.g. "3/2008" or "03/2008")
+'''
+
+def qtrSortKey(qtrYear):
+
+    month, year = str(qtrYear).split("/")
+
+    return (int(year), int(month))
+
+# ####################################################################
+'''
+sortPartial
+
+This function: sorts a partial aggregate by quarter (in date order)
+and then by GEOID.
+
+Arguments
+---------
+partial  : data frame - Partial aggregate
+'''
+
+def sortPartial(partial):
+
+    keys = [qtrSortKey(q) + (g,) for q, g in zip(partial["Month/Year"],
+                                                  partial["GEOID"])]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+
+    return partial.iloc[order].reset_index(drop=True)
+
+# ####################################################################
+'''
+mergePartials
+
+This function: merges any number of partial aggregates into one, by
+adding the sums and counts of matching Month/Year and GEOID rows.
+The merge is associative and commutative, so partials computed for
+different quarters, states or machines can be combined in any order.
+
+Arguments
+---------
+partials  : list - Partial aggregates (data frames)
+'''
+
+def mergePartials(partials):
+
+    merged = pd.concat(list(partials), ignore_index=True)
+    merged = merged.groupby(["Month/Year", "GEOID"], sort=False)[
+        valueCols + ["COUNT"]].sum().reset_index()
+
+    return sortPartial(merged[partialHeadings])
+
+# ####################################################################
+'''
+partialRows
+
+This function: reduces a (sorted) partial aggregate to the output
+records of one level:  county, state or national.  The Average Days
+Vacant statistic is the mean over the tract records in each group,
+as in the original script.
+
+Arguments
+---------
+partial  : data frame - Partial aggregate (county GEOIDs)
+level    : string - "county", "state" or "national"
+'''
+
+def partialRows(partial, level):
+
+    if level == "state":
+        keys = partial["GEOID"].str[0:2]
+    elif level == "national":
+        keys = pd.Series(nationalGEOID, index=partial.index)
+    else:
+        keys = partial["GEOID"]
+
+    grouped = partial.groupby([partial["Month/Year"], keys], sort=False)
+    sums = grouped[valueCols + ["COUNT"]].sum()
+    sums["AVG_VAC_R"] = sums["AVG_VAC_R"] / sums["COUNT"]
+
+    return [[qtrYear, str(geoid)] + vals
+            for (qtrYear, geoid), vals in zip(sums.index,
+                                              sums[valueCols].values.tolist())]
+
+# ####################################################################
+'''
+writePartial
+
+This function: writes a partial aggregate to a .csv file (compressed
+if the filename ends in .gz).
+
+Arguments
+---------
+partial   : data frame - Partial aggregate
+fileName  : string - Output filename
+'''
+
+def writePartial(partial, fileName):
+
+    partial.to_csv(fileName, index=False, columns=partialHeadings)
+
+# ####################################################################
+'''
+readPartial
+
+This function: reads a partial aggregate written by writePartial.
+
+Arguments
+---------
+fileName  : string - Partial aggregate filename
+'''
+
+def readPartial(fileName):
+
+    partial = pd.read_csv(fileName,
+                          dtype={"Month/Year": str, "GEOID": str},
+                          float_precision="round_trip")
+
+    return partial[partialHeadings]
+
+# ####################################################################
+'''
+writeSummaries
+
+This function: reduces a partial aggregate to the national, state and
+county files in outdir.  Returns the number of records written to
+each level.
+
+Arguments
+---------
+partial       : data frame - Partial aggregate
+outdir        : string - Output directory
+compression   : string - "none", "gzip" or "zstd"
+compressLevel : int - Compression level (None for the codec default)
+'''
+
+def writeSummaries(partial, outdir, compression="none", compressLevel=None):
+
+    partial = sortPartial(partial)
+    numRecords = {}
+
+    for level in ["national", "state", "county"]:
+        removeSiblings(outdir, level, compression)
+        outFile, outWriter = openWriter(levelFile(outdir, level, compression),
+                                        compression, compressLevel)
+        rows = partialRows(partial, level)
+        outWriter.writerows(rows)
+        outFile.close()
+        numRecords[level] = len(rows)
+
+    return numRecords
+
+# ####################################################################
+'''
+quarterBlocks
+
+This function: reads a tract file (compressed or not) and yields the
+lines of each quarter as (sort key, Month/Year, lines), in the order
+of the file.
+
+Arguments
+---------
+fileName  : string - Tract .csv file
+'''
+
+def quarterBlocks(fileName):
+
+    inFile = openText(fileName)
+    try:
+        inFile.readline()
+        label, lines = None, []
+        for line in inFile:
+            lineLabel = line[:line.index(",")].strip('"')
+            if lineLabel != label:
+                if lines:
+                    yield qtrSortKey(label), label, lines
+                label, lines = lineLabel, []
+            lines.append(line)
+        if lines:
+            yield qtrSortKey(label), label, lines
+    finally:
+        inFile.close()
+
+# ####################################################################
+'''
+mergeTractFiles
+
+This function: writes the tract file of outdir from the tract files of
+the shards of a run (see shardLevel), interleaving their quarters in
+date order.  Only one quarter is held in memory at a time, and the
+tract file is only replaced when all of it is written.  Returns the
+number of records written.
+
+Arguments
+---------
+fileNames     : list - Tract files of the shards
+outdir        : string - Output directory
+compression   : string - "none", "gzip" or "zstd"
+compressLevel : int - Compression level (None for the codec default)
+'''
+
+def mergeTractFiles(fileNames, outdir, compression="none",
+                    compressLevel=None):
+
+    fileName = levelFile(outdir, "tract", compression)
+    tmpName = fileName + ".tmp"
+    outFile, _ = openWriter(tmpName, compression, compressLevel)
+
+    numRecords = 0
+    previous = None
+    try:
+        for key, label, lines in heapq.merge(
+                *[quarterBlocks(f) for f in fileNames],
+                key=lambda block: block[0]):
+            if key == previous:
+                raise ValueError("%s is in more than one tract file" %
+                                 (label))
+            previous = key
+            outFile.writelines(lines)
+            numRecords += len(lines)
+    except Exception:
+        outFile.close()
+        os.remove(tmpName)
+        raise
+    outFile.close()
+
+    removeSiblings(outdir, "tract", compression)
+    os.replace(tmpName, fileName)
+
+    return numRecords
+
+# ####################################################################
+'''
+aggregateState
+
+This function: summarizes the records of one state for one file.  It
+is run by the worker processes, so the tract, county and state
+records it returns are already formatted as .csv text.
+
+Returns a dictionary with the state FIPS code, the tract, county and
+state .csv text, the county partial aggregate (which is used for the
+national level) and the CPU time it took in its process.
+
+Arguments
+---------
+task  : tuple - (qtrYear, stateFIPS, stateDF)
+'''
+
+def aggregateState(task):
+
+    startCPU = time.process_time()
+    qtrYear, stateFIPS, stateDF = task
+
+    tractRows = [[qtrYear, geoid] + vals
+                 for geoid, vals in zip(stateDF["GEOID"].tolist(),
+                                        stateDF[valueCols].values.tolist())]
+
+    partial = countyPartial(qtrYear, stateDF)
+
+    return {"state": stateFIPS,
+            "tract": formatRows(tractRows),
+            "county": formatRows(partialRows(partial, "county")),
+            "stateRow": formatRows(partialRows(partial, "state")),
+            "partial": partial,
+            "count": len(stateDF),
+            "cpu": time.process_time() - startCPU}
+
+# ####################################################################
+'''
+partitionByState
+
+This function: splits a (GEOID sorted) data frame by state FIPS
+prefix and returns a list of worker tasks, in GEOID order.
+
+Arguments
+---------
+pandasDF  : data frame - Records for one file
+qtrYear   : string - Month/Year label for this file
+'''
+
+def partitionByState(pandasDF, qtrYear):
+
+    stateKeys = pandasDF["GEOID"].str[0:2]
+
+    return [(qtrYear, str(stateFIPS), stateDF)
+            for stateFIPS, stateDF in pandasDF.groupby(stateKeys, sort=True)]
+
+# ####################################################################
+'''
+newPool
+
+This function: returns a worker pool for aggregateFile, or None when
+the work should be done in this process.
+
+Arguments
+---------
+workers  : int - Number of worker processes
+'''
+
+def newPool(workers):
+
+    if workers is None or workers <= 1:
+        return None
+
+    return Pool(workers)
+
+# ####################################################################
+'''
+aggregateFile
+
+This function: summarizes one file.  The records are partitioned by
+state, the states are summarized by the pool (or in this process if
+pool is None) and the results are merged in GEOID order.
+
+Returns a dictionary of .csv text for each of the four levels, the
+county partial aggregate for the file, the number of records written
+to each level, and the CPU time of the pool's worker processes (0
+without a pool, when the work is done in this process).
+
+Arguments
+---------
+pandasDF  : data frame - Records for one file (sorted by GEOID)
+qtrYear   : string - Month/Year label for this file
+pool      : Pool - Worker pool (or None)
+'''
+
+def aggregateFile(pandasDF, qtrYear, pool=None):
+
+    tasks = partitionByState(pandasDF, qtrYear)
+
+    if pool is None:
+        results = [aggregateState(task) for task in tasks]
+    else:
+        results = pool.map(aggregateState, tasks)
+
+    # the national totals come from the county partial aggregates
+    if results:
+        partial = pd.concat([result["partial"] for result in results],
+                            ignore_index=True)
+    else:
+        partial = pd.DataFrame(columns=partialHeadings)
+
+    natlRows = partialRows(partial, "national")
+
+    return {"national": formatRows(natlRows),
+            "state": "".join(result["stateRow"] for result in results),
+            "county": "".join(result["county"] for result in results),
+            "tract": "".join(result["tract"] for result in results),
+            "partial": partial,
+            "counts": {"national": len(natlRows),
+                       "state": len(results),
+                       "county": len(partial),
+                       "tract": sum(result["count"] for result in results)},
+            "workerCPU": sum(result["cpu"] for result in results)
+            if pool is not None else 0.0}
@@ -0,0 +1,335 @@
+# ####################################################################
+#
+# Program:  hudBreaks.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module calculates the class breaks of the map legends:  Jenks
+# natural breaks, quantiles and equal intervals of every metric the
+# dashboard maps (the vacancy rate, the shares of the vacant addresses
+# by how long they have been vacant, the average days vacant and the
+# addresses), for every level and every quarter, plus one set over all
+# the quarters together, so the legend can stay the same when the map
+# steps through time.
+#
+# Each level is read once.  For every quarter the values of a metric
+# are sorted once, and all three methods work from the sorted values:
+#
+# - equal intervals split the range into classes of equal width
+# - quantiles put about the same number of values in every class
+# - Jenks natural breaks minimize the sum of squared deviations from
+#   the class means.  Naively this is quadratic in the number of values
+#   (73,000 tracts).  It is solved exactly by dynamic programming over
+#   the distinct values (every distinct value is one block, with its
+#   count, sum and sum of squares), with the cost of a class from
+#   prefix sums and one array minimum per class.  When there are more
+#   than jenksBins distinct values, neighboring values are first pooled
+#   into jenksBins blocks of about equal count, and the breaks can only
+#   fall between blocks:  the result is then optimal up to that
+#   resolution (a block holds about 0.1% of the values).
+#
+# A value v is in class c when lower < v <= upper (the first class also
+# holds its lower bound).  Each class is written with its bounds and
+# number of values, and every set of breaks with its goodness of
+# variance fit (1 - within class / total sum of squares).  A metric's
+# value is left out where its denominator is 0.
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import time
+import numpy as np
+import hudAggregate as ha
+import hudQuery as hq
+import hudCatalog as hc
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# the mapped metrics (named as in the dashboard):  name, numerator,
+# denominator (None:  the column itself)
+mapMetrics = [("RES_VACpc", "RES_VAC", "AMS_RES"),
+              ("VAC_3_RESpc", "VAC_3_RES", "RES_VAC"),
+              ("VAC_3_6_RESpc", "VAC_3_6_R", "RES_VAC"),
+              ("VAC_6_12_RESpc", "VAC_6_12R", "RES_VAC"),
+              ("VAC_12_24_RESpc", "VAC_12_24R", "RES_VAC"),
+              ("VAC_24_36_RESpc", "VAC_24_36R", "RES_VAC"),
+              ("VAC_36_RESpc", "VAC_36_RES", "RES_VAC"),
+              ("AVG_DAYS_VAC", "AVG_VAC_R", None),
+              ("AMS_RES", "AMS_RES", None)]
+
+breakMethods = ["jenks", "quantile", "equal"]
+
+defaultClasses = 5
+defaultLevels = ["state", "county", "tract"]
+
+# most blocks of the Jenks dynamic programming
+jenksBins = 1024
+
+# the Month/Year of the breaks over all the quarters
+allQuarters = "all"
+
+breakHeadings = ["level", "Month/Year", "metric", "method", "class",
+                 "lower", "upper", "count", "gvf"]
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+metricValues
+
+This function: returns the values of the mapped metrics of every row
+of a level (rows x metrics), NaN where the denominator is 0.
+
+Arguments
+---------
+index  : LevelIndex - The level (see hudQuery.LevelIndex)
+'''
+
+def metricValues(index):
+
+    V = np.full((len(index.values), len(mapMetrics)), np.nan)
+    for i, (name, numerator, denominator) in enumerate(mapMetrics):
+        top = index.values[:, hq.metricCols.index(numerator)]
+        if denominator is None:
+            V[:, i] = top
+            continue
+        bottom = index.values[:, hq.metricCols.index(denominator)]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            V[:, i] = np.where(bottom > 0, top / bottom, np.nan)
+
+    return V
+
+# ####################################################################
+'''
+equalBreaks
+
+This function: returns the class bounds (classes + 1) of equal
+intervals of sorted values.
+
+Arguments
+---------
+x        : array - Sorted values
+classes  : int - Number of classes
+'''
+
+def equalBreaks(x, classes):
+
+    return np.linspace(x[0], x[-1], classes + 1)
+
+# ####################################################################
+'''
+quantileBreaks
+
+This function: returns the class bounds (classes + 1) of quantiles of
+sorted values.
+
+Arguments
+---------
+x        : array - Sorted values
+classes  : int - Number of classes
+'''
+
+def quantileBreaks(x, classes):
+
+    position = np.linspace(0, len(x) - 1, classes + 1)
+    below = np.floor(position).astype(np.int64)
+    above = np.minimum(below + 1, len(x) - 1)
+
+    return x[below] + (x[above] - x[below]) * (position - below)
+
+# ####################################################################
+'''
+jenksBreaks
+
+This function: returns the class bounds (classes + 1) of the Jenks
+natural breaks of sorted values, by dynamic programming over blocks of
+the distinct values (at most bins blocks).
+
+Arguments
+---------
+x        : array - Sorted values
+classes  : int - Number of classes
+bins     : int - Most blocks
+'''
+
+def jenksBreaks(x, classes, bins=jenksBins):
+
+    n = len(x)
+
+    # the blocks:  the distinct values, pooled to about equal counts
+    starts = np.flatnonzero(np.r_[True, x[1:] != x[:-1]])
+    if len(starts) > bins:
+        group = starts * bins // n
+        starts = starts[np.r_[True, group[1:] != group[:-1]]]
+    bounds = np.r_[starts, n]
+    classes = min(classes, len(starts))
+
+    # prefix sums of the centered values at the block bounds
+    xc = x - x.mean()
+    S1 = np.r_[0.0, np.cumsum(xc)][bounds]
+    S2 = np.r_[0.0, np.cumsum(xc * xc)][bounds]
+    S0 = bounds.astype(float)
+
+    # cost[j, i]:  sum of squares of one class of the blocks i ... j - 1
+    # (rows by the end, so each step reduces along contiguous rows)
+    blocks = np.arange(len(bounds))
+    sums = np.subtract.outer(S1, S1)
+    np.multiply(sums, sums, out=sums)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        np.divide(sums, np.subtract.outer(S0, S0), out=sums)
+    cost = np.subtract.outer(S2, S2)
+    cost -= sums
+    np.maximum(cost, 0.0, out=cost)
+    cost[np.less_equal.outer(blocks, blocks)] = np.inf
+
+    # best[j]:  least cost of the blocks before j in c + 1 classes
+    best = cost[:, 0].copy()
+    choices = []
+    total = np.empty_like(cost)
+    for c in range(1, classes):
+        np.add(cost, best[None, :], out=total)
+        choice = total.argmin(axis=1)
+        best = total[blocks, choice]
+        choices.append(choice)
+
+    # the first block of every class, from the last class back
+    cuts = [len(bounds) - 1]
+    for choice in reversed(choices):
+        cuts.append(int(choice[cuts[-1]]))
+    cuts = bounds[cuts[::-1]]
+
+    return np.r_[x[0], x[cuts - 1]]
+
+# ####################################################################
+'''
+classSummary
+
+This function: returns the number of values in every class and the
+goodness of variance fit of the classes.
+
+Arguments
+---------
+x      : array - Sorted values
+edges  : array - Class bounds
+'''
+
+def classSummary(x, edges):
+
+    bounds = np.r_[0, np.searchsorted(x, edges[1:-1], "right"), len(x)]
+    counts = np.diff(bounds)
+
+    xc = x - x.mean()
+    S1 = np.r_[0.0, np.cumsum(xc)][bounds]
+    S2 = np.r_[0.0, np.cumsum(xc * xc)][bounds]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        within = np.where(counts > 0,
+                          np.diff(S2) - np.diff(S1) ** 2 / counts, 0.0)
+    total = S2[-1] - S1[-1] ** 2 / len(x)
+
+    gvf = 1.0 - max(within.sum(), 0.0) / total if total > 0 else 1.0
+
+    return counts, gvf
+
+# ####################################################################
+'''
+classBreaks
+
+This function: returns the class bounds of values by one method,
+without empty classes (fewer classes when there are few distinct
+values).
+
+Arguments
+---------
+x        : array - Sorted values
+method   : string - jenks, quantile or equal
+classes  : int - Number of classes
+'''
+
+def classBreaks(x, method, classes):
+
+    if method == "jenks":
+        edges = jenksBreaks(x, classes)
+    elif method == "quantile":
+        edges = quantileBreaks(x, classes)
+    elif method == "equal":
+        edges = equalBreaks(x, classes)
+    else:
+        raise ValueError("unknown class break method: %s" % (method))
+
+    # a repeated upper bound is an empty class (the first class may be
+    # one value, lower = upper)
+    keep = np.r_[True, True, edges[2:] > edges[1:-1]]
+
+    return edges[keep]
+
+# ####################################################################
+'''
+writeBreaks
+
+This function: calculates the class breaks of every mapped metric of
+the given levels of the outputs in outdir, per quarter and over all
+quarters, and writes breaks.csv.  Returns the number of sets of breaks
+and the time per level.
+
+Arguments
+---------
+outdir   : string - Directory holding the output .csv files
+levels   : list - Levels to calculate
+methods  : list - Methods (jenks, quantile, equal)
+classes  : int - Number of classes
+'''
+
+def writeBreaks(outdir, levels=defaultLevels, methods=breakMethods,
+                classes=defaultClasses):
+
+    for method in methods:
+        if method not in breakMethods:
+            raise ValueError("unknown class break method: %s" % (method))
+
+    store = hq.HUDStore(outdir)
+    summary = {}
+
+    outFile = open(os.path.join(outdir, "breaks.csv"), "w")
+    outWriter = ha.newWriter(outFile)
+    outWriter.writerow(breakHeadings)
+    for level in levels:
+        index = store.level(level)
+        startTime = time.perf_counter()
+        V = metricValues(index)
+
+        sections = [(hc.qtrLabel(*divmod(key, 100)), index.section(key))
+                    for key in index.quarters()]
+        sections.append((allQuarters, np.arange(len(V))))
+
+        numBreaks = 0
+        for label, rows in sections:
+            for i, (metric, numerator, denominator) in enumerate(mapMetrics):
+                x = V[rows, i]
+                x = np.sort(x[np.isfinite(x)])
+                if not len(x):
+                    continue
+                for method in methods:
+                    edges = classBreaks(x, method, classes)
+                    counts, gvf = classSummary(x, edges)
+                    outWriter.writerows(
+                        [level, label, metric, method, c, lower, upper,
+                         count, gvf]
+                        for c, (lower, upper, count) in enumerate(zip(
+                            edges[:-1].tolist(), edges[1:].tolist(),
+                            counts.tolist())))
+                    numBreaks += 1
+
+        summary[level] = {"breaks": numBreaks,
+                          "seconds": time.perf_counter() - startTime}
+    outFile.close()
+
+    return summary
@@ -0,0 +1,515 @@
+# ####################################################################
+#
+# Program:  hudCatalog.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module builds a catalog of the HUD input files from their .dbf
+# headers alone.  For each file it records:
+#
+# - the field names, types, lengths and decimals
+# - the number of records
+# - whether the headings are uppercase or lowercase, and whether all
+#   of the columns we need are there (in either case)
+# - the quarter, parsed from the filename with a regular expression
+#   which understands both naming conventions we have seen:
+#       ..._032015_...     (MMYYYY, used by V5)
+#       ..._2015_03_...    (YYYY_MM, used by V6)
+#
+# Earlier versions picked uppercase or lowercase headings by slicing
+# the year out of the filename (>= 2015 meant lowercase), and V5 and
+# V6 needed different slice offsets.  The catalog checks the actual
+# headings instead.
+#
+# HUD delivers each quarter as a zip archive.  The catalog (and the
+# reader in hudAggregate.py) can use the archives directly, without
+# extracting them:  an input named "archive.zip" stands for the one
+# *Data.dbf member of the archive, and "archive.zip!member.dbf" for a
+# given member (see expandInputs).
+#
+# The catalog is cached in a JSON manifest.  An entry is only read
+# again when the file's size or modification time changes, so planning
+# a run over the whole archive never opens the record data.
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import re
+import json
+import struct
+import fnmatch
+import zipfile
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# columns we need from every HUD file (in any case)
+requiredCols = ["GEOID",
+                "AMS_RES",
+                "RES_VAC",
+                "AVG_VAC_R",
+                "VAC_3_RES",
+                "VAC_3_6_R",
+                "VAC_6_12R",
+                "VAC_12_24R",
+                "VAC_24_36R",
+                "VAC_36_RES"]
+
+# quarter patterns:  year then month (2015_03, 201503), or month then
+# year (032015, 3_2015).  Months are the end of a quarter.
+yearMonthPattern = re.compile(r"(?<!\d)(20\d\d)[_-]?(0[369]|12)(?!\d)")
+monthYearPattern = re.compile(r"(?<!\d)(0?[369]|12)[_-]?(20\d\d)(?!\d)")
+
+# version of the manifest layout
+catalogVersion = 2
+
+# the .dbf members we read from a zip archive
+memberPattern = "*Data.dbf"
+
+# separates an archive from a member name in an input name
+memberSeparator = "!"
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+parseQuarter
+
+This function: returns the (year, month) of a HUD file, parsed from
+its filename.  Raises ValueError if the filename has no quarter.
+
+Arguments
+---------
+fileName  : string - HUD filename
+'''
+
+def parseQuarter(fileName):
+
+    diskFile, member = splitInput(fileName)
+    baseName = os.path.basename(member or diskFile)
+
+    match = yearMonthPattern.search(baseName)
+    if match:
+        return (int(match.group(1)), int(match.group(2)))
+
+    match = monthYearPattern.search(baseName)
+    if match:
+        return (int(match.group(2)), int(match.group(1)))
+
+    raise ValueError("no quarter (MMYYYY or YYYY_MM) in filename: %s" %
+                     (fileName))
+
+# ####################################################################
+'''
+qtrLabel
+
+This function: returns the Month/Year label written to the output
+files for a quarter, e.g. "03/2015".
+
+Arguments
+---------
+year   : int - Year of the quarter
+month  : int - Month of the quarter
+'''
+
+def qtrLabel(year, month):
+
+    return "%02d/%04d" % (month, year)
+
+# ####################################################################
+'''
+splitInput
+
+This function: splits an input name into the file on disk and the
+zip member to read (None for a plain .dbf file, or for an archive
+with a single *Data.dbf member).
+
+Arguments
+---------
+fileName  : string - Input name
+'''
+
+def splitInput(fileName):
+
+    if memberSeparator in fileName:
+        diskFile, member = fileName.split(memberSeparator, 1)
+        return diskFile, member
+
+    return fileName, None
+
+# ####################################################################
+'''
+isZip
+
+This function: returns True if an input is (a member of) a zip archive.
+
+Arguments
+---------
+fileName  : string - Input name
+'''
+
+def isZip(fileName):
+
+    return splitInput(fileName)[0].lower().endswith(".zip")
+
+# ####################################################################
+'''
+dataMembers
+
+This function: returns the names of the *Data.dbf members of a zip
+archive.
+
+Arguments
+---------
+zipName  : string - Zip archive filename
+'''
+
+def dataMembers(zipName):
+
+    with zipfile.ZipFile(zipName) as archive:
+        return [name for name in archive.namelist()
+                if fnmatch.fnmatch(os.path.basename(name), memberPattern)]
+
+# ####################################################################
+'''
+expandInputs
+
+This function: returns the input names for a list of .dbf files and
+zip archives.  An archive with one *Data.dbf member is kept as it is;
+an archive with several gives one "archive.zip!member" input for each.
+
+Arguments
+---------
+fileNames  : list - .dbf and .zip filenames
+'''
+
+def expandInputs(fileNames):
+
+    inputs = []
+    for fileName in fileNames:
+        if not isZip(fileName) or memberSeparator in fileName:
+            inputs.append(fileName)
+            continue
+        members = dataMembers(fileName)
+        if not members:
+            raise ValueError("no %s member in %s" % (memberPattern,
+                                                     fileName))
+        if len(members) == 1:
+            inputs.append(fileName)
+        else:
+            inputs.extend(fileName + memberSeparator + member
+                          for member in members)
+
+    return inputs
+
+# ####################################################################
+'''
+openInput
+
+This function: opens an input for reading as a binary stream.  A zip
+member is decompressed as it is read, and never extracted to disk.
+
+Arguments
+---------
+fileName  : string - Input name (.dbf file, archive or archive!member)
+'''
+
+def openInput(fileName):
+
+    diskFile, member = splitInput(fileName)
+    if not isZip(fileName):
+        return open(diskFile, "rb")
+
+    archive = zipfile.ZipFile(diskFile)
+    try:
+        if member is None:
+            members = dataMembers(diskFile)
+            if len(members) != 1:
+                raise ValueError("%s has %i %s members, name one as "
+                                 "archive.zip%smember" %
+                                 (diskFile, len(members), memberPattern,
+                                  memberSeparator))
+            member = members[0]
+        stream = archive.open(member)
+    except Exception:
+        archive.close()
+        raise
+
+    # keep the archive open for as long as the stream is
+    stream.archive = archive
+    return stream
+
+# ####################################################################
+'''
+inputName
+
+This function: returns the name used to find the quarter of an input:
+the member name for a zip archive, otherwise the filename.
+
+Arguments
+---------
+fileName  : string - Input name
+'''
+
+def inputName(fileName):
+
+    diskFile, member = splitInput(fileName)
+    if member is None and isZip(fileName):
+        members = dataMembers(diskFile)
+        if len(members) == 1:
+            member = members[0]
+
+    return member or diskFile
+
+# ####################################################################
+'''
+parseHeader
+
+This function: parses the header of a dBase (.dbf) file from a file
+object positioned at the start of the file, reading only the header
+bytes.  Returns a dictionary with the number of records, the header
+and record lengths and the list of fields as
+[name, type, length, decimals].
+
+Arguments
+---------
+inFile  : file - Open binary file (or file-like object)
+'''
+
+def parseHeader(inFile):
+
+    head = inFile.read(32)
+    if len(head) < 32:
+        raise ValueError("not a .dbf file (header too short)")
+
+    version, yy, mm, dd, numRecords, headerLen, recordLen = \
+        struct.unpack("<BBBBIHH", head[:12])
+
+    fields = []
+    descriptors = inFile.read(headerLen - 32)
+    for pos in range(0, len(descriptors) - 31, 32):
+        descriptor = descriptors[pos:pos + 32]
+        if descriptor[0:1] == b"\r":
+            break
+        name = descriptor[:11].split(b"\0")[0].decode("ascii",
+                                                      "replace").strip()
+        fields.append([name,
+                       descriptor[11:12].decode("ascii", "replace"),
+                       descriptor[16],
+                       descriptor[17]])
+
+    return {"version": version,
+            "lastUpdate": "%04d-%02d-%02d" % (1900 + yy, mm, dd),
+            "numRecords": numRecords,
+            "headerLen": headerLen,
+            "recordLen": recordLen,
+            "fields": fields}
+
+# ####################################################################
+'''
+headingCase
+
+This function: returns "upper", "lower" or "mixed" for a list of
+field names.
+
+Arguments
+---------
+names  : list - Field names
+'''
+
+def headingCase(names):
+
+    letters = "".join(c for c in "".join(names) if c.isalpha())
+    if letters.isupper():
+        return "upper"
+    if letters.islower():
+        return "lower"
+
+    return "mixed"
+
+# ####################################################################
+'''
+describeHeader
+
+This function: adds the quarter, heading case and missing columns to
+a parsed header, giving a catalog entry.
+
+Arguments
+---------
+fileName  : string - HUD filename
+header    : dictionary - Header from parseHeader
+'''
+
+def describeHeader(fileName, header):
+
+    entry = dict(header)
+    names = [field[0] for field in header["fields"]]
+    upperNames = set(name.upper() for name in names)
+
+    year, month = parseQuarter(fileName)
+    entry["year"] = year
+    entry["month"] = month
+    entry["label"] = qtrLabel(year, month)
+    entry["case"] = headingCase(names)
+    entry["missing"] = [col for col in requiredCols
+                        if col not in upperNames]
+
+    return entry
+
+# ####################################################################
+'''
+catalogFile
+
+This function: returns the catalog entry of one .dbf file (or zip
+archive member), reading only its header.
+
+Arguments
+---------
+fileName  : string - HUD input name
+'''
+
+def catalogFile(fileName):
+
+    inFile = openInput(fileName)
+    try:
+        header = parseHeader(inFile)
+    finally:
+        inFile.close()
+        if hasattr(inFile, "archive"):
+            inFile.archive.close()
+
+    # the quarter comes from the member name for a zip archive, falling
+    # back to the archive name
+    try:
+        entry = describeHeader(inputName(fileName), header)
+    except ValueError:
+        entry = describeHeader(splitInput(fileName)[0], header)
+    stat = os.stat(splitInput(fileName)[0])
+    entry["path"] = fileName
+    entry["size"] = stat.st_size
+    entry["mtime"] = stat.st_mtime
+
+    return entry
+
+# ####################################################################
+'''
+loadCatalog
+
+This function: reads a catalog manifest, returning a dictionary of
+entries keyed by absolute path (empty if there is no manifest yet).
+
+Arguments
+---------
+manifest  : string - Manifest filename
+'''
+
+def loadCatalog(manifest):
+
+    if not manifest or not os.path.exists(manifest):
+        return {}
+
+    with open(manifest) as inFile:
+        catalog = json.load(inFile)
+
+    if catalog.get("version") != catalogVersion:
+        return {}
+
+    return catalog["files"]
+
+# ####################################################################
+'''
+saveCatalog
+
+This function: writes a catalog manifest.
+
+Arguments
+---------
+entries   : dictionary - Catalog entries keyed by absolute path
+manifest  : string - Manifest filename
+'''
+
+def saveCatalog(entries, manifest):
+
+    tmpName = manifest + ".tmp"
+    with open(tmpName, "w") as outFile:
+        json.dump({"version": catalogVersion, "files": entries}, outFile,
+                  indent=1, sort_keys=True)
+    os.replace(tmpName, manifest)
+
+# ####################################################################
+'''
+buildCatalog
+
+This function: returns the catalog entries of a list of inputs (see
+expandInputs), in quarter order.  Entries cached in the manifest are
+reused when the file's size and modification time haven't changed;
+the others are read from the file headers and the manifest is
+updated.
+
+Arguments
+---------
+fileNames  : list - HUD .dbf filenames
+manifest   : string - Manifest filename (or None for no cache)
+'''
+
+def buildCatalog(fileNames, manifest=None):
+
+    cached = loadCatalog(manifest)
+    entries = {}
+    changed = False
+
+    for fileName in fileNames:
+        key = os.path.abspath(fileName)
+        stat = os.stat(splitInput(fileName)[0])
+        entry = cached.get(key)
+        if (entry is None or entry["size"] != stat.st_size or
+                entry["mtime"] != stat.st_mtime):
+            entry = catalogFile(fileName)
+            changed = True
+        entry["path"] = fileName
+        entries[key] = entry
+
+    if manifest and (changed or set(entries) - set(cached)):
+        cached.update(entries)
+        saveCatalog(cached, manifest)
+
+    return sorted(entries.values(),
+                  key=lambda e: (e["year"], e["month"], e["path"]))
+
+# ####################################################################
+'''
+checkCatalog
+
+This function: raises ValueError if any file is missing a required
+column, or if two files are for the same quarter.
+
+Arguments
+---------
+entries  : list - Catalog entries
+'''
+
+def checkCatalog(entries):
+
+    problems = []
+    seen = {}
+
+    for entry in entries:
+        if entry["missing"]:
+            problems.append("%s is missing %s" %
+                            (entry["path"], ", ".join(entry["missing"])))
+        quarter = (entry["year"], entry["month"])
+        if quarter in seen:
+            problems.append("%s and %s are both for %s" %
+                            (seen[quarter], entry["path"], entry["label"]))
+        seen[quarter] = entry["path"]
+
+    if problems:
+        raise ValueError("\n".join(problems))
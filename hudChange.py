@@ -0,0 +1,294 @@
+# ####################################################################
+#
+# Program:  hudChange.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module finds the level shifts (change points) of the vacancy
+# rate (RES_VAC / AMS_RES) series of the tracts and counties, such as
+# the rise of the foreclosure wave and the recoveries after it.
+#
+# The method is binary segmentation with the Gaussian change in mean
+# cost:  a segment is split at the quarter which most reduces its sum
+# of squared deviations from the segment means, when the reduction is
+# larger than a penalty (penalty x variance x log of the number of
+# quarters, BIC like).  The variance of each series is estimated
+# robustly from its quarter to quarter differences (the median absolute
+# difference), so the shifts themselves don't inflate it.  When more
+# than half of the differences are 0 (a rate which rarely moves) that
+# estimate is 0, and any blip would be a break:  such a series gets the
+# variance of its differences instead, and at least varianceFloor times
+# the median variance of the level's series.
+#
+# All series are segmented together:  with the prefix sums of the
+# values and of the mask of the quarters a series has, the reduction of
+# every split of every open segment is one array calculation, and each
+# round splits every segment which has a split worth making.  A round
+# costs O(series x quarters), and there are at most maxBreaks rounds,
+# so the run time grows linearly with the panel.  Quarters a series has
+# no rate in drop out of its sums.
+#
+# Each break is written with the first quarter of the new level, the
+# mean rate before and after it (over the neighboring segments), the
+# magnitude (after - before) and its score (the reduction of the sum of
+# squares, in units of the variance).
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import numpy as np
+import hudAggregate as ha
+import hudQuery as hq
+import hudForecast as hfc
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# most breaks per series
+defaultMaxBreaks = 3
+
+# fewest quarters with a rate in a segment
+defaultMinSize = 2
+
+# penalty of a break, times the variance and the log of the quarters
+defaultPenalty = 3.0
+
+# the levels segmented by default
+defaultLevels = ["county", "tract"]
+
+# least variance of a series whose differences are mostly 0, as a
+# share of the median variance of the series
+varianceFloor = 0.25
+
+# segments per batch of the gain calculation
+segmentBatch = 1 << 14
+
+changeHeadings = ["level", "GEOID", "Month/Year", "before", "after",
+                  "magnitude", "score"]
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+robustVariance
+
+This function: returns the noise variance of every series (row),
+estimated from the median absolute difference of consecutive quarters
+(NaN for a series with no two consecutive quarters).  Where that is 0,
+returns the variance of the differences, but at least floor times the
+median of the other series' variances.
+
+Arguments
+---------
+Y      : array - Values (series x quarters), NaN where missing
+floor  : float - Least variance, as a share of the median variance
+'''
+
+def robustVariance(Y, floor=varianceFloor):
+
+    steps = np.diff(Y, axis=1)
+    diffs = np.abs(steps)
+    has = np.isfinite(diffs).any(axis=1)
+
+    mad = np.full(len(Y), np.nan)
+    if has.any():
+        mad[has] = np.nanmedian(diffs[has], axis=1)
+
+    # the differences of the noise have twice its variance
+    variance = (mad / 0.6745) ** 2 / 2
+
+    flat = variance == 0
+    if flat.any():
+        typical = variance[variance > 0]
+        least = floor * np.median(typical) if len(typical) else 0.0
+        variance[flat] = np.maximum(np.nanvar(steps[flat], axis=1) / 2,
+                                    least)
+
+    return variance
+
+# ####################################################################
+'''
+splitGains
+
+This function: returns the best split of every segment and the
+reduction of the sum of squares it gives (-inf where no split leaves
+minSize quarters on each side).
+
+Arguments
+---------
+C        : array - Prefix counts of the mask (series x quarters + 1)
+S        : array - Prefix sums of the values (series x quarters + 1)
+mask     : array - Quarters each series has
+series   : array - Series of every segment
+a        : array - First quarter of every segment
+b        : array - Quarter after the last of every segment
+minSize  : int - Fewest quarters with a value on each side
+'''
+
+def splitGains(C, S, mask, series, a, b, minSize):
+
+    k = np.arange(1, mask.shape[1])
+    best = np.zeros(len(series), dtype=np.int64)
+    gain = np.full(len(series), -np.inf)
+
+    for first in range(0, len(series), segmentBatch):
+        s = series[first:first + segmentBatch]
+        sa = a[first:first + segmentBatch][:, None]
+        sb = b[first:first + segmentBatch][:, None]
+        rows = np.arange(len(s))[:, None]
+
+        Cs, Ss = C[s], S[s]
+        Ca, Cb = Cs[rows, sa], Cs[rows, sb]
+        Sa, Sb = Ss[rows, sa], Ss[rows, sb]
+        nl, nr = Cs[:, 1:-1] - Ca, Cb - Cs[:, 1:-1]
+        sl, sr = Ss[:, 1:-1] - Sa, Sb - Ss[:, 1:-1]
+
+        valid = (k > sa) & (k < sb) & (nl >= minSize) & (nr >= minSize) & \
+            mask[s][:, 1:]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            g = np.where(valid, sl * sl / nl + sr * sr / nr -
+                         (Sb - Sa) ** 2 / (Cb - Ca), -np.inf)
+
+        if g.shape[1]:
+            best[first:first + len(s)] = g.argmax(axis=1) + 1
+            gain[first:first + len(s)] = g.max(axis=1)
+
+    return best, gain
+
+# ####################################################################
+'''
+changePoints
+
+This function: segments every series (row) and returns its breaks as
+arrays:  series, quarter (first of the new level), mean before, mean
+after and score.
+
+Arguments
+---------
+Y          : array - Values (series x quarters), NaN where missing
+maxBreaks  : int - Most breaks per series
+minSize    : int - Fewest quarters with a value in a segment
+penalty    : float - Penalty of a break (times variance x log quarters)
+'''
+
+def changePoints(Y, maxBreaks=defaultMaxBreaks, minSize=defaultMinSize,
+                 penalty=defaultPenalty):
+
+    numSeries, numQuarters = Y.shape
+    mask = np.isfinite(Y)
+    Y0 = np.where(mask, Y, 0.0)
+    C = np.zeros((numSeries, numQuarters + 1))
+    S = np.zeros((numSeries, numQuarters + 1))
+    np.cumsum(mask, axis=1, out=C[:, 1:])
+    np.cumsum(Y0, axis=1, out=S[:, 1:])
+
+    variance = robustVariance(Y)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        threshold = penalty * variance * np.log(np.maximum(C[:, -1], 2))
+
+    # the open segments
+    series = np.flatnonzero(C[:, -1] >= 2 * minSize)
+    a = np.zeros(len(series), dtype=np.int64)
+    b = np.full(len(series), numQuarters, dtype=np.int64)
+
+    numBreaks = np.zeros(numSeries, dtype=np.int64)
+    found = {"series": [], "quarter": [], "gain": []}
+    for step in range(maxBreaks):
+        if not len(series):
+            break
+        k, gain = splitGains(C, S, mask, series, a, b, minSize)
+        with np.errstate(invalid="ignore"):
+            accept = np.flatnonzero((gain > threshold[series]) &
+                                    (variance[series] > 0))
+
+        # the best splits of a series, up to its remaining breaks
+        order = accept[np.lexsort((-gain[accept], series[accept]))]
+        s = series[order]
+        rank = np.arange(len(s)) - np.searchsorted(s, s, "left")
+        order = order[rank < maxBreaks - numBreaks[s]]
+        if not len(order):
+            break
+        np.add.at(numBreaks, series[order], 1)
+
+        found["series"].append(series[order])
+        found["quarter"].append(k[order])
+        found["gain"].append(gain[order])
+
+        s, k, sa, sb = series[order], k[order], a[order], b[order]
+        series, a, b = np.r_[s, s], np.r_[sa, k], np.r_[k, sb]
+
+    if found["series"]:
+        s = np.concatenate(found["series"])
+        k = np.concatenate(found["quarter"])
+        gain = np.concatenate(found["gain"])
+    else:
+        s = k = np.zeros(0, dtype=np.int64)
+        gain = np.zeros(0)
+    order = np.lexsort((k, s))
+    s, k, gain = s[order], k[order], gain[order]
+
+    # the neighboring segments of every break
+    first = np.r_[True, s[1:] != s[:-1]] if len(s) else np.zeros(0, bool)
+    last = np.r_[s[1:] != s[:-1], True] if len(s) else np.zeros(0, bool)
+    previous = np.where(first, 0, np.r_[0, k[:-1]])
+    following = np.where(last, numQuarters, np.r_[k[1:], 0])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        before = (S[s, k] - S[s, previous]) / (C[s, k] - C[s, previous])
+        after = (S[s, following] - S[s, k]) / (C[s, following] - C[s, k])
+        score = gain / variance[s]
+
+    return {"series": s, "quarter": k, "before": before, "after": after,
+            "score": score}
+
+# ####################################################################
+'''
+writeChanges
+
+This function: finds the breaks of the vacancy rate series of the
+given levels of the outputs in outdir and writes changes.csv.  Returns
+the number of series and breaks per level.
+
+Arguments
+---------
+outdir     : string - Directory holding the output .csv files
+levels     : list - Levels to segment
+maxBreaks  : int - Most breaks per series
+minSize    : int - Fewest quarters with a rate in a segment
+penalty    : float - Penalty of a break
+'''
+
+def writeChanges(outdir, levels=defaultLevels, maxBreaks=defaultMaxBreaks,
+                 minSize=defaultMinSize, penalty=defaultPenalty):
+
+    store = hq.HUDStore(outdir)
+    counts = {}
+
+    outFile = open(os.path.join(outdir, "changes.csv"), "w")
+    outWriter = ha.newWriter(outFile)
+    outWriter.writerow(changeHeadings)
+    for level in levels:
+        index = store.level(level)
+        geoids = np.array(sorted(index.offsets), dtype="U")
+        labels = store.quarters(level)
+        Y = hfc.seriesMatrix(index, geoids, "RES_VAC", True)
+        breaks = changePoints(Y, maxBreaks, minSize, penalty)
+
+        outWriter.writerows(
+            [level, geoid, labels[k], before, after, after - before, score]
+            for geoid, k, before, after, score in zip(
+                geoids[breaks["series"]].tolist(),
+                breaks["quarter"].tolist(), breaks["before"].tolist(),
+                breaks["after"].tolist(), breaks["score"].tolist()))
+        counts[level] = {"series": len(geoids),
+                         "breaks": len(breaks["series"])}
+    outFile.close()
+
+    return counts
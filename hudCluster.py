@@ -0,0 +1,294 @@
+# ####################################################################
+#
+# Program:  hudCluster.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module groups the tracts by the course of their vacancy rate
+# (RES_VAC / AMS_RES) over all the quarters of tract.csv:  stable,
+# rising, recovering, chronically vacant and so on.
+#
+# Each tract's series is normalized:  the quarters it has no rate in are
+# filled from the nearest quarters, and the series is centered on its
+# mean and divided by its standard deviation, so the clusters follow the
+# shape of the series.  So that a chronically vacant tract doesn't look
+# like a stable one, the level of the tract (its log mean rate,
+# standardized over the tracts) is added as one more feature, weighted
+# by levelWeight x sqrt(quarters), i.e. by default as much as the whole
+# shape.  With levelWeight 0 only the shape counts.
+#
+# The clusters are found by mini-batch k-means (Sculley, 2010):  the
+# centers start from k-means++ on a sample, and are then moved towards
+# the mean of a random batch of tracts at a time, each center by one
+# over the number of tracts it has seen.  Memory is bounded by the
+# batch:  no tracts x centers matrix is ever made for the whole panel.
+# The random numbers come from one seeded generator, so a run with the
+# same seed and data gives the same clusters.
+#
+# The clusters are numbered by the mean rate of their tracts, lowest
+# first.
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import time
+import numpy as np
+import pandas as pd
+import hudAggregate as ha
+import hudQuery as hq
+import hudForecast as hfc
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+defaultClusters = 6
+defaultBatchSize = 4096
+defaultIterations = 200
+defaultSeed = 0
+
+# weight of the level feature (1:  as much as the shape)
+defaultLevelWeight = 1.0
+
+# fewest quarters with a rate for a tract to be clustered
+defaultMinQuarters = 4
+
+# tracts used for the k-means++ start
+initSample = 20000
+
+# the run stops when no center moves more than this (per feature)
+defaultTolerance = 1e-4
+
+# rows per chunk of the final assignment
+assignChunk = 1 << 15
+
+clusterHeadings = ["GEOID", "cluster", "distance"]
+centroidHeadings = ["cluster", "tracts", "Month/Year", "shape", "level",
+                    "rate"]
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+trajectoryFeatures
+
+This function: returns the normalized features of every series (row)
+with at least minQuarters values, and the rows used.
+
+Arguments
+---------
+Y            : array - Rates (tracts x quarters), NaN where missing
+levelWeight  : float - Weight of the level feature
+minQuarters  : int - Fewest quarters with a rate
+'''
+
+def trajectoryFeatures(Y, levelWeight=defaultLevelWeight,
+                       minQuarters=defaultMinQuarters):
+
+    rows = np.flatnonzero(np.isfinite(Y).sum(axis=1) >= minQuarters)
+    filled = pd.DataFrame(Y[rows]).ffill(axis=1).bfill(axis=1).values
+
+    means = filled.mean(axis=1, keepdims=True)
+    stds = filled.std(axis=1, keepdims=True)
+    shape = np.where(stds > 0, (filled - means) / np.where(stds > 0, stds,
+                                                           1.0), 0.0)
+
+    level = np.log(np.maximum(means[:, 0], 1e-4))
+    if len(level) > 1 and level.std() > 0:
+        level = (level - level.mean()) / level.std()
+    else:
+        level = np.zeros(len(level))
+
+    weight = levelWeight * np.sqrt(Y.shape[1])
+    return np.c_[shape, weight * level], rows
+
+# ####################################################################
+'''
+nearestCenters
+
+This function: returns the nearest center of every row of X and the
+squared distance to it, in chunks.
+
+Arguments
+---------
+X        : array - Features (rows x features)
+centers  : array - Centers (clusters x features)
+'''
+
+def nearestCenters(X, centers):
+
+    labels = np.zeros(len(X), dtype=np.int64)
+    dist2 = np.zeros(len(X))
+    centerNorms = (centers * centers).sum(axis=1)
+
+    for first in range(0, len(X), assignChunk):
+        chunk = X[first:first + assignChunk]
+        d = centerNorms[None, :] - 2 * chunk @ centers.T
+        labels[first:first + len(chunk)] = d.argmin(axis=1)
+        dist2[first:first + len(chunk)] = np.maximum(
+            d.min(axis=1) + (chunk * chunk).sum(axis=1), 0.0)
+
+    return labels, dist2
+
+# ####################################################################
+'''
+kmeansPlusPlus
+
+This function: returns k starting centers chosen by k-means++ from a
+sample of the rows.
+
+Arguments
+---------
+X    : array - Features (rows x features)
+k    : int - Number of clusters
+rng  : Generator - Seeded random numbers
+'''
+
+def kmeansPlusPlus(X, k, rng):
+
+    sample = X[rng.choice(len(X), min(initSample, len(X)), replace=False)]
+    centers = [sample[rng.integers(len(sample))]]
+    dist2 = ((sample - centers[0]) ** 2).sum(axis=1)
+
+    for i in range(1, k):
+        total = dist2.sum()
+        pick = rng.choice(len(sample), p=dist2 / total) if total > 0 \
+            else rng.integers(len(sample))
+        centers.append(sample[pick])
+        dist2 = np.minimum(dist2, ((sample - sample[pick]) ** 2).sum(axis=1))
+
+    return np.array(centers)
+
+# ####################################################################
+'''
+miniBatchKMeans
+
+This function: clusters the rows of X by mini-batch k-means, and
+returns the centers, the label and squared distance of every row, and
+the number of iterations run.
+
+Arguments
+---------
+X           : array - Features (rows x features)
+k           : int - Number of clusters
+batchSize   : int - Rows per batch
+iterations  : int - Most batches
+seed        : int - Seed of the random numbers
+tolerance   : float - Stop when no center moves more than this
+'''
+
+def miniBatchKMeans(X, k, batchSize=defaultBatchSize,
+                    iterations=defaultIterations, seed=defaultSeed,
+                    tolerance=defaultTolerance):
+
+    rng = np.random.default_rng(seed)
+    k = min(k, len(X))
+    centers = kmeansPlusPlus(X, k, rng)
+    counts = np.zeros(k)
+
+    iteration = 0
+    for iteration in range(1, iterations + 1):
+        batch = X[rng.choice(len(X), min(batchSize, len(X)), replace=False)]
+        labels, dist2 = nearestCenters(batch, centers)
+
+        # move each center towards the mean of its rows of the batch
+        batchCounts = np.bincount(labels, minlength=k)
+        sums = np.zeros(centers.shape)
+        np.add.at(sums, labels, batch)
+        seen = batchCounts > 0
+        counts[seen] += batchCounts[seen]
+        moved = (sums[seen] - batchCounts[seen][:, None] * centers[seen]) / \
+            counts[seen][:, None]
+        centers[seen] += moved
+
+        if len(moved) and np.sqrt((moved * moved).mean(axis=1)).max() < \
+                tolerance:
+            break
+
+    labels, dist2 = nearestCenters(X, centers)
+
+    return centers, labels, dist2, iteration
+
+# ####################################################################
+'''
+writeClusters
+
+This function: clusters the tracts of the tract output in outdir by
+their vacancy rate trajectories and writes clusters.csv (the cluster
+of every tract) and centroids.csv (the center and the mean rate of
+every cluster, per quarter).  Returns a summary of the run.
+
+Arguments
+---------
+outdir       : string - Directory holding tract.csv
+k            : int - Number of clusters
+batchSize    : int - Tracts per batch
+iterations   : int - Most batches
+seed         : int - Seed of the random numbers
+levelWeight  : float - Weight of the level feature
+minQuarters  : int - Fewest quarters with a rate for a tract
+'''
+
+def writeClusters(outdir, k=defaultClusters, batchSize=defaultBatchSize,
+                  iterations=defaultIterations, seed=defaultSeed,
+                  levelWeight=defaultLevelWeight,
+                  minQuarters=defaultMinQuarters):
+
+    store = hq.HUDStore(outdir)
+    index = store.level("tract")
+    geoids = np.array(sorted(index.offsets), dtype="U")
+    labels = store.quarters("tract")
+    Y = hfc.seriesMatrix(index, geoids, "RES_VAC", True)
+
+    startTime = time.perf_counter()
+    X, rows = trajectoryFeatures(Y, levelWeight, minQuarters)
+    if not len(rows):
+        raise ValueError("no tract has %i quarters with a rate" %
+                         (minQuarters))
+    centers, clusters, dist2, numIterations = miniBatchKMeans(
+        X, k, batchSize, iterations, seed)
+    seconds = time.perf_counter() - startTime
+
+    # the clusters numbered by the mean rate of their tracts
+    k = len(centers)
+    with np.errstate(invalid="ignore"):
+        meanRates = np.array([np.nanmean(Y[rows[clusters == c]], axis=0)
+                              if (clusters == c).any()
+                              else np.full(Y.shape[1], np.nan)
+                              for c in range(k)])
+    order = np.argsort([np.nanmean(r) if np.isfinite(r).any() else np.inf
+                        for r in meanRates], kind="mergesort")
+    rank = np.empty(k, dtype=np.int64)
+    rank[order] = np.arange(k)
+    clusters = rank[clusters]
+    centers, meanRates = centers[order], meanRates[order]
+    sizes = np.bincount(clusters, minlength=k)
+
+    outFile = open(os.path.join(outdir, "clusters.csv"), "w")
+    outWriter = ha.newWriter(outFile)
+    outWriter.writerow(clusterHeadings)
+    outWriter.writerows(zip(geoids[rows].tolist(), clusters.tolist(),
+                            np.sqrt(dist2).tolist()))
+    outFile.close()
+
+    outFile = open(os.path.join(outdir, "centroids.csv"), "w")
+    outWriter = ha.newWriter(outFile)
+    outWriter.writerow(centroidHeadings)
+    for c in range(k):
+        outWriter.writerows(
+            [c, int(sizes[c]), label, shape, centers[c, -1],
+             rate if np.isfinite(rate) else ""]
+            for label, shape, rate in zip(labels, centers[c, :-1].tolist(),
+                                          meanRates[c].tolist()))
+    outFile.close()
+
+    return {"tracts": len(rows), "clusters": sizes.tolist(),
+            "iterations": numIterations, "inertia": float(dist2.sum()),
+            "seconds": seconds}
@@ -0,0 +1,417 @@
+# ####################################################################
+#
+# Program:  hudForecast.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module forecasts the next quarter of every GEOID of the four
+# output levels:  the residential vacancy rate (RES_VAC / AMS_RES) and
+# the number of vacant addresses (RES_VAC), with prediction intervals.
+#
+# The model of each series is a linear trend plus a quarter of the year
+# effect, fit by least squares to the last quarters of the series (12
+# by default, three years).  All series of a level are fit at once:
+# with the values as one matrix (GEOIDs x quarters) and a mask of the
+# quarters each series has, the normal equations of every series are
+# stacked (GEOIDs x 5 x 5) and solved together.  A series with too few
+# quarters for the seasonal model gets the trend alone, and one with
+# fewer still its mean.
+#
+# The interval is the usual one of a regression prediction:  the
+# residual variance times (1 + x0' (X'X)^-1 x0), with Student's t
+# quantile (the normal one if scipy isn't installed).  Intervals are
+# left empty when a series has no residual degrees of freedom.
+#
+# The backtest replays the archive:  for every quarter after the first
+# few it fits on the quarters before it only, forecasts it, and
+# compares the forecast with the actual value, reporting the mean
+# absolute error, the root mean squared error, the interval coverage,
+# the error of the naive forecast (the last value) and the run time.
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import math
+import time
+import numpy as np
+import pandas as pd
+import hudAggregate as ha
+import hudCatalog as hc
+import hudQuery as hq
+
+try:
+    from scipy.special import stdtrit   # optional, exact t quantiles
+except ImportError:
+    stdtrit = None
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# quarters each series is fit to
+defaultWindow = 12
+
+# coverage of the prediction intervals
+defaultLevel = 0.95
+
+# fewest quarters for the seasonal model, and for the trend
+seasonalQuarters = 8
+trendQuarters = 4
+
+# fewest quarters before the first quarter the backtest forecasts
+defaultMinTrain = 4
+
+# the forecast series:  name, vacant column, divided by AMS_RES
+forecastSeries = [("rate", "RES_VAC", True), ("vacant", "RES_VAC", False)]
+
+forecastHeadings = ["level", "GEOID", "Month/Year", "quarters",
+                    "rate", "rateLower", "rateUpper",
+                    "vacant", "vacantLower", "vacantUpper"]
+backtestHeadings = ["level", "Month/Year", "series", "GEOIDs", "MAE",
+                    "RMSE", "coverage", "naiveMAE", "seconds"]
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+nextQuarter
+
+This function: returns the quarter after a quarter, as YYYYMM.
+
+Arguments
+---------
+key  : int - Quarter as YYYYMM (see hudQuery.qtrKey)
+'''
+
+def nextQuarter(key):
+
+    year, month = divmod(int(key), 100)
+
+    return (year + 1) * 100 + month - 9 if month > 9 else key + 3
+
+# ####################################################################
+'''
+seriesMatrix
+
+This function: returns a series of every GEOID of a level (rows) in
+every quarter (columns), NaN where it is missing:  the vacancy rate,
+or the number of vacant addresses.
+
+Arguments
+---------
+index   : LevelIndex - Rows of the level (see hudQuery)
+geoids  : array - GEOIDs (rows of the result)
+column  : string - Vacant column
+rate    : boolean - Divide by AMS_RES
+'''
+
+def seriesMatrix(index, geoids, column, rate):
+
+    quarters = index.quarters()
+    rows = pd.Index(geoids).get_indexer(index.geoids)
+    cols = np.searchsorted(quarters, index.keys)
+
+    values = index.values[:, hq.metricCols.index(column)]
+    if rate:
+        units = index.values[:, hq.metricCols.index("AMS_RES")]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = np.where(units > 0, values / units, np.nan)
+
+    Y = np.full((len(geoids), len(quarters)), np.nan)
+    Y[rows, cols] = values
+
+    return Y
+
+# ####################################################################
+'''
+designMatrix
+
+This function: returns the regressors of the seasonal model for a list
+of quarters:  intercept, time (years, centered on the last quarter)
+and the effects of the second, third and fourth quarter of the year.
+
+Arguments
+---------
+keys  : list - Quarters as YYYYMM
+'''
+
+def designMatrix(keys):
+
+    keys = np.asarray(keys, dtype=np.int64)
+    months = keys // 100 * 12 + keys % 100
+    season = (keys % 100 - 1) // 3
+
+    X = np.zeros((len(keys), 5))
+    X[:, 0] = 1.0
+    X[:, 1] = (months - months[-1]) / 12.0
+    for s in range(1, 4):
+        X[:, 1 + s] = season == s
+
+    return X
+
+# ####################################################################
+'''
+normalQuantile
+
+This function: returns the standard normal quantile of a probability
+(by bisection on erfc).
+
+Arguments
+---------
+prob  : float - Probability (0.5 to 1)
+'''
+
+def normalQuantile(prob):
+
+    low, high = 0.0, 40.0
+    for i in range(100):
+        middle = (low + high) / 2
+        if 0.5 * math.erfc(middle / math.sqrt(2)) > 1 - prob:
+            low = middle
+        else:
+            high = middle
+
+    return (low + high) / 2
+
+# ####################################################################
+'''
+seasonalForecast
+
+This function: fits the seasonal model of every series (row) to the
+last window quarters, and returns the forecast of the next quarter,
+the interval and the number of quarters fit.
+
+Arguments
+---------
+Y       : array - Values (series x quarters), NaN where missing
+keys    : list - Quarters of the columns as YYYYMM
+window  : int - Quarters each series is fit to
+level   : float - Coverage of the intervals
+'''
+
+def seasonalForecast(Y, keys, window=defaultWindow, level=defaultLevel):
+
+    Y, keys = Y[:, -window:], list(keys)[-window:]
+    X = designMatrix(keys + [nextQuarter(keys[-1])])
+    X, x0 = X[:-1], X[-1]
+
+    mask = np.isfinite(Y)
+    Y0 = np.where(mask, Y, 0.0)
+    W = mask.astype(float)
+    n = mask.sum(axis=1)
+
+    forecast = np.full(len(Y), np.nan)
+    se = np.full(len(Y), np.nan)
+    df = np.zeros(len(Y))
+
+    # the seasonal model, the trend, the mean
+    remaining = n > 0
+    for cols, fewest in [([0, 1, 2, 3, 4], seasonalQuarters),
+                         ([0, 1], trendQuarters), ([0], 1)]:
+        rows = np.flatnonzero(remaining & (n >= fewest))
+        remaining[rows] = False
+        if not len(rows):
+            continue
+
+        Xc = X[:, cols]
+        G = np.einsum("it,tj,tk->ijk", W[rows], Xc, Xc)
+        b = np.einsum("it,tj->ij", Y0[rows], Xc)
+        Ginv = np.linalg.pinv(G)
+        beta = np.einsum("ijk,ik->ij", Ginv, b)
+
+        resid = np.where(mask[rows], Y0[rows] - beta @ Xc.T, 0.0)
+        k = len(cols)
+        df[rows] = n[rows] - k
+        with np.errstate(invalid="ignore", divide="ignore"):
+            s2 = (resid * resid).sum(axis=1) / df[rows]
+        lever = np.einsum("j,ijk,k->i", x0[cols], Ginv, x0[cols])
+
+        forecast[rows] = beta @ x0[cols]
+        se[rows] = np.where(df[rows] > 0, np.sqrt(s2 * (1 + lever)),
+                            np.nan)
+
+    prob = 1 - (1 - level) / 2
+    if stdtrit is not None:
+        q = np.where(df > 0, stdtrit(np.maximum(df, 1), prob), np.nan)
+    else:
+        q = np.where(df > 0, normalQuantile(prob), np.nan)
+
+    return {"forecast": forecast, "lower": forecast - q * se,
+            "upper": forecast + q * se, "n": n}
+
+# ####################################################################
+'''
+levelForecasts
+
+This function: returns the forecasts of the next quarter of every
+series of one level, with the GEOIDs and the quarter forecast.
+
+Arguments
+---------
+index   : LevelIndex - Rows of the level (see hudQuery)
+window  : int - Quarters each series is fit to
+level   : float - Coverage of the intervals
+'''
+
+def levelForecasts(index, window=defaultWindow, level=defaultLevel):
+
+    geoids = np.array(sorted(index.offsets), dtype="U")
+    keys = index.quarters()
+
+    results = {}
+    for name, column, rate in forecastSeries:
+        result = seasonalForecast(seriesMatrix(index, geoids, column, rate),
+                                  keys, window, level)
+        # rates stay in [0, 1] and counts non-negative
+        high = 1.0 if rate else np.inf
+        for part in ["forecast", "lower", "upper"]:
+            result[part] = np.clip(result[part], 0.0, high)
+        results[name] = result
+
+    return geoids, nextQuarter(keys[-1]), results
+
+# ####################################################################
+'''
+writeForecasts
+
+This function: forecasts the next quarter of every GEOID of every
+level of the outputs in outdir and writes forecast.csv.  Returns the
+number of rows written per level.
+
+Arguments
+---------
+outdir  : string - Directory holding national.csv ... tract.csv
+window  : int - Quarters each series is fit to
+level   : float - Coverage of the intervals
+'''
+
+def writeForecasts(outdir, window=defaultWindow, level=defaultLevel):
+
+    store = hq.HUDStore(outdir)
+    numRows = {}
+
+    outFile = open(os.path.join(outdir, "forecast.csv"), "w")
+    outWriter = ha.newWriter(outFile)
+    outWriter.writerow(forecastHeadings)
+    for levelName in ha.levels:
+        geoids, key, results = levelForecasts(store.level(levelName),
+                                              window, level)
+        label = hc.qtrLabel(*divmod(key, 100))
+        rate, vacant = results["rate"], results["vacant"]
+        outWriter.writerows(
+            [levelName, geoid, label, n] + list(values)
+            for geoid, n, values in zip(
+                geoids.tolist(), rate["n"].tolist(),
+                zip(*[result[part].tolist() for result in [rate, vacant]
+                      for part in ["forecast", "lower", "upper"]])))
+        numRows[levelName] = len(geoids)
+    outFile.close()
+
+    return numRows
+
+# ####################################################################
+'''
+backtest
+
+This function: replays the archive in outdir quarter by quarter,
+forecasting every quarter from the quarters before it, and writes the
+errors to backtest.csv.  Returns the rows written.
+
+Arguments
+---------
+outdir    : string - Directory holding national.csv ... tract.csv
+window    : int - Quarters each series is fit to
+level     : float - Coverage of the intervals
+minTrain  : int - Fewest quarters before the first forecast quarter
+'''
+
+def backtest(outdir, window=defaultWindow, level=defaultLevel,
+             minTrain=defaultMinTrain):
+
+    store = hq.HUDStore(outdir)
+    rows = []
+
+    for levelName in ha.levels:
+        index = store.level(levelName)
+        geoids = np.array(sorted(index.offsets), dtype="U")
+        keys = index.quarters()
+
+        for name, column, rate in forecastSeries:
+            Y = seriesMatrix(index, geoids, column, rate)
+            for col in range(minTrain, len(keys)):
+                startTime = time.perf_counter()
+                result = seasonalForecast(Y[:, :col], keys[:col], window,
+                                          level)
+                seconds = time.perf_counter() - startTime
+
+                # the naive forecast:  the last value of each series
+                naive = pd.DataFrame(Y[:, :col]).ffill(axis=1).values[:, -1]
+
+                actual = Y[:, col]
+                scored = np.isfinite(actual) & np.isfinite(result["forecast"])
+                error = result["forecast"][scored] - actual[scored]
+                naiveScored = scored & np.isfinite(naive)
+                covered = scored & np.isfinite(result["lower"])
+                inside = (result["lower"][covered] <= actual[covered]) & \
+                    (actual[covered] <= result["upper"][covered])
+
+                def mean(values):
+                    return float(np.mean(values)) if len(values) else None
+
+                rows.append([levelName, hc.qtrLabel(*divmod(keys[col], 100)),
+                             name, int(scored.sum()),
+                             mean(np.abs(error)),
+                             math.sqrt(mean(error * error))
+                             if len(error) else None,
+                             mean(inside),
+                             mean(np.abs(naive[naiveScored] -
+                                         actual[naiveScored])),
+                             seconds])
+
+    outFile = open(os.path.join(outdir, "backtest.csv"), "w")
+    outWriter = ha.newWriter(outFile)
+    outWriter.writerow(backtestHeadings)
+    outWriter.writerows([value if value is not None else "" for value in row]
+                        for row in rows)
+    outFile.close()
+
+    return rows
+
+# ####################################################################
+'''
+backtestSummary
+
+This function: averages the backtest rows of every level and series
+over the quarters:  level, series, number of quarters, MAE, RMSE,
+coverage, naive MAE, and the total run time.
+
+Arguments
+---------
+rows  : list - Rows from backtest
+'''
+
+def backtestSummary(rows):
+
+    def mean(values):
+        values = [value for value in values if value is not None]
+        return float(np.mean(values)) if values else float("nan")
+
+    summary = []
+    for levelName in ha.levels:
+        for name, column, rate in forecastSeries:
+            scored = [row for row in rows if row[0] == levelName and
+                      row[2] == name and row[4] is not None]
+            if scored:
+                summary.append([levelName, name, len(scored)] +
+                               [mean(row[i] for row in scored)
+                                for i in range(4, 8)] +
+                               [sum(row[8] for row in scored)])
+
+    return summary
@@ -0,0 +1,655 @@
+# ####################################################################
+#
+# Program:  hudGeometry.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module writes light geometry for choropleth maps of the four
+# output levels, keyed by the same GEOIDs as national.csv ... tract.csv.
+# The full resolution tract shapefile which ships with the HUD .dbf is
+# too heavy to draw in the dashboard.
+#
+# The tract rings are first cut into arcs, as in TopoJSON:  the pieces
+# of boundary between junctions (vertices where three or more boundary
+# edges meet), so a boundary shared by two tracts is one arc.  Counties,
+# states and the nation are dissolved from the tracts by dropping the
+# arcs used twice within a group (the inner boundaries) and chaining the
+# rest into rings.  Each arc is simplified once (Douglas-Peucker), so
+# neighbors keep the same simplified boundary and no gaps or overlaps
+# open between them.  The Douglas-Peucker tolerance at which each vertex
+# goes is calculated once, for all arcs at once, so every tolerance is
+# then just a threshold.  Every arc keeps at least its farthest vertex
+# (two for a closed ring), so rings don't collapse.
+#
+# For each tolerance (in the units of the shapefile, degrees for the
+# Census shapefiles) it writes
+#
+#   <geoDir>/hud_<tolerance>.topojson        all four levels, quantized
+#   <geoDir>/<level>_<tolerance>.geojson     one file per level
+#
+# with the GEOID as the id of every feature.  The GeoJSON rings follow
+# RFC 7946 (outer rings counterclockwise), the TopoJSON rings the
+# shapefile (outer rings clockwise, as d3 expects).
+#
+# geometry.json in <geoDir> records the fingerprints of the .shp and
+# .dbf and the settings the files were written with, and the files are
+# only written again when one of them changes.
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import json
+from datetime import datetime
+import numpy as np
+import hudAggregate as ha
+import hudRevise as hr
+import hudSpatial as hsp
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# simplification tolerances (degrees:  about 10 m, 100 m and 1 km)
+defaultTolerances = [0.0001, 0.001, 0.01]
+
+# TopoJSON grid (points per side of the bounding box)
+defaultQuantize = 100000
+
+# decimals of the GeoJSON coordinates
+geojsonDigits = 6
+
+# length of the GEOID of each level (None:  the whole tract GEOID)
+geoidLengths = {"national": 0, "state": 2, "county": 5, "tract": None}
+
+# version of the geometry layout
+geometryVersion = 1
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+shapeRings
+
+This function: returns the rings of the polygons of a shapefile as
+sequences of vertex numbers (without the closing vertex), the record
+of every ring, and the coordinates of the vertices.  Vertices with the
+same coordinates get the same number.
+
+Arguments
+---------
+shpName  : string - .shp filename (or zip archive member)
+'''
+
+def shapeRings(shpName):
+
+    records, x, y, partStarts, numRecords = hsp.readShapes(shpName)
+    coords, vertices = np.unique(np.stack([x, y], axis=1), axis=0,
+                                 return_inverse=True)
+    vertices = vertices.ravel()
+
+    starts = np.flatnonzero(partStarts)
+    ends = np.r_[starts[1:], len(vertices)]
+
+    rings = []
+    ringRecords = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        ring = vertices[start:end]
+        if len(ring) > 1 and ring[0] == ring[-1]:
+            ring = ring[:-1]
+        ring = ring[np.r_[True, ring[1:] != ring[:-1]]]
+        if len(ring) > 1 and ring[0] == ring[-1]:
+            ring = ring[:-1]
+        if len(ring) >= 3:
+            rings.append(ring)
+            ringRecords.append(records[start])
+
+    return rings, np.array(ringRecords, dtype=np.int64), coords, numRecords
+
+# ####################################################################
+'''
+buildArcs
+
+This function: cuts the rings into arcs at the junctions, and returns
+the arcs (vertex numbers, first and last vertex are the junctions, or
+the same vertex for a ring without junctions) and every ring as a list
+of arc references (i for arc i, ~i for arc i reversed).
+
+Arguments
+---------
+rings        : list - Rings (vertex numbers, from shapeRings)
+numVertices  : int - Number of vertices
+'''
+
+def buildArcs(rings, numVertices):
+
+    # a junction is where three or more distinct edges meet
+    first = np.concatenate(rings)
+    second = np.concatenate([np.roll(ring, -1) for ring in rings])
+    edges = np.unique(np.minimum(first, second) * numVertices +
+                      np.maximum(first, second))
+    degree = np.bincount(np.r_[edges // numVertices, edges % numVertices],
+                         minlength=numVertices)
+    junction = degree >= 3
+
+    arcs = []
+    arcIndex = {}
+
+    def arcRef(arc):
+        key = arc.tobytes()
+        if key in arcIndex:
+            return arcIndex[key]
+        reverseKey = arc[::-1].tobytes()
+        if reverseKey in arcIndex:
+            return ~arcIndex[reverseKey]
+        arcIndex[key] = len(arcs)
+        arcs.append(arc)
+        return len(arcs) - 1
+
+    ringArcs = []
+    for ring in rings:
+        cuts = np.flatnonzero(junction[ring])
+        if len(cuts) == 0:
+            # a closed arc, starting at its lowest vertex, in the
+            # direction of the lower neighbor
+            ring = np.roll(ring, -int(ring.argmin()))
+            forward = ring[1] < ring[-1]
+            if not forward:
+                ring = np.r_[ring[0], ring[:0:-1]]
+            ref = arcRef(np.r_[ring, ring[0]])
+            ringArcs.append([ref if forward else ~ref])
+            continue
+
+        ring = np.r_[ring[cuts[0]:], ring[:cuts[0] + 1]]
+        cuts = np.r_[cuts - cuts[0], len(ring) - 1]
+        ringArcs.append([arcRef(ring[a:b + 1])
+                         for a, b in zip(cuts[:-1].tolist(),
+                                         cuts[1:].tolist())])
+
+    return arcs, ringArcs
+
+# ####################################################################
+'''
+segmentDistance
+
+This function: returns the distance of every point from the segment
+(a, b) it is paired with.
+
+Arguments
+---------
+p  : array - Points (n x 2)
+a  : array - Segment starts (n x 2)
+b  : array - Segment ends (n x 2)
+'''
+
+def segmentDistance(p, a, b):
+
+    ab = b - a
+    length2 = (ab ** 2).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.clip(((p - a) * ab).sum(axis=1) / length2, 0.0, 1.0)
+    t[length2 == 0] = 0.0
+
+    return np.sqrt(((a + t[:, None] * ab - p) ** 2).sum(axis=1))
+
+# ####################################################################
+'''
+arcThresholds
+
+This function: returns the Douglas-Peucker tolerance below which each
+vertex of the arcs is kept (inf for the vertices every arc keeps).  The
+arcs are processed together, one level of the Douglas-Peucker tree at a
+time.
+
+Arguments
+---------
+xy         : array - Vertices of all arcs, one arc after another
+arcStarts  : array - Offset of every arc in xy, and the total length
+'''
+
+def arcThresholds(xy, arcStarts):
+
+    thresholds = np.zeros(len(xy))
+    thresholds[arcStarts[:-1]] = np.inf
+    thresholds[arcStarts[1:] - 1] = np.inf
+
+    lo = arcStarts[:-1]
+    hi = arcStarts[1:] - 1
+    parent = np.full(len(lo), np.inf)
+    closed = (xy[lo] == xy[hi]).all(axis=1)
+
+    depth = 0
+    while True:
+        split = hi - lo >= 2
+        lo, hi, parent, closed = lo[split], hi[split], parent[split], \
+            closed[split]
+        if not len(lo):
+            break
+
+        # the interior points of every segment
+        counts = hi - lo - 1
+        offsets = np.cumsum(counts) - counts
+        segment = np.repeat(np.arange(len(lo)), counts)
+        points = np.arange(counts.sum()) - offsets[segment] + lo[segment] + 1
+
+        distance = segmentDistance(xy[points], xy[lo[segment]],
+                                   xy[hi[segment]])
+        farthest = np.maximum.reduceat(distance, offsets)
+        first = np.flatnonzero(distance == farthest[segment])
+        first = first[np.r_[True, segment[first][1:] !=
+                            segment[first][:-1]]]
+        k = points[first]
+
+        t = np.minimum(farthest, parent)
+        t[(depth == 0) | ((depth == 1) & closed)] = np.inf
+        thresholds[k] = t
+
+        lo, hi = np.r_[lo, k], np.r_[k, hi]
+        parent, closed = np.r_[t, t], np.r_[closed, closed]
+        depth += 1
+
+    return thresholds
+
+# ####################################################################
+'''
+ringArea
+
+This function: returns the signed area of a ring (negative when it is
+clockwise, as the outer rings of a shapefile).
+
+Arguments
+---------
+xy  : array - Ring vertices (n x 2)
+'''
+
+def ringArea(xy):
+
+    x, y = xy[:, 0], xy[:, 1]
+
+    return 0.5 * (np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+# ####################################################################
+'''
+insideRing
+
+This function: returns True if a point is inside a ring (even-odd
+rule).
+
+Arguments
+---------
+point  : array - Point (x, y)
+xy     : array - Ring vertices (n x 2)
+'''
+
+def insideRing(point, xy):
+
+    x0, y0 = xy[:, 0], xy[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    crosses = (y0 > point[1]) != (y1 > point[1])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        xCross = x0 + (point[1] - y0) * (x1 - x0) / (y1 - y0)
+
+    return bool(np.count_nonzero(crosses & (point[0] < xCross)) % 2)
+
+# ####################################################################
+'''
+GeometryTopology
+
+This class: the arcs of a tract shapefile, and the features of every
+level as polygons of arc references.
+
+Arguments
+---------
+shpName  : string - .shp filename (or zip archive member)
+'''
+
+class GeometryTopology(object):
+
+    def __init__(self, shpName):
+
+        rings, ringRecords, self.coords, numRecords = shapeRings(shpName)
+        geoids = hsp.shapeGEOIDs(hsp.dbfFor(shpName))
+        if len(geoids) != numRecords:
+            raise ValueError("%s has %i shapes but %i records" %
+                             (shpName, numRecords, len(geoids)))
+        if not rings:
+            raise ValueError("%s has no polygons" % (shpName))
+
+        arcs, self.ringArcs = buildArcs(rings, len(self.coords))
+        self.arcStarts = np.r_[0, np.cumsum([len(arc) for arc in arcs])]
+        self.arcVertices = np.concatenate(arcs)
+        self.thresholds = arcThresholds(self.coords[self.arcVertices],
+                                        self.arcStarts)
+        self.ringGEOIDs = geoids[ringRecords]
+
+        self.features = {}
+        for level in ha.levels:
+            self.features[level] = self.dissolve(level)
+
+    # ----------------------------------------------------------------
+
+    def refVertices(self, ref):
+
+        arc = self.arcVertices[self.arcStarts[max(ref, ~ref)]:
+                               self.arcStarts[max(ref, ~ref) + 1]]
+        return arc if ref >= 0 else arc[::-1]
+
+    def ringCoords(self, refs):
+
+        return self.coords[np.concatenate([self.refVertices(ref)[1:]
+                                           for ref in refs])]
+
+    # ----------------------------------------------------------------
+
+    def dissolve(self, level):
+
+        length = geoidLengths[level]
+        if length is None:
+            keys = self.ringGEOIDs
+        elif length == 0:
+            keys = np.full(len(self.ringGEOIDs), ha.nationalGEOID)
+        else:
+            keys = self.ringGEOIDs.astype("U%i" % (length))
+        groups, ringGroups = np.unique(keys, return_inverse=True)
+        ringGroups = ringGroups.ravel()
+
+        # the arcs used twice within a group are inner boundaries
+        refs = np.array([ref for refs in self.ringArcs for ref in refs],
+                        dtype=np.int64)
+        refGroups = np.repeat(ringGroups, [len(refs) for refs in
+                                           self.ringArcs])
+        arcs = np.where(refs >= 0, refs, ~refs)
+        numArcs = len(self.arcStarts) - 1
+        pairs, pairIndex, counts = np.unique(refGroups * numArcs + arcs,
+                                             return_inverse=True,
+                                             return_counts=True)
+        outer = counts[pairIndex.ravel()] == 1
+
+        features = []
+        order = np.argsort(refGroups, kind="mergesort")
+        bounds = np.r_[0, np.cumsum(np.bincount(refGroups,
+                                                minlength=len(groups)))]
+        ringOrder = np.argsort(ringGroups, kind="mergesort")
+        ringBounds = np.r_[0, np.cumsum(np.bincount(ringGroups,
+                                                    minlength=len(groups)))]
+        for g, geoid in enumerate(groups.tolist()):
+            members = order[bounds[g]:bounds[g + 1]]
+            if outer[members].all():
+                rings = [self.ringArcs[r] for r in
+                         ringOrder[ringBounds[g]:ringBounds[g + 1]]]
+            else:
+                rings = self.chainRings(refs[members[outer[members]]]
+                                        .tolist())
+            if rings:
+                features.append((geoid, self.polygons(rings)))
+
+        return features
+
+    def chainRings(self, refs):
+
+        def start(ref):
+            return self.refVertices(ref)[0]
+
+        def end(ref):
+            return self.refVertices(ref)[-1]
+
+        outgoing = {}
+        for ref in refs:
+            outgoing.setdefault(start(ref), []).append(ref)
+
+        used = set()
+        rings = []
+        for ref in refs:
+            if ref in used:
+                continue
+            used.add(ref)
+            ring = [ref]
+            first, vertex = start(ref), end(ref)
+            while vertex != first:
+                candidates = [r for r in outgoing.get(vertex, [])
+                              if r not in used]
+                if not candidates:
+                    break
+                used.add(candidates[0])
+                ring.append(candidates[0])
+                vertex = end(candidates[0])
+            if vertex == first:
+                rings.append(ring)
+
+        return rings
+
+    def polygons(self, rings):
+
+        # outer rings are clockwise (negative area), holes counterclockwise
+        coords = [self.ringCoords(ring) for ring in rings]
+        areas = [ringArea(xy) for xy in coords]
+        outers = [i for i, area in enumerate(areas) if area <= 0]
+        polygons = dict((i, [rings[i]]) for i in outers)
+
+        for i, area in enumerate(areas):
+            if area <= 0:
+                continue
+            owners = [j for j in outers if -areas[j] > area and
+                      insideRing(coords[i][0], coords[j])]
+            if owners:
+                polygons[min(owners, key=lambda j: -areas[j])].append(
+                    rings[i])
+            else:
+                polygons[i] = [[~ref for ref in reversed(rings[i])]]
+
+        return [polygons[i] for i in sorted(polygons)]
+
+    # ----------------------------------------------------------------
+
+    def simplifiedArcs(self, tolerance):
+
+        keep = self.thresholds >= tolerance
+        xy = self.coords[self.arcVertices[keep]]
+        counts = np.add.reduceat(keep, self.arcStarts[:-1])
+
+        return np.split(xy, np.cumsum(counts)[:-1])
+
+    def bbox(self):
+
+        return self.coords.min(axis=0).tolist() + \
+            self.coords.max(axis=0).tolist()
+
+# ####################################################################
+'''
+topologyDocument
+
+This function: returns the TopoJSON of all levels at one tolerance,
+with quantized, delta encoded arcs.
+
+Arguments
+---------
+topology   : GeometryTopology - Arcs and features
+tolerance  : float - Simplification tolerance
+quantize   : int - Points per side of the quantization grid
+'''
+
+def topologyDocument(topology, tolerance, quantize):
+
+    bbox = topology.bbox()
+    translate = np.array(bbox[:2])
+    scale = (np.array(bbox[2:]) - translate) / max(quantize - 1, 1)
+    scale[scale == 0] = 1.0
+
+    arcs = []
+    for xy in topology.simplifiedArcs(tolerance):
+        q = np.round((xy - translate) / scale).astype(np.int64)
+        keep = np.r_[True, (q[1:] != q[:-1]).any(axis=1)]
+        keep[-1] = True
+        q = q[keep]
+        arcs.append(np.r_[q[:1], np.diff(q, axis=0)].tolist())
+
+    def geometry(geoid, polygons):
+        if len(polygons) == 1:
+            return {"type": "Polygon", "id": geoid, "arcs": polygons[0]}
+        return {"type": "MultiPolygon", "id": geoid, "arcs": polygons}
+
+    return {"type": "Topology",
+            "bbox": bbox,
+            "transform": {"scale": scale.tolist(),
+                          "translate": translate.tolist()},
+            "objects": {level: {"type": "GeometryCollection",
+                                "geometries": [geometry(*feature) for
+                                               feature in features]}
+                        for level, features in topology.features.items()},
+            "arcs": arcs}
+
+# ####################################################################
+'''
+geojsonDocument
+
+This function: returns the GeoJSON of one level at one tolerance.
+
+Arguments
+---------
+topology   : GeometryTopology - Arcs and features
+level      : string - Level name
+arcs       : list - Simplified arcs (from simplifiedArcs)
+'''
+
+def geojsonDocument(topology, level, arcs):
+
+    def ring(refs):
+        # RFC 7946:  outer rings counterclockwise
+        points = []
+        for ref in reversed(refs):
+            xy = arcs[ref][::-1] if ref >= 0 else arcs[~ref]
+            points.extend(xy[1:] if points else xy)
+        return points
+
+    features = []
+    for geoid, polygons in topology.features[level]:
+        coordinates = [[ring(refs) for refs in polygon]
+                       for polygon in polygons]
+        if len(coordinates) == 1:
+            geometry = {"type": "Polygon", "coordinates": coordinates[0]}
+        else:
+            geometry = {"type": "MultiPolygon", "coordinates": coordinates}
+        features.append({"type": "Feature", "id": geoid,
+                         "properties": {"GEOID": geoid},
+                         "geometry": geometry})
+
+    return {"type": "FeatureCollection", "features": features}
+
+# ####################################################################
+'''
+toleranceLabel
+
+This function: returns the label of a tolerance in the file names.
+
+Arguments
+---------
+tolerance  : float - Simplification tolerance
+'''
+
+def toleranceLabel(tolerance):
+
+    return "%g" % (tolerance)
+
+# ####################################################################
+'''
+writeJSON
+
+This function: writes a document through a temporary file, so a
+reader never sees half of it.
+
+Arguments
+---------
+document  : dictionary - Document
+fileName  : string - Output filename
+'''
+
+def writeJSON(document, fileName):
+
+    with open(fileName + ".tmp", "w") as outFile:
+        json.dump(document, outFile, separators=(",", ":"))
+    os.replace(fileName + ".tmp", fileName)
+
+# ####################################################################
+'''
+writeGeometry
+
+This function: writes the simplified geometry of every level and
+tolerance to geoDir, unless the files there were written from the same
+shapefile with the same settings.  Returns the manifest, with "cached"
+True if nothing had to be written.
+
+Arguments
+---------
+shpName     : string - Tract .shp filename (or zip archive member)
+geoDir      : string - Directory for the geometry
+tolerances  : list - Simplification tolerances
+quantize    : int - Points per side of the TopoJSON grid
+force       : boolean - Write the files even if they are up to date
+'''
+
+def writeGeometry(shpName, geoDir, tolerances=defaultTolerances,
+                  quantize=defaultQuantize, force=False):
+
+    if not os.path.isdir(geoDir):
+        os.makedirs(geoDir)
+    manifestName = os.path.join(geoDir, "geometry.json")
+
+    settings = {"version": geometryVersion,
+                "fingerprints": {"shp": hr.fingerprint(shpName),
+                                 "dbf": hr.fingerprint(hsp.dbfFor(shpName))},
+                "tolerances": sorted(tolerances),
+                "quantize": quantize,
+                "digits": geojsonDigits}
+
+    previous = {}
+    if os.path.exists(manifestName):
+        with open(manifestName) as inFile:
+            previous = json.load(inFile)
+    if not force and all(previous.get(key) == value
+                         for key, value in settings.items()) and \
+            all(os.path.exists(os.path.join(geoDir, fileName))
+                for fileName in previous.get("files", [])):
+        previous["cached"] = True
+        return previous
+
+    topology = GeometryTopology(shpName)
+
+    files = []
+    for tolerance in settings["tolerances"]:
+        label = toleranceLabel(tolerance)
+        fileName = "hud_%s.topojson" % (label)
+        writeJSON(topologyDocument(topology, tolerance, quantize),
+                  os.path.join(geoDir, fileName))
+        files.append(fileName)
+
+        arcs = [np.round(xy, geojsonDigits).tolist()
+                for xy in topology.simplifiedArcs(tolerance)]
+        for level in ha.levels:
+            fileName = "%s_%s.geojson" % (level, label)
+            writeJSON(geojsonDocument(topology, level, arcs),
+                      os.path.join(geoDir, fileName))
+            files.append(fileName)
+
+    # files of tolerances no longer written
+    for fileName in previous.get("files", []):
+        if fileName not in files and \
+                os.path.exists(os.path.join(geoDir, fileName)):
+            os.remove(os.path.join(geoDir, fileName))
+
+    manifest = dict(settings)
+    manifest.update({"created": str(datetime.now()),
+                     "shapefile": shpName,
+                     "arcs": len(topology.arcStarts) - 1,
+                     "features": {level: len(features) for level, features
+                                  in topology.features.items()},
+                     "files": files})
+    writeJSON(manifest, manifestName)
+    manifest["cached"] = False
+
+    return manifest
@@ -0,0 +1,454 @@
+# ####################################################################
+#
+# Program:  hudLocate.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module finds the tract of a point (for example the coordinates
+# of a property), so a list of points can be joined to tract.csv by
+# GEOID.
+#
+# The index is built from the tract shapefile which ships with the HUD
+# .dbf, in two parts:
+#
+# - an STR-tree (sort-tile-recursive, bulk loaded) over the bounding
+#   boxes of the tract rings, which gives the few rings a point may be
+#   in
+# - the edges of every ring, filed in horizontal bands, so the
+#   point-in-ring test (even-odd rule) only looks at the edges of the
+#   band the point is in
+#
+# A point is in a tract if it is inside an odd number of the tract's
+# rings (so holes are handled).  A point on the boundary of two tracts
+# goes to the first in the shapefile, and a point in no tract gets an
+# empty GEOID.
+#
+# Queries are batched:  the points of a batch go down the tree together,
+# one level at a time, as arrays of (point, node) pairs, and the edge
+# tests of all candidate rings are one vectorized calculation.
+#
+# The index is saved as .npz next to the outputs, keyed on the sizes
+# and modification times of the shapefile and its .dbf (the same key as
+# the contiguity weights, see shapefileKey in hudSpatial.py), and
+# reloaded from there.
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import numpy as np
+import pandas as pd
+import hudAggregate as ha
+import hudQuery as hq
+import hudSpatial as hsp
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# entries per node of the STR-tree
+nodeCapacity = 16
+
+# edges per band of a ring (on average)
+bandEdges = 8
+
+# points per query batch
+defaultBatch = 1 << 17
+
+# version of the index layout
+locatorVersion = 1
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+strOrder
+
+This function: returns the sort-tile-recursive order of a set of boxes:
+sorted into vertical slices by the x of their centers, and by the y of
+their centers within a slice.
+
+Arguments
+---------
+boxes     : array - Boxes (n x 4:  xmin, ymin, xmax, ymax)
+capacity  : int - Entries per node
+'''
+
+def strOrder(boxes, capacity=nodeCapacity):
+
+    numNodes = int(np.ceil(len(boxes) / capacity))
+    sliceSize = int(np.ceil(np.sqrt(numNodes))) * capacity
+
+    cx = boxes[:, 0] + boxes[:, 2]
+    cy = boxes[:, 1] + boxes[:, 3]
+    byX = np.argsort(cx, kind="mergesort")
+    slices = np.empty(len(boxes), dtype=np.int64)
+    slices[byX] = np.arange(len(boxes)) // sliceSize
+
+    return np.lexsort((cy, slices))
+
+# ####################################################################
+'''
+packTree
+
+This function: bulk loads an STR-tree over the boxes, and returns its
+levels from the leaves up:  the boxes of the entries of every level,
+with the first child and the number of children of each entry (in the
+level below) for the levels above the leaves, and the order of the
+leaf entries.
+
+Arguments
+---------
+boxes     : array - Boxes (n x 4:  xmin, ymin, xmax, ymax)
+capacity  : int - Entries per node
+'''
+
+def packTree(boxes, capacity=nodeCapacity):
+
+    leafOrder = strOrder(boxes, capacity)
+    levels = [{"boxes": boxes[leafOrder]}]
+
+    while len(levels[-1]["boxes"]) > capacity:
+        below = levels[-1]["boxes"]
+        starts = np.arange(0, len(below), capacity)
+        nodes = np.stack([np.minimum.reduceat(below[:, 0], starts),
+                          np.minimum.reduceat(below[:, 1], starts),
+                          np.maximum.reduceat(below[:, 2], starts),
+                          np.maximum.reduceat(below[:, 3], starts)],
+                         axis=1)
+        counts = np.diff(np.r_[starts, len(below)])
+
+        order = strOrder(nodes, capacity)
+        levels.append({"boxes": nodes[order],
+                       "childStart": starts[order],
+                       "childCount": counts[order]})
+
+    return levels, leafOrder
+
+# ####################################################################
+'''
+buildLocator
+
+This function: builds the point-in-tract index of a shapefile, as a
+dictionary of arrays (see saveLocator).
+
+Arguments
+---------
+shpName  : string - .shp filename (or zip archive member)
+'''
+
+def buildLocator(shpName):
+
+    records, x, y, partStarts, numRecords = hsp.readShapes(shpName)
+    geoids = hsp.shapeGEOIDs(hsp.dbfFor(shpName))
+    if len(geoids) != numRecords:
+        raise ValueError("%s has %i shapes but %i records" %
+                         (shpName, numRecords, len(geoids)))
+    if not len(x):
+        raise ValueError("%s has no polygons" % (shpName))
+
+    # rings, and their edges (point i to point i + 1 of the same ring)
+    ringStarts = np.flatnonzero(partStarts)
+    ringOf = np.cumsum(partStarts) - 1
+    ringRecords = records[ringStarts]
+    edges = np.flatnonzero(ringOf[:-1] == ringOf[1:])
+    edgeRings = ringOf[edges]
+
+    boxes = np.stack([np.minimum.reduceat(x, ringStarts),
+                      np.minimum.reduceat(y, ringStarts),
+                      np.maximum.reduceat(x, ringStarts),
+                      np.maximum.reduceat(y, ringStarts)], axis=1)
+
+    # the bands of every ring
+    numEdges = np.bincount(edgeRings, minlength=len(ringStarts))
+    numBands = np.maximum(1, numEdges // bandEdges)
+    bandBase = np.r_[0, np.cumsum(numBands)[:-1]]
+    height = (boxes[:, 3] - boxes[:, 1]) / numBands
+    height[height == 0] = 1.0
+
+    # every edge in each band it crosses
+    y0, y1 = y[edges], y[edges + 1]
+    low = np.floor((np.minimum(y0, y1) - boxes[edgeRings, 1]) /
+                   height[edgeRings]).astype(np.int64)
+    high = np.floor((np.maximum(y0, y1) - boxes[edgeRings, 1]) /
+                    height[edgeRings]).astype(np.int64)
+    low = np.clip(low, 0, numBands[edgeRings] - 1)
+    high = np.clip(high, 0, numBands[edgeRings] - 1)
+    copies = high - low + 1
+    copyEdges = np.repeat(edges, copies)
+    bands = np.repeat(bandBase[edgeRings] + low, copies) + \
+        np.arange(copies.sum()) - np.repeat(np.cumsum(copies) - copies,
+                                            copies)
+    order = np.argsort(bands, kind="mergesort")
+    bandPtr = np.r_[0, np.cumsum(np.bincount(bands,
+                                             minlength=numBands.sum()))]
+
+    levels, leafOrder = packTree(boxes)
+
+    locator = {"x": x, "y": y, "geoids": geoids,
+               "ringRecords": ringRecords, "ringBoxes": boxes,
+               "bandBase": bandBase, "numBands": numBands,
+               "bandHeight": height, "bandPtr": bandPtr,
+               "bandEdges": copyEdges[order], "leafOrder": leafOrder,
+               "numLevels": np.array(len(levels))}
+    for i, level in enumerate(levels):
+        for name, values in level.items():
+            locator["%s%i" % (name, i)] = values
+
+    return locator
+
+# ####################################################################
+'''
+loadLocator
+
+This function: returns the point-in-tract index of a shapefile,
+reading it from the cache directory if it was built before.
+
+Arguments
+---------
+shpName   : string - .shp filename (or zip archive member)
+cacheDir  : string - Directory for the saved index
+'''
+
+def loadLocator(shpName, cacheDir):
+
+    key = hsp.shapefileKey(shpName, locatorVersion)
+    cacheName = os.path.join(cacheDir, "locator_%s.npz" % (key[:16]))
+
+    if os.path.exists(cacheName):
+        with np.load(cacheName, allow_pickle=False) as cached:
+            locator = dict(cached.items())
+        locator["cache"] = cacheName
+        return locator
+
+    locator = buildLocator(shpName)
+    if not os.path.isdir(cacheDir):
+        os.makedirs(cacheDir)
+    tmpName = cacheName[:-len(".npz")] + ".tmp.npz"
+    np.savez(tmpName, **locator)
+    os.replace(tmpName, cacheName)
+    locator["cache"] = cacheName
+
+    return locator
+
+# ####################################################################
+'''
+expandPairs
+
+This function: returns, for (point, entry) pairs, the pairs of every
+point with every child of its entry.
+
+Arguments
+---------
+points  : array - Point of every pair
+starts  : array - First child of the entry of every pair
+counts  : array - Number of children of the entry of every pair
+'''
+
+def expandPairs(points, starts, counts):
+
+    offsets = np.cumsum(counts) - counts
+    children = np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+    return np.repeat(points, counts), children
+
+# ####################################################################
+'''
+candidateRings
+
+This function: returns the (point, ring) pairs where the point is in
+the bounding box of the ring, by going down the STR-tree.
+
+Arguments
+---------
+locator  : dictionary - Point-in-tract index
+px       : array - Point x
+py       : array - Point y
+'''
+
+def candidateRings(locator, px, py):
+
+    def inside(boxes, points, entries):
+        box = boxes[entries]
+        x, y = px[points], py[points]
+        keep = box[:, 0] <= x
+        keep &= x <= box[:, 2]
+        keep &= box[:, 1] <= y
+        keep &= y <= box[:, 3]
+        return keep
+
+    top = int(locator["numLevels"]) - 1
+    numTop = len(locator["boxes%i" % (top)])
+    points = np.repeat(np.arange(len(px)), numTop)
+    entries = np.tile(np.arange(numTop), len(px))
+
+    for level in range(top, -1, -1):
+        keep = inside(locator["boxes%i" % (level)], points, entries)
+        points, entries = points[keep], entries[keep]
+        if level > 0:
+            points, entries = expandPairs(
+                points, locator["childStart%i" % (level)][entries],
+                locator["childCount%i" % (level)][entries])
+
+    return points, locator["leafOrder"][entries]
+
+# ####################################################################
+'''
+locatePoints
+
+This function: returns the GEOID of the tract of every point (empty
+where the point isn't in a tract), in batches.
+
+Arguments
+---------
+locator  : dictionary - Point-in-tract index
+px       : array - Point x (longitude)
+py       : array - Point y (latitude)
+batch    : int - Points per batch
+'''
+
+def locatePoints(locator, px, py, batch=defaultBatch):
+
+    px = np.asarray(px, dtype=float)
+    py = np.asarray(py, dtype=float)
+    found = np.full(len(px), -1, dtype=np.int64)
+
+    x, y = locator["x"], locator["y"]
+    numRecords = len(locator["geoids"])
+
+    for first in range(0, len(px), batch):
+        bx, by = px[first:first + batch], py[first:first + batch]
+        points, rings = candidateRings(locator, bx, by)
+
+        # the band of each candidate ring the point is in
+        band = np.floor((by[points] - locator["ringBoxes"][rings, 1]) /
+                        locator["bandHeight"][rings]).astype(np.int64)
+        band = locator["bandBase"][rings] + \
+            np.clip(band, 0, locator["numBands"][rings] - 1)
+        starts = locator["bandPtr"][band]
+        counts = locator["bandPtr"][band + 1] - starts
+        pairs, edges = expandPairs(np.arange(len(points)), starts, counts)
+        edges = locator["bandEdges"][edges]
+
+        # the edges crossed by a ray from the point to the right
+        ex, ey = bx[points[pairs]], by[points[pairs]]
+        x0, y0, x1, y1 = x[edges], y[edges], x[edges + 1], y[edges + 1]
+        crosses = (y0 > ey) != (y1 > ey)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            crosses &= ex < x0 + (ey - y0) * (x1 - x0) / (y1 - y0)
+        inRing = np.bincount(pairs[crosses], minlength=len(points)) % 2 == 1
+
+        # inside an odd number of the rings of a record
+        keys = points[inRing] * numRecords + \
+            locator["ringRecords"][rings[inRing]]
+        keys, numRings = np.unique(keys, return_counts=True)
+        keys = keys[numRings % 2 == 1]
+        hits, hitRecords = keys // numRecords, keys % numRecords
+
+        # the first record of each point (keys are sorted)
+        hits, firstHit = np.unique(hits, return_index=True)
+        found[first + hits] = hitRecords[firstHit]
+
+    geoids = np.where(found >= 0, locator["geoids"][np.maximum(found, 0)],
+                      "")
+
+    return geoids
+
+# ####################################################################
+'''
+tractTable
+
+This function: returns the rows of tract.csv (all quarters) as a data
+frame of the GEOID, Month/Year and metric columns.
+
+Arguments
+---------
+outdir  : string - Directory holding tract.csv
+'''
+
+def tractTable(outdir):
+
+    index = hq.HUDStore(outdir).level("tract")
+    tracts = pd.DataFrame(index.values, columns=hq.metricCols)
+    tracts.insert(0, "Month/Year", index.labels)
+    tracts.insert(0, "GEOID", index.geoids)
+
+    return tracts
+
+# ####################################################################
+'''
+tractHistory
+
+This function: returns the tract rows (all quarters) of located
+points:  the point columns, then the Month/Year and metric columns of
+tract.csv.  Points without a tract are left out.
+
+Arguments
+---------
+points  : data frame - Points, with a GEOID column
+tracts  : data frame - Tract rows (see tractTable)
+'''
+
+def tractHistory(points, tracts):
+
+    return points.merge(tracts, on="GEOID", how="inner", sort=False)
+
+# ####################################################################
+'''
+locateFile
+
+This function: adds the tract GEOID to every point of a .csv file,
+reading it in chunks, and writes the result (with the tract rows of
+every quarter when outdir is given, see tractHistory).  The output is
+written to a temporary file, renamed to outName when complete (and
+removed on an error).  Returns the number of points read and located.
+
+Arguments
+---------
+locator     : dictionary - Point-in-tract index
+pointsName  : string - .csv file of points
+outName     : string - Output .csv file
+xCol        : string - Column of the x (longitude) of the points
+yCol        : string - Column of the y (latitude) of the points
+outdir      : string - Directory holding tract.csv (None:  GEOIDs only)
+chunkSize   : int - Points read at a time
+'''
+
+def locateFile(locator, pointsName, outName, xCol="longitude",
+               yCol="latitude", outdir=None, chunkSize=1000000):
+
+    counts = {"points": 0, "located": 0}
+    tracts = tractTable(outdir) if outdir is not None else None
+
+    tmpName = outName + ".tmp"
+    outFile = open(tmpName, "w", newline="")
+    outWriter = ha.newWriter(outFile)
+    try:
+        for chunk in pd.read_csv(pointsName, chunksize=chunkSize):
+            if xCol not in chunk.columns or yCol not in chunk.columns:
+                raise ValueError("%s has no %s and %s columns" %
+                                 (pointsName, xCol, yCol))
+            chunk["GEOID"] = locatePoints(locator, chunk[xCol].values,
+                                          chunk[yCol].values)
+            counts["points"] += len(chunk)
+            counts["located"] += int((chunk["GEOID"] != "").sum())
+            if tracts is not None:
+                chunk = tractHistory(chunk, tracts)
+
+            if outFile.tell() == 0:
+                outWriter.writerow(list(chunk.columns))
+            outWriter.writerows(chunk.itertuples(index=False, name=None))
+    except Exception:
+        outFile.close()
+        os.remove(tmpName)
+        raise
+    outFile.close()
+    os.replace(tmpName, outName)
+
+    return counts
@@ -0,0 +1,232 @@
+# ####################################################################
+#
+# Program:  hudLong.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module writes the four output files of
+# ProcessHUDfilesForVizWithFnV7.py as a single long (tidy) file with
+# one schema for every level:
+#
+#   level, GEOID, quarter, AMS_RES, RES_VAC, AVG_VAC_R, VAC_3_RES, ...
+#
+# where quarter is a sortable period ("2015-03"), and the metric
+# columns have the HUD names instead of the totalAll..., totalState...
+# names of the separate files and the R code.
+#
+# The rows are sorted by level (national, state, county, tract), then
+# GEOID, then quarter, so the series of a GEOID is one run of lines.
+# A sidecar index (<file>.idx.json) holds the byte offset, length and
+# number of rows of every (level, GEOID), and readSeries() reads a
+# series with a single seek.
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import io
+import os
+import json
+import numpy as np
+import pandas as pd
+import hudAggregate as ha
+import hudQuery as hq
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+longHeadings = ["level", "GEOID", "quarter"] + ha.valueCols
+
+defaultLongName = "hud_long.csv"
+
+# version of the index layout
+indexVersion = 1
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+indexName
+
+This function: returns the sidecar index filename of a long file.
+
+Arguments
+---------
+fileName  : string - Long output filename
+'''
+
+def indexName(fileName):
+
+    return fileName + ".idx.json"
+
+# ####################################################################
+'''
+periodLabel
+
+This function: returns the sortable period of a quarter, e.g.
+"2015-03", from its YYYYMM key (see hudQuery.qtrKey).
+
+Arguments
+---------
+key  : int - Quarter as YYYYMM
+'''
+
+def periodLabel(key):
+
+    return "%04d-%02d" % divmod(key, 100)
+
+# ####################################################################
+'''
+levelRows
+
+This function: returns the long rows of one level, in GEOID and
+quarter order.  Counts which are whole numbers are written as
+integers.
+
+Arguments
+---------
+level  : string - Level name
+index  : LevelIndex - Rows of the level (see hudQuery)
+'''
+
+def levelRows(level, index):
+
+    columns = []
+    for i in range(index.values.shape[1]):
+        values = index.values[:, i]
+        if np.isfinite(values).all() and (values == np.round(values)).all():
+            values = values.astype(np.int64)
+        columns.append(values.tolist())
+
+    periods = dict((key, periodLabel(key)) for key in index.quarters())
+
+    return [[level, geoid, periods[key]] + list(values)
+            for geoid, key, values in zip(index.geoids.tolist(),
+                                          index.keys.tolist(),
+                                          zip(*columns))]
+
+# ####################################################################
+'''
+writeLong
+
+This function: writes the long file and its sidecar index from the
+output files in outdir, and returns the number of rows written per
+level.
+
+Arguments
+---------
+outdir    : string - Directory holding national.csv ... tract.csv
+fileName  : string - Long output filename (default hud_long.csv in
+            outdir)
+'''
+
+def writeLong(outdir, fileName=None):
+
+    if fileName is None:
+        fileName = os.path.join(outdir, defaultLongName)
+
+    store = hq.HUDStore(outdir)
+    index = {}
+    numRows = {}
+
+    tmpName = fileName + ".tmp"
+    with open(tmpName, "w", newline="") as outFile:
+        offset = outFile.write(ha.formatRows([longHeadings]))
+
+        for level in ha.levels:
+            levelIndex = store.level(level)
+            text = ha.formatRows(levelRows(level, levelIndex))
+            outFile.write(text)
+
+            # byte offset of every line (the text is ASCII)
+            lineEnds = offset + np.cumsum([len(line) for line in
+                                           text.splitlines(True)])
+            lineStarts = np.r_[offset, lineEnds[:-1]]
+            index[level] = {}
+            for geoid, (start, end) in levelIndex.offsets.items():
+                index[level][geoid] = [int(lineStarts[start]),
+                                       int(lineEnds[end - 1] -
+                                           lineStarts[start]),
+                                       end - start]
+
+            offset += len(text)
+            numRows[level] = len(levelIndex.geoids)
+
+    os.replace(tmpName, fileName)
+
+    stat = os.stat(fileName)
+    with open(indexName(fileName) + ".tmp", "w") as outFile:
+        json.dump({"version": indexVersion,
+                   "size": stat.st_size,
+                   "mtime": stat.st_mtime,
+                   "columns": longHeadings,
+                   "index": index}, outFile, separators=(",", ":"))
+    os.replace(indexName(fileName) + ".tmp", indexName(fileName))
+
+    return numRows
+
+# ####################################################################
+'''
+loadIndex
+
+This function: reads the sidecar index of a long file.  Raises
+ValueError if the long file has changed since the index was written.
+
+Arguments
+---------
+fileName  : string - Long output filename
+'''
+
+def loadIndex(fileName):
+
+    with open(indexName(fileName)) as inFile:
+        index = json.load(inFile)
+
+    stat = os.stat(fileName)
+    if (index.get("version") != indexVersion or
+            index["size"] != stat.st_size or index["mtime"] != stat.st_mtime):
+        raise ValueError("the index of %s is out of date, run the long "
+                         "command again" % (fileName))
+
+    return index
+
+# ####################################################################
+'''
+readSeries
+
+This function: reads the series of one (level, GEOID) from a long
+file with a single seek, as a data frame with the long columns.
+Returns an empty data frame for a GEOID which isn't in the file.
+
+Arguments
+---------
+fileName  : string - Long output filename
+level     : string - Level name
+geoid     : string - GEOID
+index     : dictionary - Index from loadIndex (read if not given)
+'''
+
+def readSeries(fileName, level, geoid, index=None):
+
+    if index is None:
+        index = loadIndex(fileName)
+
+    entry = index["index"].get(level, {}).get(str(geoid))
+    if entry is None:
+        return pd.DataFrame(columns=index["columns"])
+
+    offset, length, rows = entry
+    with open(fileName, "rb") as inFile:
+        inFile.seek(offset)
+        text = inFile.read(length).decode("ascii")
+
+    return pd.read_csv(io.StringIO(text), header=None,
+                       names=index["columns"],
+                       dtype={"level": str, "GEOID": str, "quarter": str},
+                       float_precision="round_trip")
@@ -0,0 +1,228 @@
+# ####################################################################
+#
+# Program:  hudMetrics.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module records how long each stage of a run takes, so that we
+# can see where a slow quarterly run spent its time and compare runs.
+#
+# For every file and stage (read, decode, aggregate, and one writer
+# per output level) it records:
+#
+# - wall time and CPU time (seconds)
+# - records processed and records per second
+# - bytes read and bytes written (encoded as UTF-8, before any
+#   compression)
+# - peak resident memory of the process so far (MB)
+#
+# Each measurement is written as one JSON object per line, and a
+# summary by stage is printed (and written as a final JSON line) at
+# the end of the run.
+#
+# Note:  the CPU time of a stage is that of the thread which ran it
+# (time.thread_time), so the prefetch and writer threads of the
+# pipelined mode don't count towards each other's stages.  On Python
+# 3.6, which has no thread clock, it is the CPU time of the whole
+# process.  Work done by other processes is added by the stage itself
+# (workerCPU, e.g. the CPU time the worker processes report for the
+# summaries of the aggregate stage).  The run total is the CPU time of
+# this process (all threads) plus that of the workers.
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource     # not available on Windows
+except ImportError:
+    resource = None
+
+try:
+    import psutil       # optional, used for peak memory on Windows
+except ImportError:
+    psutil = None
+
+# CPU clock of the current thread (of the process before Python 3.7)
+stageClock = getattr(time, "thread_time", time.process_time)
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+peakRSS
+
+This function: returns the peak resident memory of this process in
+MB, or None if it can't be determined on this platform.
+'''
+
+def peakRSS():
+
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KB elsewhere
+        if sys.platform == "darwin":
+            return peak / (1024.0 * 1024.0)
+        return peak / 1024.0
+
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        peak = getattr(info, "peak_wset", info.rss)
+        return peak / (1024.0 * 1024.0)
+
+    return None
+
+# ####################################################################
+'''
+textBytes
+
+This function: returns the number of bytes of text written as UTF-8.
+
+Arguments
+---------
+text  : string - Text
+'''
+
+def textBytes(text):
+
+    return len(text.encode("utf-8"))
+
+# ####################################################################
+'''
+RunMetrics
+
+This class: collects the stage measurements of a run.  It is safe to
+use from the prefetch and writer threads of the pipelined mode.
+
+stage() is a context manager which measures one stage of one file.
+The caller can fill in the number of records and bytes, and the CPU
+time of work done in other processes (workerCPU), in the dictionary it
+yields, e.g.
+
+    with metrics.stage(myFile, "read") as m:
+        df = readFile(myFile)
+        m["records"] = len(df)
+
+close() prints the summary by stage, writes it as the last JSON line
+and returns it.
+
+Arguments
+---------
+fileName  : string - JSON lines output file (or None to keep the
+            measurements in memory only)
+'''
+
+class RunMetrics(object):
+
+    def __init__(self, fileName=None):
+
+        self.records = []
+        self.lock = threading.Lock()
+        self.startWall = time.time()
+        self.startCPU = time.process_time()
+        self.workerCPU = 0.0
+        self.outFile = open(fileName, "w") if fileName else None
+
+    @contextmanager
+    def stage(self, fileName, stage, records=0, bytesRead=0,
+              bytesWritten=0):
+
+        m = {"records": records,
+             "bytesRead": bytesRead,
+             "bytesWritten": bytesWritten,
+             "workerCPU": 0.0}
+
+        startWall = time.time()
+        startCPU = stageClock()
+        yield m
+        wall = time.time() - startWall
+        cpu = stageClock() - startCPU + m["workerCPU"]
+        with self.lock:
+            self.workerCPU += m["workerCPU"]
+
+        self.add(fileName, stage, wall, cpu, m["records"], m["bytesRead"],
+                 m["bytesWritten"])
+
+    def add(self, fileName, stage, wall, cpu, records=0, bytesRead=0,
+            bytesWritten=0):
+
+        record = {"file": fileName,
+                  "stage": stage,
+                  "wall": wall,
+                  "cpu": cpu,
+                  "records": records,
+                  "recordsPerSec": records / wall if wall > 0 else None,
+                  "bytesRead": bytesRead,
+                  "bytesWritten": bytesWritten,
+                  "peakRSSMB": peakRSS()}
+
+        with self.lock:
+            self.records.append(record)
+            if self.outFile is not None:
+                self.outFile.write(json.dumps(record) + "\n")
+
+    def summary(self):
+
+        stages = {}
+        with self.lock:
+            for record in self.records:
+                total = stages.setdefault(record["stage"],
+                                          {"files": set(),
+                                           "wall": 0.0,
+                                           "cpu": 0.0,
+                                           "records": 0,
+                                           "bytesRead": 0,
+                                           "bytesWritten": 0})
+                total["files"].add(record["file"])
+                for key in ["wall", "cpu", "records", "bytesRead",
+                            "bytesWritten"]:
+                    total[key] += record[key]
+
+        for total in stages.values():
+            total["files"] = len(total["files"])
+            total["recordsPerSec"] = (total["records"] / total["wall"]
+                                      if total["wall"] > 0 else None)
+
+        return {"wall": time.time() - self.startWall,
+                "cpu": time.process_time() - self.startCPU +
+                       self.workerCPU,
+                "peakRSSMB": peakRSS(),
+                "stages": stages}
+
+    def close(self):
+
+        summary = self.summary()
+
+        print(" ")
+        print("%-16s %6s %10s %10s %12s %12s %12s" %
+              ("Stage", "Files", "Wall (s)", "CPU (s)", "Records/s",
+               "MB read", "MB written"))
+        for stage in sorted(summary["stages"]):
+            total = summary["stages"][stage]
+            print("%-16s %6i %10.3f %10.3f %12s %12.1f %12.1f" %
+                  (stage, total["files"], total["wall"], total["cpu"],
+                   "%.0f" % total["recordsPerSec"]
+                   if total["recordsPerSec"] else "-",
+                   total["bytesRead"] / 1e6, total["bytesWritten"] / 1e6))
+        print("Total wall time: %.3f s, CPU time: %.3f s, peak RSS: %s MB" %
+              (summary["wall"], summary["cpu"],
+               "%.1f" % summary["peakRSSMB"]
+               if summary["peakRSSMB"] is not None else "-"))
+
+        if self.outFile is not None:
+            self.outFile.write(json.dumps({"summary": summary}) + "\n")
+            self.outFile.close()
+            self.outFile = None
+
+        return summary
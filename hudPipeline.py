@@ -0,0 +1,172 @@
+# ####################################################################
+#
+# Program:  hudPipeline.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module holds the helpers for the pipelined mode of
+# ProcessHUDfilesForVizWithFnV7.py (--pipeline).
+#
+# Without it, each file is read, then summarized, then written, so the
+# disk sits idle while the file is summarized and the CPU sits idle
+# while the .dbf is read and the .csv files are written.  In pipelined
+# mode:
+#
+# - a prefetch thread reads the upcoming .dbf files into a bounded
+#   queue while the current file is being summarized
+# - a writer thread copies the finished .csv text to the output files
+#   from a second bounded queue
+#
+# Both queues are bounded, so a slow reader or writer holds the others
+# back instead of piling up whole quarters in memory.  The summaries
+# themselves run in the worker pool (separate processes), which leaves
+# the main process free for the two threads.
+#
+# Note:  the .dbf files are decoded by dbfread, which is pure Python
+# and holds the GIL.  With --workers 1 the summaries run in the main
+# process too, so the prefetch thread and the summaries take turns
+# rather than overlapping, and --pipeline gains little beyond the
+# background writes.  Use it together with --workers 2 or more.
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import threading
+from queue import Queue
+import hudMetrics as hm
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# marks the end of a queue
+endOfQueue = None
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+prefetchFiles
+
+This function: a generator which reads files in a background thread,
+at most depth files ahead of the consumer, and yields
+(fileName, data) pairs in the original order.  An error raised by the
+reader is raised again in the consumer.
+
+Arguments
+---------
+fileNames  : list - Filenames to be read, in processing order
+reader     : function - Reads one file (e.g. hudAggregate.dbf2DF)
+depth      : int - Maximum number of files read ahead
+'''
+
+def prefetchFiles(fileNames, reader, depth=2):
+
+    queue = Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def readAll():
+        try:
+            for fileName in fileNames:
+                if stop.is_set():
+                    return
+                queue.put((fileName, reader(fileName), None))
+        except Exception as err:
+            queue.put((None, None, err))
+        queue.put(endOfQueue)
+
+    thread = threading.Thread(target=readAll, name="hud-prefetch")
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            item = queue.get()
+            if item is endOfQueue:
+                break
+            fileName, data, err = item
+            if err is not None:
+                raise err
+            yield fileName, data
+    finally:
+        # let the reader finish if the consumer stops early
+        stop.set()
+        while thread.is_alive():
+            if not queue.empty():
+                queue.get()
+            thread.join(0.01)
+
+# ####################################################################
+'''
+BackgroundWriter
+
+This class: writes text to a set of open output files from a
+background thread.  put() blocks once depth chunks are waiting, and
+close() waits until everything has been written.  An error raised by
+the writer thread is raised again by put() or close() (unless close()
+is called with raiseError False, e.g. while another error is being
+raised).
+
+If metrics (a hudMetrics.RunMetrics) is given, each chunk is recorded
+as a "write.<level>" stage of the file it came from.
+
+Arguments
+---------
+outFiles  : dictionary - Open output files, keyed by level
+depth     : int - Maximum number of chunks waiting to be written
+metrics   : RunMetrics - Stage measurements (optional)
+'''
+
+class BackgroundWriter(object):
+
+    def __init__(self, outFiles, depth=8, metrics=None):
+
+        self.outFiles = outFiles
+        self.metrics = metrics
+        self.queue = Queue(maxsize=max(1, depth))
+        self.error = None
+        self.thread = threading.Thread(target=self.writeAll,
+                                       name="hud-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def writeAll(self):
+
+        while True:
+            item = self.queue.get()
+            if item is endOfQueue:
+                return
+            if self.error is not None:
+                continue
+            level, text, fileName, records = item
+            try:
+                if self.metrics is None:
+                    self.outFiles[level].write(text)
+                else:
+                    with self.metrics.stage(fileName, "write." + level,
+                                            records=records,
+                                            bytesWritten=hm.textBytes(text)):
+                        self.outFiles[level].write(text)
+            except Exception as err:
+                self.error = err
+
+    def put(self, level, text, fileName=None, records=0):
+
+        if self.error is not None:
+            raise self.error
+        if text:
+            self.queue.put((level, text, fileName, records))
+
+    def close(self, raiseError=True):
+
+        if self.thread.is_alive():
+            self.queue.put(endOfQueue)
+            self.thread.join()
+        if raiseError and self.error is not None:
+            raise self.error
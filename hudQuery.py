@@ -0,0 +1,300 @@
+# ####################################################################
+#
+# Program:  hudQuery.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module answers "give me the series for county 24031" from the
+# output files of ProcessHUDfilesForVizWithFnV7.py (national.csv,
+# state.csv, county.csv and tract.csv, or their .gz or .zst compressed
+# versions), without loading and filtering a whole file for every
+# question, as the R code does with subset(indata, GEOID == geoid).
+#
+# Each level is loaded once, sorted by GEOID and quarter, and indexed
+# by GEOID:  the index maps every GEOID to its range of rows, so a
+# series is a slice of the sorted arrays.  This stays fast for the
+# tract level, which has a row for every tract and quarter.
+#
+# Recent results are kept in an LRU cache, and the cache hit rate can
+# be inspected with cacheInfo().  A level is loaded again if its file
+# changes.
+#
+# Example:
+#
+#   import hudQuery
+#   store = hudQuery.HUDStore('../HUD')
+#   series = store.series('county', '24031', start='03/2010')
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import hudAggregate as ha
+import hudCatalog as hc
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# the metric columns of a series
+metricCols = ha.valueCols
+
+# default number of results kept in the cache
+defaultCacheSize = 1024
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+qtrKey
+
+This function: returns a sortable integer (YYYYMM) for a quarter,
+given as a Month/Year label ("03/2015" or "3/2015"), a (year, month)
+tuple, or an integer YYYYMM.  None is returned unchanged.
+
+Arguments
+---------
+quarter  : string, tuple or int - The quarter
+'''
+
+def qtrKey(quarter):
+
+    if quarter is None:
+        return None
+    if isinstance(quarter, tuple):
+        return quarter[0] * 100 + quarter[1]
+    if isinstance(quarter, str):
+        month, year = quarter.split("/")
+        return int(year) * 100 + int(month)
+
+    return int(quarter)
+
+# ####################################################################
+'''
+LRUCache
+
+This class: a small thread-safe least recently used cache, which
+counts its hits and misses.
+
+Arguments
+---------
+maxSize  : int - Maximum number of entries
+'''
+
+class LRUCache(object):
+
+    def __init__(self, maxSize=defaultCacheSize):
+
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+
+        with self.lock:
+            self.entries.clear()
+
+    def info(self):
+
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "hitRate": self.hits / lookups if lookups else None,
+                    "size": len(self.entries),
+                    "maxSize": self.maxSize}
+
+# ####################################################################
+'''
+LevelIndex
+
+This class: the rows of one output file, sorted by GEOID and quarter,
+with the range of rows of every GEOID.
+
+Arguments
+---------
+fileName  : string - Output .csv file (e.g. county.csv)
+'''
+
+class LevelIndex(object):
+
+    def __init__(self, fileName):
+
+        self.fileName = fileName
+        self.mtime = os.path.getmtime(fileName)
+
+        data = pd.read_csv(fileName, dtype={"GEOID": str,
+                                            "Month/Year": str},
+                           float_precision="round_trip")
+        labels = data.iloc[:, 0].values
+        geoids = data.iloc[:, 1].values
+        keys = np.array([qtrKey(label) for label in labels],
+                        dtype=np.int64)
+
+        # sort by GEOID, then quarter
+        order = np.lexsort((keys, geoids))
+        self.labels = labels[order]
+        self.geoids = geoids[order]
+        self.keys = keys[order]
+        self.values = data.iloc[:, 2:].values[order].astype(float)
+
+        # GEOID -> (first row, last row + 1)
+        self.offsets = {}
+        if len(self.geoids):
+            starts = np.flatnonzero(np.r_[True, self.geoids[1:] !=
+                                          self.geoids[:-1]])
+            ends = np.r_[starts[1:], len(self.geoids)]
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                self.offsets[self.geoids[start]] = (start, end)
+
+        # quarter -> rows, built on the first cross-section
+        self.byQuarter = None
+
+    def rows(self, geoid, start=None, end=None):
+
+        # the rows of one GEOID between two quarters (inclusive)
+        first, last = self.offsets.get(geoid, (0, 0))
+        keys = self.keys[first:last]
+        if start is not None:
+            first += int(np.searchsorted(keys, qtrKey(start), "left"))
+        if end is not None:
+            last = self.offsets.get(geoid, (0, 0))[0] + \
+                int(np.searchsorted(keys, qtrKey(end), "right"))
+
+        return first, max(first, last)
+
+    def section(self, quarter):
+
+        # the rows of one quarter, in GEOID order
+        if self.byQuarter is None:
+            order = np.argsort(self.keys, kind="mergesort")
+            keys = self.keys[order]
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) \
+                if len(keys) else np.array([], dtype=int)
+            ends = np.r_[starts[1:], len(keys)]
+            self.byQuarter = {int(keys[start]): order[start:end]
+                              for start, end in zip(starts, ends)}
+
+        return self.byQuarter.get(qtrKey(quarter), np.array([], dtype=int))
+
+    def quarters(self):
+
+        return sorted(set(self.keys.tolist()))
+
+# ####################################################################
+'''
+HUDStore
+
+This class: the query interface over the output files in a directory.
+
+series() returns the tidy time series of one GEOID at one level
+(national, state, county or tract) as a data frame with the columns
+Month/Year, GEOID and the metrics, in quarter order, optionally
+limited to a range of quarters.  The national level has the GEOID
+"01".  crossSection() returns every GEOID of a level for one quarter,
+in GEOID order.
+
+Arguments
+---------
+outdir     : string - Directory holding national.csv ... tract.csv
+cacheSize  : int - Number of results kept in the LRU cache
+'''
+
+class HUDStore(object):
+
+    def __init__(self, outdir, cacheSize=defaultCacheSize):
+
+        self.outdir = outdir
+        self.indexes = {}
+        self.lock = threading.Lock()
+        self.cache = LRUCache(cacheSize)
+
+    def level(self, level):
+
+        if level not in ha.levels:
+            raise ValueError("unknown level: %s" % (level))
+
+        fileName = ha.levelFile(self.outdir, level, None)
+        with self.lock:
+            index = self.indexes.get(level)
+            if index is None or os.path.getmtime(fileName) != index.mtime:
+                if index is not None:
+                    self.cache.clear()
+                index = LevelIndex(fileName)
+                self.indexes[level] = index
+
+        return index
+
+    def series(self, level, geoid, start=None, end=None):
+
+        index = self.level(level)
+        key = ("series", level, str(geoid), qtrKey(start), qtrKey(end))
+
+        result = self.cache.get(key)
+        if result is None:
+            first, last = index.rows(str(geoid), start, end)
+            result = pd.DataFrame(index.values[first:last],
+                                  columns=metricCols)
+            result.insert(0, "GEOID", index.geoids[first:last])
+            result.insert(0, "Month/Year", index.labels[first:last])
+            self.cache.put(key, result)
+
+        return result.copy()
+
+    def crossSection(self, level, quarter):
+
+        index = self.level(level)
+        key = ("section", level, qtrKey(quarter))
+
+        result = self.cache.get(key)
+        if result is None:
+            rows = index.section(quarter)
+            result = pd.DataFrame(index.values[rows], columns=metricCols)
+            result.insert(0, "GEOID", index.geoids[rows])
+            result.insert(0, "Month/Year", index.labels[rows])
+            self.cache.put(key, result)
+
+        return result.copy()
+
+    def geoids(self, level):
+
+        return sorted(self.level(level).offsets)
+
+    def quarters(self, level):
+
+        return [hc.qtrLabel(key // 100, key % 100)
+                for key in self.level(level).quarters()]
+
+    def cacheInfo(self):
+
+        return self.cache.info()
@@ -0,0 +1,510 @@
+# ####################################################################
+#
+# Program:  hudRevise.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# HUD sometimes publishes a quarter again with corrections.  This
+# module updates the output files of ProcessHUDfilesForVizWithFnV7.py
+# for a reissued quarter, without rebuilding them:
+#
+# 1. every run records a fingerprint (SHA-1 of the .dbf data) of each
+#    input in revisions.json in the output directory.  A changed input
+#    is found by comparing fingerprints; the file is only hashed again
+#    when its size or modification time has changed.
+# 2. the new records of a changed quarter are compared tract by tract
+#    with the previous ones.  The previous records don't need a cache
+#    of their own:  they are the quarter's rows of tract.csv.
+# 3. only the county, state and national rows containing a changed,
+#    added or removed tract are calculated again, in the same way as a
+#    full run, so the result is identical to a rebuild.
+# 4. the changed rows are patched into the output files (the files are
+#    streamed through once, and every other line is copied unchanged),
+#    and the changes are logged to revisions.jsonl.
+# 5. the quarter's state sketches (state_sketch.npz, see hudSketch.py)
+#    are built again from the new records.
+#
+# Files derived from the outputs (the long file, the JSON shards) must
+# be written again after a revision.  quarantine.csv is not patched.
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import io
+import os
+import json
+import hashlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import hudAggregate as ha
+import hudCatalog as hc
+import hudSketch as hsk
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+revisionsFile = "revisions.json"
+revisionsLog = "revisions.jsonl"
+
+# bytes hashed per read
+hashChunk = 1 << 20
+
+# number of GEOIDs listed per change in the log
+maxLoggedGEOIDs = 50
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+fingerprint
+
+This function: returns the SHA-1 of the data of an input (.dbf file
+or zip archive member).
+
+Arguments
+---------
+fileName  : string - HUD input name
+'''
+
+def fingerprint(fileName):
+
+    digest = hashlib.sha1()
+    inFile = hc.openInput(fileName)
+    try:
+        for chunk in iter(lambda: inFile.read(hashChunk), b""):
+            digest.update(chunk)
+    finally:
+        inFile.close()
+        if hasattr(inFile, "archive"):
+            inFile.archive.close()
+
+    return "sha1:" + digest.hexdigest()
+
+# ####################################################################
+'''
+loadRevisions
+
+This function: reads the input fingerprints of an output directory,
+keyed by Month/Year label (empty if there are none yet).
+
+Arguments
+---------
+outdir  : string - Output directory
+'''
+
+def loadRevisions(outdir):
+
+    fileName = os.path.join(outdir, revisionsFile)
+    if not os.path.exists(fileName):
+        return {}
+
+    with open(fileName) as inFile:
+        return json.load(inFile)
+
+# ####################################################################
+'''
+saveRevisions
+
+This function: writes the input fingerprints of an output directory.
+
+Arguments
+---------
+outdir     : string - Output directory
+revisions  : dictionary - Fingerprint entries keyed by Month/Year
+'''
+
+def saveRevisions(outdir, revisions):
+
+    fileName = os.path.join(outdir, revisionsFile)
+    with open(fileName + ".tmp", "w") as outFile:
+        json.dump(revisions, outFile, indent=1, sort_keys=True)
+    os.replace(fileName + ".tmp", fileName)
+
+# ####################################################################
+'''
+inputEntry
+
+This function: returns the fingerprint entry of an input.  The
+fingerprint of a previous entry is reused if the file's size and
+modification time haven't changed.
+
+Arguments
+---------
+fileName  : string - HUD input name
+previous  : dictionary - Previous entry of the quarter (or None)
+'''
+
+def inputEntry(fileName, previous=None):
+
+    stat = os.stat(hc.splitInput(fileName)[0])
+    if (previous is not None and previous["path"] == fileName and
+            previous["size"] == stat.st_size and
+            previous["mtime"] == stat.st_mtime):
+        return dict(previous)
+
+    return {"path": fileName,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "fingerprint": fingerprint(fileName)}
+
+# ####################################################################
+'''
+recordInputs
+
+This function: records the fingerprints of the inputs of a run.
+
+Arguments
+---------
+fileNames  : list - HUD input names
+labels     : list - Month/Year label of each input
+outdir     : string - Output directory
+'''
+
+def recordInputs(fileNames, labels, outdir):
+
+    revisions = loadRevisions(outdir)
+    for fileName, label in zip(fileNames, labels):
+        revisions[label] = inputEntry(fileName, revisions.get(label))
+    saveRevisions(outdir, revisions)
+
+# ####################################################################
+'''
+changedInputs
+
+This function: compares the inputs with their recorded fingerprints.
+Returns the inputs of reissued quarters as (fileName, label, entry)
+tuples, with the new fingerprint entry, and the labels of quarters
+which have never been processed.
+
+Arguments
+---------
+fileNames  : list - HUD input names
+labels     : list - Month/Year label of each input
+outdir     : string - Output directory
+'''
+
+def changedInputs(fileNames, labels, outdir):
+
+    revisions = loadRevisions(outdir)
+    changed = []
+    unknown = []
+
+    for fileName, label in zip(fileNames, labels):
+        previous = revisions.get(label)
+        if previous is None:
+            unknown.append(label)
+            continue
+        entry = inputEntry(fileName, previous)
+        if entry["fingerprint"] != previous["fingerprint"]:
+            changed.append((fileName, label, entry))
+
+    return changed, unknown
+
+# ####################################################################
+'''
+lineKey
+
+This function: returns the (Month/Year, GEOID) of a line of an output
+file.
+
+Arguments
+---------
+line  : string - Output line
+'''
+
+def lineKey(line):
+
+    fields = line.split(",", 2)
+
+    return fields[0].strip('"'), fields[1].strip('"')
+
+# ####################################################################
+'''
+readQuarter
+
+This function: reads the rows of one quarter from an output file as a
+data frame with the HUD column names, in file (GEOID) order.
+
+Arguments
+---------
+fileName  : string - Output filename (e.g. tract.csv)
+label     : string - Month/Year label
+'''
+
+def readQuarter(fileName, label):
+
+    lines = []
+    with ha.openText(fileName) as inFile:
+        inFile.readline()
+        for line in inFile:
+            if lineKey(line)[0] == label:
+                lines.append(line)
+            elif lines:
+                break
+
+    if not lines:
+        raise ValueError("%s has no rows for %s, process it with the run "
+                         "command" % (fileName, label))
+
+    quarterDF = pd.read_csv(io.StringIO("".join(lines)), header=None,
+                            names=["Month/Year"] + ha.colsList,
+                            dtype={"Month/Year": str, "GEOID": str},
+                            float_precision="round_trip")
+
+    return quarterDF[ha.colsList]
+
+# ####################################################################
+'''
+diffTracts
+
+This function: compares the previous and new records of a quarter by
+GEOID and returns the GEOIDs of the changed, added and removed tracts.
+A GEOID which appears more than once (see hudValidate) counts as
+changed.
+
+Arguments
+---------
+oldDF  : data frame - Previous records (from tract.csv)
+newDF  : data frame - New records
+'''
+
+def diffTracts(oldDF, newDF):
+
+    repeated = set(oldDF["GEOID"][oldDF["GEOID"].duplicated()]) | \
+        set(newDF["GEOID"][newDF["GEOID"].duplicated()])
+
+    merged = oldDF.drop_duplicates("GEOID").merge(
+        newDF.drop_duplicates("GEOID"), on="GEOID", how="outer",
+        suffixes=("_old", "_new"), indicator=True)
+
+    both = (merged["_merge"] == "both").values
+    old = merged[[col + "_old" for col in ha.valueCols]].values
+    new = merged[[col + "_new" for col in ha.valueCols]].values
+    differ = ((old != new) & ~(np.isnan(old) & np.isnan(new))).any(axis=1)
+    differ |= merged["GEOID"].isin(repeated).values
+
+    geoids = merged["GEOID"].values
+    return {"changed": sorted(geoids[both & differ].tolist()),
+            "added": sorted(geoids[(merged["_merge"] ==
+                                    "right_only").values].tolist()),
+            "removed": sorted(geoids[(merged["_merge"] ==
+                                      "left_only").values].tolist())}
+
+# ####################################################################
+'''
+quarterPatches
+
+This function: calculates the output rows touched by a set of tract
+changes.  Returns, for each level, a dictionary of GEOID -> new .csv
+line (None for a row to be removed).
+
+The state partials are calculated as in a full run (see
+hudAggregate.aggregateFile), so the patched rows are identical to
+those of a rebuild.
+
+Arguments
+---------
+newDF  : data frame - New records of the quarter (sorted by GEOID)
+label  : string - Month/Year label
+diff   : dictionary - Changed, added and removed tracts (diffTracts)
+'''
+
+def quarterPatches(newDF, label, diff):
+
+    touched = diff["changed"] + diff["added"] + diff["removed"]
+    counties = set(geoid[0:5] for geoid in touched)
+    states = set(geoid[0:2] for geoid in touched)
+
+    partials = {}
+    for qtrYear, stateFIPS, stateDF in ha.partitionByState(newDF, label):
+        partials[stateFIPS] = ha.countyPartial(qtrYear, stateDF)
+
+    patches = {level: {} for level in ha.levels}
+
+    # tracts (all of the rows of a repeated GEOID)
+    for geoid in diff["removed"]:
+        patches["tract"][geoid] = None
+    newRows = newDF[newDF["GEOID"].isin(set(diff["changed"] +
+                                            diff["added"]))]
+    for geoid, values in zip(newRows["GEOID"].tolist(),
+                             newRows[ha.valueCols].values.tolist()):
+        patches["tract"][geoid] = (patches["tract"].get(geoid) or "") + \
+            ha.formatRows([[label, geoid] + values])
+
+    # counties and states
+    for geoid in counties:
+        patches["county"][geoid] = None
+    for geoid in states:
+        patches["state"][geoid] = None
+    for stateFIPS in sorted(states & set(partials)):
+        for row in ha.partialRows(partials[stateFIPS], "county"):
+            if row[1] in counties:
+                patches["county"][row[1]] = ha.formatRows([row])
+        for row in ha.partialRows(partials[stateFIPS], "state"):
+            patches["state"][row[1]] = ha.formatRows([row])
+
+    # the nation
+    if partials:
+        partial = pd.concat([partials[s] for s in sorted(partials)],
+                            ignore_index=True)
+    else:
+        partial = pd.DataFrame(columns=ha.partialHeadings)
+    patches["national"][ha.nationalGEOID] = None
+    for row in ha.partialRows(partial, "national"):
+        patches["national"][row[1]] = ha.formatRows([row])
+
+    return patches
+
+# ####################################################################
+'''
+patchLevel
+
+This function: patches the rows of one quarter of an output file,
+replacing, inserting (in GEOID order) and removing rows.  A new line
+may hold several rows, and replaces every row of its GEOID.  The file is
+streamed to a temporary file, which then replaces it.  Returns the
+number of rows replaced, inserted and removed.
+
+Arguments
+---------
+fileName  : string - Output filename
+label     : string - Month/Year label
+patches   : dictionary - GEOID -> new line (None to remove the row)
+'''
+
+def patchLevel(fileName, label, patches):
+
+    counts = {"replaced": 0, "inserted": 0, "removed": 0}
+    pending = sorted(geoid for geoid, line in patches.items()
+                     if line is not None)
+    position = 0
+    done = set()
+    inQuarter = False
+    seen = False
+
+    compression = ha.compressionOf(fileName)
+    tmpName = fileName + ".tmp"
+    outFile = ha.openOutput(tmpName, compression)
+    try:
+        with ha.openText(fileName) as inFile:
+            outFile.write(inFile.readline())
+            for line in inFile:
+                qtrYear, geoid = lineKey(line)
+                if qtrYear != label:
+                    if inQuarter:
+                        # new rows after the last row of the quarter
+                        for newGEOID in pending[position:]:
+                            outFile.write(patches[newGEOID])
+                            counts["inserted"] += 1
+                        position = len(pending)
+                        inQuarter = False
+                    outFile.write(line)
+                    continue
+
+                inQuarter = seen = True
+                while position < len(pending) and pending[position] < geoid:
+                    outFile.write(patches[pending[position]])
+                    counts["inserted"] += 1
+                    position += 1
+                if geoid not in patches:
+                    outFile.write(line)
+                elif geoid in done:
+                    continue
+                elif patches[geoid] is None:
+                    counts["removed"] += 1
+                else:
+                    outFile.write(patches[geoid])
+                    counts["replaced"] += 1
+                    position += 1
+                done.add(geoid)
+
+            if inQuarter:
+                for newGEOID in pending[position:]:
+                    outFile.write(patches[newGEOID])
+                    counts["inserted"] += 1
+    except Exception:
+        outFile.close()
+        os.remove(tmpName)
+        raise
+    outFile.close()
+
+    if not seen:
+        os.remove(tmpName)
+        raise ValueError("%s has no rows for %s" % (fileName, label))
+
+    os.replace(tmpName, fileName)
+
+    return counts
+
+# ####################################################################
+'''
+reviseQuarter
+
+This function: patches the output files for the new records of a
+reissued quarter, and returns the log record of the revision.
+
+Arguments
+---------
+outdir  : string - Output directory
+label   : string - Month/Year label
+newDF   : data frame - New records of the quarter (sorted by GEOID)
+'''
+
+def reviseQuarter(outdir, label, newDF):
+
+    oldDF = readQuarter(ha.levelFile(outdir, "tract", None), label)
+    diff = diffTracts(oldDF, newDF)
+    patches = quarterPatches(newDF, label, diff)
+
+    rows = {}
+    if diff["changed"] or diff["added"] or diff["removed"]:
+        for level in ha.levels:
+            rows[level] = patchLevel(ha.levelFile(outdir, level, None),
+                                     label, patches[level])
+        hsk.reviseSketches(outdir, label, hsk.quarterSketches(label, newDF))
+
+    return {"Month/Year": label,
+            "tracts": {change: {"count": len(geoids),
+                                "geoids": geoids[:maxLoggedGEOIDs]}
+                       for change, geoids in diff.items()},
+            "counties": sorted(patches["county"]),
+            "states": sorted(patches["state"]),
+            "rows": rows}
+
+# ####################################################################
+'''
+logRevision
+
+This function: records a revision:  appends its log record to
+revisions.jsonl and updates the quarter's fingerprint.
+
+Arguments
+---------
+outdir  : string - Output directory
+record  : dictionary - Log record from reviseQuarter
+entry   : dictionary - New fingerprint entry of the input
+'''
+
+def logRevision(outdir, record, entry):
+
+    revisions = loadRevisions(outdir)
+    record = dict(record)
+    record["date"] = str(datetime.now())
+    record["path"] = entry["path"]
+    record["previous"] = revisions.get(record["Month/Year"],
+                                       {}).get("fingerprint")
+    record["fingerprint"] = entry["fingerprint"]
+
+    with open(os.path.join(outdir, revisionsLog), "a") as logFile:
+        logFile.write(json.dumps(record) + "\n")
+
+    revisions[record["Month/Year"]] = entry
+    saveRevisions(outdir, revisions)
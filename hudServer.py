@@ -0,0 +1,325 @@
+# ####################################################################
+#
+# Program:  hudServer.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This script is a small local HTTP service over the output files of
+# ProcessHUDfilesForVizWithFnV7.py, for the dashboard.  The data is
+# loaded once by the service (see hudQuery.py) and shared by every
+# dashboard session, instead of each R Shiny session reading the .csv
+# files at startup.
+#
+# Requests (all GET, all answered with JSON):
+#
+#   /series/<level>/<GEOID>[?start=MM/YYYY&end=MM/YYYY]
+#       time series of one GEOID
+#   /section/<level>?quarter=MM/YYYY
+#       every GEOID of a level for one quarter
+#   /quarters/<level>     the quarters of a level
+#   /geoids/<level>       the GEOIDs of a level
+#   /stats                cache hit rates
+#
+# where level is national, state, county or tract.  An unknown level
+# or GEOID, or a level without an output file, is answered with 404
+# Not Found, a bad request with 400, and a file which can't be read
+# with 500 (the details are only logged, not sent to the client).
+# Missing values are null.
+#
+# Responses are gzip compressed when the client accepts it, and carry
+# an ETag (the gzipped body's ends in -gz, as it is a different
+# representation), so a client sending If-None-Match with either gets
+# 304 Not Modified when the data hasn't changed.  Finished responses
+# (JSON text, gzipped text and ETag) are kept in a bounded LRU cache.
+# Requests are handled in threads, so many sessions can be served at
+# once.
+#
+# The service listens on localhost only, unless --host says otherwise.
+#
+# Usage:
+#
+#   python hudServer.py --outdir ../HUD [--port 8036] [--cache N]
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import json
+import gzip
+import hashlib
+import argparse
+import socketserver
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+import hudAggregate as ha
+import hudQuery as hq
+import hudCatalog as hc
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+defaultHost = "127.0.0.1"
+defaultPort = 8036
+
+# number of responses kept in the response cache
+defaultResponses = 512
+
+# responses smaller than this are not worth compressing
+minGzipSize = 512
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+frameRows
+
+This function: returns the rows of a data frame as a list of
+dictionaries, ready for JSON (missing values as None).
+
+Arguments
+---------
+pandasDF  : data frame - Series or cross-section from hudQuery
+'''
+
+def frameRows(pandasDF):
+
+    return pandasDF.astype(object).where(pandasDF.notna(),
+                                         None).to_dict("records")
+
+# ####################################################################
+'''
+answer
+
+This function: returns the payload for a request path.  Raises
+LookupError for an unknown path or GEOID, and ValueError for a bad
+argument.
+
+Arguments
+---------
+store      : HUDStore - Query store over the output files
+parts      : list - Path components
+query      : dictionary - Query arguments (from parse_qs)
+responses  : LRUCache - Response cache (for /stats)
+'''
+
+def answer(store, parts, query, responses=None):
+
+    def arg(name):
+        return query.get(name, [None])[0]
+
+    if parts == ["stats"]:
+        return {"cache": store.cacheInfo(),
+                "responses": responses.info() if responses else None}
+
+    if len(parts) < 2:
+        raise LookupError("unknown request")
+
+    request, level = parts[0], parts[1]
+
+    if request == "series" and len(parts) == 3:
+        series = store.series(level, parts[2], arg("start"), arg("end"))
+        if series.empty and parts[2] not in store.level(level).offsets:
+            raise LookupError("no %s %s" % (level, parts[2]))
+        return {"level": level,
+                "GEOID": parts[2],
+                "rows": frameRows(series)}
+
+    if request == "section" and len(parts) == 2:
+        if arg("quarter") is None:
+            raise ValueError("quarter=MM/YYYY is required")
+        return {"level": level,
+                "Month/Year": hc.qtrLabel(*divmod(
+                    hq.qtrKey(arg("quarter")), 100)),
+                "rows": frameRows(store.crossSection(level,
+                                                     arg("quarter")))}
+
+    if request == "quarters" and len(parts) == 2:
+        return {"level": level, "quarters": store.quarters(level)}
+
+    if request == "geoids" and len(parts) == 2:
+        return {"level": level, "geoids": store.geoids(level)}
+
+    raise LookupError("unknown request")
+
+# ####################################################################
+'''
+encodeResponse
+
+This function: returns the cached form of a payload:  the JSON text,
+the gzipped text (None if it is too small to be worth it) and the ETag.
+
+Arguments
+---------
+payload  : dictionary - Response payload
+'''
+
+def encodeResponse(payload):
+
+    body = json.dumps(payload, separators=(",", ":"),
+                      allow_nan=False).encode("utf-8")
+    zipped = gzip.compress(body, 6) if len(body) >= minGzipSize else None
+    etag = '"%s"' % (hashlib.sha1(body).hexdigest())
+
+    return body, zipped, etag
+
+# ####################################################################
+'''
+HUDHandler
+
+This class: handles one HTTP request.  The store and response cache
+belong to the server, so that every session shares them.
+'''
+
+class HUDHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = parse_qs(url.query)
+        store = self.server.store
+
+        try:
+            if len(parts) > 1 and parts[1] not in ha.levels:
+                raise LookupError("unknown level: %s" % (parts[1]))
+
+            # responses about a level are cached until its file changes
+            mtime = store.level(parts[1]).mtime if len(parts) > 1 else None
+            key = (url.path, url.query, mtime)
+            cached = self.server.responses.get(key) \
+                if mtime is not None else None
+            if cached is None:
+                cached = encodeResponse(answer(store, parts, query,
+                                                self.server.responses))
+                if mtime is not None:
+                    self.server.responses.put(key, cached)
+        except LookupError as e:
+            return self.sendError(404, str(e))
+        except FileNotFoundError as e:
+            self.log_error("%s", e)
+            return self.sendError(404, "no data for %s" % (url.path))
+        except OSError as e:
+            self.log_error("%s", e)
+            return self.sendError(500, "the data could not be read")
+        except ValueError as e:
+            return self.sendError(400, str(e))
+
+        self.sendJSON(*cached)
+
+    def sendJSON(self, body, zipped, etag):
+
+        # the gzipped body is another representation, with its own ETag
+        gzipped = zipped is not None and \
+            "gzip" in self.headers.get("Accept-Encoding", "")
+        etags = [etag, etag[:-1] + '-gz"']
+        if gzipped:
+            body = zipped
+            etags.reverse()
+
+        # conditional request (either representation's ETag matches)
+        match = self.headers.get("If-None-Match", "")
+        tags = [m.strip() for m in match.split(",")]
+        if match.strip() == "*" or etags[0] in tags or etags[1] in tags:
+            self.send_response(304)
+            self.send_header("ETag", etags[0])
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etags[0])
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def sendError(self, status, message):
+
+        body = json.dumps({"error": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def log_error(self, format, *args):
+
+        # errors are logged whether or not the requests are
+        BaseHTTPRequestHandler.log_message(self, format, *args)
+
+# ####################################################################
+'''
+HUDServer
+
+This class: a threaded HTTP server with the query store and the
+response cache.
+
+Arguments
+---------
+outdir     : string - Directory holding national.csv ... tract.csv
+host       : string - Address to listen on
+port       : int - Port to listen on (0 picks a free port)
+cacheSize  : int - Number of responses kept in the cache
+verbose    : boolean - Log every request
+'''
+
+class HUDServer(socketserver.ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, outdir, host=defaultHost, port=defaultPort,
+                 cacheSize=defaultResponses, verbose=False):
+
+        HTTPServer.__init__(self, (host, port), HUDHandler)
+        self.store = hq.HUDStore(outdir)
+        self.responses = hq.LRUCache(cacheSize)
+        self.verbose = verbose
+
+# ####################################################################
+# main()
+# ####################################################################
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Serve the HUD summaries as JSON")
+    parser.add_argument("--outdir", default="../HUD",
+                        help="directory holding the output .csv files")
+    parser.add_argument("--host", default=defaultHost,
+                        help="address to listen on")
+    parser.add_argument("--port", type=int, default=defaultPort,
+                        help="port to listen on")
+    parser.add_argument("--cache", type=int, default=defaultResponses,
+                        help="number of responses kept in the cache")
+    parser.add_argument("--verbose", action="store_true",
+                        help="log every request")
+    args = parser.parse_args()
+
+    server = HUDServer(args.outdir, args.host, args.port, args.cache,
+                       args.verbose)
+    print("Serving %s on http://%s:%i/" % (args.outdir,
+                                          *server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
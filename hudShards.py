@@ -0,0 +1,210 @@
+# ####################################################################
+#
+# Program:  hudShards.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module writes one small JSON document per GEOID per level from
+# the output files of ProcessHUDfilesForVizWithFnV7.py, already shaped
+# for the stacked bar plot of the dashboard.  A front end fetches one
+# file for a selection, instead of reading a whole level and rebuilding
+# the six bar traces on every plot, as processFiles() and buildTraces()
+# do in PlotVacantVsTotalUnitsV5.R.
+#
+# The shards are written as <shardDir>/<level>/<GEOID>.json:
+#
+#   {"level": "county", "GEOID": "24031",
+#    "quarters": ["03/2015", ...],
+#    "traces": [{"name": "0-3 months", "type": "bar",
+#                "orientation": "h",
+#                "marker": {"color": "rgb(17, 78, 166)"},
+#                "x": [...], "y": ["03/2015", ...]}, ...],
+#    "table": {"AVG_DAYS_VAC": [...], "RES_VACpc": [...],
+#              "AMS_RES": [...]}}
+#
+# The x values of a trace are the percent of the vacant units in its
+# bucket for each quarter (0 when there are no vacant units), and the y
+# values of every trace are the quarters, so each trace can be passed
+# to Plotly as it is.  The table holds the summary table fields of the
+# R code.
+#
+# manifest.json in <shardDir> lists the quarters and GEOIDs of every
+# level.
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import json
+from glob import glob
+from datetime import datetime
+import numpy as np
+import hudAggregate as ha
+import hudQuery as hq
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# the bar traces:  bucket, name and color (as in buildTraces)
+traceBuckets = [("VAC_3_RES", "0-3 months", "rgb(17, 78, 166)"),
+                ("VAC_3_6_R", "3-6 months", "rgb(41, 128, 171)"),
+                ("VAC_6_12R", "6-12 months", "rgb(104, 157, 46)"),
+                ("VAC_12_24R", "12-24 months", "rgb(36, 118, 23)"),
+                ("VAC_24_36R", "24-36 months", "rgb(169, 140, 31)"),
+                ("VAC_36_RES", "36+ months", "rgb(178, 81, 28)")]
+
+# decimals kept in the shards
+shardDigits = 4
+
+# version of the shard layout
+shardVersion = 1
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+shardColumns
+
+This function: returns the trace and table values of every row of a
+level (see hudQuery.LevelIndex), rounded for the shards.
+
+Arguments
+---------
+index  : LevelIndex - Rows of one level
+'''
+
+def shardColumns(index):
+
+    def col(name):
+        return index.values[:, hq.metricCols.index(name)]
+
+    vacant = col("RES_VAC")
+    units = col("AMS_RES")
+
+    columns = {}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for bucket, name, color in traceBuckets:
+            columns[bucket] = np.round(np.where(vacant != 0,
+                                                col(bucket) / vacant * 100,
+                                                0.0), shardDigits)
+        columns["RES_VACpc"] = np.round(np.where(units != 0,
+                                                 vacant / units, 0.0),
+                                        shardDigits)
+    columns["AVG_DAYS_VAC"] = np.round(col("AVG_VAC_R"), shardDigits)
+    columns["AMS_RES"] = units.astype(np.int64)
+
+    return columns
+
+# ####################################################################
+'''
+shardDocument
+
+This function: returns the shard of one GEOID.
+
+Arguments
+---------
+level    : string - Level name
+geoid    : string - GEOID
+labels   : list - Month/Year labels of the GEOID's rows
+columns  : dictionary - Values of the GEOID's rows (from shardColumns)
+'''
+
+def shardDocument(level, geoid, labels, columns):
+
+    traces = [{"name": name,
+               "type": "bar",
+               "orientation": "h",
+               "marker": {"color": color},
+               "x": columns[bucket],
+               "y": labels}
+              for bucket, name, color in traceBuckets]
+
+    return {"level": level,
+            "GEOID": geoid,
+            "quarters": labels,
+            "traces": traces,
+            "table": {"AVG_DAYS_VAC": columns["AVG_DAYS_VAC"],
+                      "RES_VACpc": columns["RES_VACpc"],
+                      "AMS_RES": columns["AMS_RES"]}}
+
+# ####################################################################
+'''
+writeLevelShards
+
+This function: writes the shards of one level, removes the shards of
+GEOIDs which are no longer in the level, and returns the level's
+manifest entry.
+
+Arguments
+---------
+store     : HUDStore - Query store over the output files
+level     : string - Level name
+shardDir  : string - Directory for the shards
+'''
+
+def writeLevelShards(store, level, shardDir):
+
+    index = store.level(level)
+    columns = shardColumns(index)
+    levelDir = os.path.join(shardDir, level)
+    if not os.path.isdir(levelDir):
+        os.makedirs(levelDir)
+
+    geoids = {}
+    for geoid, (start, end) in sorted(index.offsets.items()):
+        document = shardDocument(level, geoid,
+                                 index.labels[start:end].tolist(),
+                                 {name: values[start:end].tolist()
+                                  for name, values in columns.items()})
+        with open(os.path.join(levelDir, geoid + ".json"), "w") as outFile:
+            json.dump(document, outFile, separators=(",", ":"))
+        geoids[geoid] = end - start
+
+    for fileName in glob(os.path.join(levelDir, "*.json")):
+        if os.path.basename(fileName)[:-len(".json")] not in geoids:
+            os.remove(fileName)
+
+    return {"path": level + "/{GEOID}.json",
+            "quarters": store.quarters(level),
+            "geoids": geoids}
+
+# ####################################################################
+'''
+writeShards
+
+This function: writes the shards of the given levels and the manifest,
+and returns the number of shards written per level.
+
+Arguments
+---------
+outdir    : string - Directory holding national.csv ... tract.csv
+shardDir  : string - Directory for the shards
+levels    : list - Levels to write (default all)
+'''
+
+def writeShards(outdir, shardDir, levels=None):
+
+    store = hq.HUDStore(outdir)
+    manifest = {"version": shardVersion,
+                "created": str(datetime.now()),
+                "traces": [{"bucket": bucket, "name": name, "color": color}
+                           for bucket, name, color in traceBuckets],
+                "levels": {}}
+
+    for level in levels or ha.levels:
+        manifest["levels"][level] = writeLevelShards(store, level, shardDir)
+
+    tmpName = os.path.join(shardDir, "manifest.json.tmp")
+    with open(tmpName, "w") as outFile:
+        json.dump(manifest, outFile, separators=(",", ":"))
+    os.replace(tmpName, os.path.join(shardDir, "manifest.json"))
+
+    return {level: len(entry["geoids"])
+            for level, entry in manifest["levels"].items()}
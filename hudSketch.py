@@ -0,0 +1,570 @@
+# ####################################################################
+#
+# Program:  hudSketch.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module answers "what percentile is this tract's vacancy rate
+# within its state?" without loading tract.csv.  The run builds a small
+# quantile sketch of the tract vacancy rates (RES_VAC / AMS_RES, tracts
+# with addresses) of every state and quarter, and of the nation, and
+# saves them next to state.csv (state_sketch.npz).
+#
+# The sketch is KLL (Karnin, Lang and Liberty, 2016):  a stack of
+# levels, where a value at level h stands for 2^h tract values.  When
+# the sketch is over its capacity, the lowest level that is over its
+# own capacity is sorted, and every other value (starting at random
+# with the first or the second) moves up one level.  Capacities shrink
+# by 2/3 per level down from the top one (k), so a sketch holds at most
+# about 3k values however many tracts it has seen.  Sketches merge by
+# concatenating their levels and compacting, so the state sketches of
+# a quarter are merged into the national one, and sketches built on
+# different machines can be combined the same way.
+#
+# A run of one shard of the files (--shard K/N) writes its sketches to
+# state_sketch_KofN.npz instead, so shards sharing an output directory
+# don't overwrite each other's quarters.  The merge command combines the
+# shards' files into state_sketch.npz (see combineSketches).
+#
+# Error bounds.  The rank of a rate (the number of tracts with a rate
+# at or below it) is estimated from the weighted values.  A compaction
+# at level h changes the estimated rank of any rate by at most 2^h (at
+# most one of the sorted pairs straddles the rate, and it counts 0 or
+# 2 x 2^h instead of 2^h), so:
+#
+# - the sum of 2^h over the compactions of a sketch (error) is a hard
+#   bound on the rank error;
+# - each of those changes is +2^h or -2^h with even odds (or 0), and
+#   independent, so the rank error has mean 0 and a standard deviation
+#   of at most sqrt(sum of 4^h) (stdError).  About 99% of the answers
+#   are within 2.576 stdError.
+#
+# Both are kept with every sketch (they add up when sketches merge)
+# and returned with every answer.  A sketch which was never compacted
+# (the states with at most k tracts) is exact.  With the default k of
+# 200, a state of 8,000 tracts (added in one batch, as a run does) has
+# a stdError of about 0.12 percentile points and a hard bound of about
+# 0.2 points.  A merged sketch carries the bounds of its parts, so the
+# national sketch (merged from the states, about 73,000 tracts) has a
+# hard bound of about 2 points, though its stdError stays about 0.3
+# points.  A sketch takes at most about 2 KB of the compressed file.
+# Quantiles have the same bounds:  the true rank of the returned rate
+# is within error of q x n.  A sketch with no values answers NaN.
+#
+# The sketches are kept by quarter, level (state or national) and
+# GEOID:  the national GEOID "01" is also the FIPS code of Alabama.
+# The random choices are seeded from the key of the sketch, so a run
+# gives the same sketches whatever the number of workers.
+#
+# Example:
+#
+#   import hudSketch
+#   sketches = hudSketch.SketchStore('../HUD')
+#   answer = sketches.percentile('24', '03/2015', 0.083)
+#   answer = sketches.percentile('01', '03/2015', 0.083, 'national')
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import zlib
+import threading
+import numpy as np
+import hudAggregate as ha
+import hudQuery as hq
+import hudCatalog as hc
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# capacity of the top level (larger:  more accurate and larger)
+defaultK = 200
+
+# capacity of a level, relative to the level above it
+capacityRatio = 2.0 / 3.0
+
+sketchFile = "state_sketch.npz"
+
+# the sketches of shard K of N of a run, and the files of all shards
+shardSketchFile = "state_sketch_%iof%i.npz"
+shardSketchGlob = "state_sketch_*of*.npz"
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+sketchSeed
+
+This function: returns the seed of the random choices of the sketch
+of one quarter, level and GEOID.
+
+Arguments
+---------
+qtrYear  : string - Month/Year label
+level    : string - "state" or "national"
+geoid    : string - State FIPS code (or the national GEOID)
+'''
+
+def sketchSeed(qtrYear, level, geoid):
+
+    return zlib.crc32(("%s|%s|%s" % (qtrYear, level, geoid)).encode("utf-8"))
+
+# ####################################################################
+'''
+QuantileSketch
+
+This class: a mergeable KLL quantile sketch of a set of values.
+
+update() adds values, merge() adds the values of another sketch.
+rank() returns the estimated number of values at or below a value,
+and quantile() the value at a fraction of the values.  error is the
+hard bound and stdError() the standard deviation of the rank error.
+
+Arguments
+---------
+k     : int - Capacity of the top level
+seed  : int - Seed of the random choices
+'''
+
+class QuantileSketch(object):
+
+    def __init__(self, k=defaultK, seed=0):
+
+        self.k = k
+        self.n = 0
+        self.levels = [np.zeros(0)]
+        self.error = 0
+        self.variance = 0.0
+        self.minValue = np.inf
+        self.maxValue = -np.inf
+        self.rng = np.random.default_rng(seed)
+        self.weighted = None
+
+    def capacity(self, h):
+
+        return max(2, int(np.ceil(self.k * capacityRatio **
+                                  (len(self.levels) - 1 - h))))
+
+    def update(self, values):
+
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values):
+            self.n += len(values)
+            self.minValue = min(self.minValue, values.min())
+            self.maxValue = max(self.maxValue, values.max())
+            self.levels[0] = np.r_[self.levels[0], values]
+            self.compress()
+
+        return self
+
+    def merge(self, other):
+
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0))
+        for h, values in enumerate(other.levels):
+            self.levels[h] = np.r_[self.levels[h], values]
+
+        self.n += other.n
+        self.error += other.error
+        self.variance += other.variance
+        self.minValue = min(self.minValue, other.minValue)
+        self.maxValue = max(self.maxValue, other.maxValue)
+        self.compress()
+
+        return self
+
+    def compress(self):
+
+        self.weighted = None
+        while sum(len(values) for values in self.levels) > \
+                sum(self.capacity(h) for h in range(len(self.levels))):
+            h = next(h for h, values in enumerate(self.levels)
+                     if len(values) > self.capacity(h))
+            if h + 1 == len(self.levels):
+                self.levels.append(np.zeros(0))
+
+            # every other sorted value moves up; an odd one out stays
+            values = np.sort(self.levels[h])
+            odd = len(values) % 2
+            start = odd + int(self.rng.integers(2))
+            self.levels[h + 1] = np.r_[self.levels[h + 1],
+                                       values[start::2]]
+            self.levels[h] = values[:odd]
+
+            self.error += 2 ** h
+            self.variance += 4.0 ** h
+
+    def stdError(self):
+
+        return float(np.sqrt(self.variance))
+
+    def sortedValues(self):
+
+        # the values in order, and the cumulative weights
+        if self.weighted is None:
+            values = np.concatenate(self.levels)
+            weights = np.concatenate([np.full(len(v), 2 ** h, np.int64)
+                                      for h, v in enumerate(self.levels)])
+            order = np.argsort(values, kind="mergesort")
+            self.weighted = (values[order], np.cumsum(weights[order]))
+
+        return self.weighted
+
+    def rank(self, x):
+
+        x = np.asarray(x, dtype=float)
+        if not self.n:
+            return np.zeros(x.shape, dtype=np.int64)
+
+        values, cumulative = self.sortedValues()
+        position = np.searchsorted(values, x, "right")
+        rank = np.where(position > 0, cumulative[np.maximum(position - 1,
+                                                            0)], 0)
+
+        # exact outside the range of the values
+        rank = np.where(x < self.minValue, 0, rank)
+        return np.where(x >= self.maxValue, self.n, rank)
+
+    def quantile(self, q):
+
+        q = np.asarray(q, dtype=float)
+        if not self.n:
+            return np.full(q.shape, np.nan)
+
+        values, cumulative = self.sortedValues()
+        position = np.searchsorted(cumulative, q * self.n, "left")
+        value = values[np.minimum(position, len(values) - 1)]
+
+        value = np.where(q <= 0, self.minValue, value)
+        return np.where(q >= 1, self.maxValue, value)
+
+# ####################################################################
+'''
+stateSketch
+
+This function: returns the sketch of the tract vacancy rates of the
+records of one state (or any set of tracts) in one quarter.
+
+Arguments
+---------
+qtrYear   : string - Month/Year label
+geoid     : string - State FIPS code
+pandasDF  : data frame - The tract records
+k         : int - Capacity of the top level
+'''
+
+def stateSketch(qtrYear, geoid, pandasDF, k=defaultK):
+
+    units = pandasDF["AMS_RES"].values.astype(float)
+    vacant = pandasDF["RES_VAC"].values.astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rates = vacant[units > 0] / units[units > 0]
+
+    return QuantileSketch(k, sketchSeed(qtrYear, "state",
+                                        geoid)).update(rates)
+
+# ####################################################################
+'''
+quarterSketches
+
+This function: returns the sketches of every state of one quarter's
+records, and the national sketch merged from them, by (level, GEOID).
+
+Arguments
+---------
+qtrYear   : string - Month/Year label
+pandasDF  : data frame - Records of the quarter (sorted by GEOID)
+k         : int - Capacity of the top level
+'''
+
+def quarterSketches(qtrYear, pandasDF, k=defaultK):
+
+    sketches = {("state", stateFIPS): stateSketch(qtrYear, stateFIPS,
+                                                  stateDF, k)
+                for qtrYear, stateFIPS, stateDF in
+                ha.partitionByState(pandasDF, qtrYear)}
+    sketches[("national", ha.nationalGEOID)] = mergeSketches(
+        qtrYear, "national", ha.nationalGEOID,
+        [sketches[key] for key in sorted(sketches)], k)
+
+    return sketches
+
+# ####################################################################
+'''
+mergeSketches
+
+This function: returns one sketch of all the values of the given
+sketches (e.g. the national sketch of a quarter from the states).
+
+Arguments
+---------
+qtrYear   : string - Month/Year label
+level     : string - Level of the merged sketch
+geoid     : string - GEOID of the merged sketch
+sketches  : list - Sketches to merge
+k         : int - Capacity of the top level
+'''
+
+def mergeSketches(qtrYear, level, geoid, sketches, k=defaultK):
+
+    merged = QuantileSketch(k, sketchSeed(qtrYear, level, geoid))
+    for sketch in sketches:
+        merged.merge(sketch)
+
+    return merged
+
+# ####################################################################
+'''
+writeSketches
+
+This function: writes the sketches to state_sketch.npz (or the given
+file name) in outdir (next to state.csv), in quarter, level and GEOID
+order.
+
+Arguments
+---------
+outdir    : string - Output directory
+sketches  : dictionary - (Month/Year, level, GEOID) -> QuantileSketch
+name      : string - File name
+'''
+
+def writeSketches(outdir, sketches, name=sketchFile):
+
+    keys = sorted(sketches, key=lambda key: (hq.qtrKey(key[0]),
+                                             ha.levels.index(key[1]),
+                                             key[2]))
+    numLevels = max([len(sketches[key].levels) for key in keys] + [1])
+
+    sizes = np.zeros((len(keys), numLevels), dtype=np.int64)
+    values = []
+    for i, key in enumerate(keys):
+        for h, levelValues in enumerate(sketches[key].levels):
+            sizes[i, h] = len(levelValues)
+            values.append(levelValues)
+
+    fileName = os.path.join(outdir, name)
+    tmpName = fileName[:-len(".npz")] + ".tmp.npz"
+    np.savez_compressed(
+        tmpName,
+        labels=np.array([key[0] for key in keys], dtype="U"),
+        level=np.array([key[1] for key in keys], dtype="U"),
+        geoids=np.array([key[2] for key in keys], dtype="U"),
+        k=np.array([sketches[key].k for key in keys], dtype=np.int32),
+        numLevels=np.array([len(sketches[key].levels) for key in keys],
+                        dtype=np.int32),
+        n=np.array([sketches[key].n for key in keys], dtype=np.int64),
+        error=np.array([sketches[key].error for key in keys],
+                       dtype=np.int64),
+        variance=np.array([sketches[key].variance for key in keys]),
+        minValue=np.array([sketches[key].minValue for key in keys]),
+        maxValue=np.array([sketches[key].maxValue for key in keys]),
+        sizes=sizes,
+        values=np.concatenate(values) if values else np.zeros(0))
+    os.replace(tmpName, fileName)
+
+    return fileName
+
+# ####################################################################
+'''
+loadSketches
+
+This function: reads the sketches written by writeSketches.  Returns a
+dictionary (Month/Year, level, GEOID) -> QuantileSketch, empty if
+outdir has no sketches.
+
+Arguments
+---------
+outdir  : string - Output directory
+'''
+
+def loadSketches(outdir):
+
+    fileName = os.path.join(outdir, sketchFile)
+    if not os.path.exists(fileName):
+        return {}
+
+    return readSketches(fileName)
+
+# ####################################################################
+'''
+readSketches
+
+This function: reads a file of sketches written by writeSketches.
+Returns a dictionary (Month/Year, level, GEOID) -> QuantileSketch.
+
+Arguments
+---------
+fileName  : string - .npz file of sketches
+'''
+
+def readSketches(fileName):
+
+    with np.load(fileName, allow_pickle=False) as saved:
+        data = {name: saved[name] for name in saved.files}
+
+    sketches = {}
+    ends = np.cumsum(data["sizes"].ravel()).reshape(data["sizes"].shape)
+    for i, key in enumerate(zip(data["labels"].tolist(),
+                                data["level"].tolist(),
+                                data["geoids"].tolist())):
+        sketch = QuantileSketch(int(data["k"][i]), sketchSeed(*key))
+        sizes = data["sizes"][i]
+        sketch.levels = [data["values"][ends[i, h] - sizes[h]:ends[i, h]]
+                         for h in range(int(data["numLevels"][i]))]
+        sketch.n = int(data["n"][i])
+        sketch.error = int(data["error"][i])
+        sketch.variance = float(data["variance"][i])
+        sketch.minValue = float(data["minValue"][i])
+        sketch.maxValue = float(data["maxValue"][i])
+        sketches[key] = sketch
+
+    return sketches
+
+# ####################################################################
+'''
+combineSketches
+
+This function: combines the sketch files of the shards of a run (see
+shardSketchFile) into one dictionary.  The shards normally hold
+different quarters;  sketches of the same quarter, level and GEOID in
+several files are merged.
+
+Arguments
+---------
+fileNames  : list - .npz files of sketches
+'''
+
+def combineSketches(fileNames):
+
+    combined = {}
+    for fileName in fileNames:
+        for key, sketch in readSketches(fileName).items():
+            if key in combined:
+                sketch = mergeSketches(key[0], key[1], key[2],
+                                       [combined[key], sketch], sketch.k)
+            combined[key] = sketch
+
+    return combined
+
+# ####################################################################
+'''
+reviseSketches
+
+This function: replaces the sketches of one quarter in outdir (for a
+reissued quarter, see hudRevise.py).  Nothing is written if outdir has
+no sketches.
+
+Arguments
+---------
+outdir    : string - Output directory
+label     : string - Month/Year label
+sketches  : dictionary - (level, GEOID) -> QuantileSketch of the quarter
+'''
+
+def reviseSketches(outdir, label, sketches):
+
+    saved = loadSketches(outdir)
+    if not saved:
+        return None
+
+    saved = {key: sketch for key, sketch in saved.items()
+             if hq.qtrKey(key[0]) != hq.qtrKey(label)}
+    for (level, geoid), sketch in sketches.items():
+        saved[(label, level, geoid)] = sketch
+
+    return writeSketches(outdir, saved)
+
+# ####################################################################
+'''
+SketchStore
+
+This class: answers percentile and rank questions from the sketches
+in a directory.  The sketches are loaded once, and again if the file
+changes.  A missing file or sketch raises LookupError.
+
+percentile() returns the estimated rank and percentile of a vacancy
+rate among the tracts of a state (or, with level "national", of the
+nation) in one quarter, with the hard bound (error) and the standard
+deviation (stdError) of the rank error, in tracts and in percentile
+points.
+quantile() returns the rate at a fraction of the tracts, with the
+same bounds.
+
+Arguments
+---------
+outdir  : string - Directory holding state_sketch.npz
+'''
+
+class SketchStore(object):
+
+    def __init__(self, outdir):
+
+        self.outdir = outdir
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.sketches = {}
+
+    def sketch(self, geoid, quarter, level):
+
+        fileName = os.path.join(self.outdir, sketchFile)
+        with self.lock:
+            try:
+                mtime = os.path.getmtime(fileName)
+            except OSError:
+                raise LookupError("no sketches in %s" % (self.outdir))
+            if mtime != self.mtime:
+                self.sketches = {(hq.qtrKey(label), level, geoid): sketch
+                                 for (label, level, geoid), sketch in
+                                 loadSketches(self.outdir).items()}
+                self.mtime = mtime
+
+        sketch = self.sketches.get((hq.qtrKey(quarter), level, str(geoid)))
+        if sketch is None:
+            raise LookupError("no sketch of %s %s in %s" %
+                              (level, geoid, quarter))
+
+        return sketch
+
+    def bounds(self, geoid, quarter, level, sketch):
+
+        n = max(sketch.n, 1)
+        return {"level": level,
+                "GEOID": str(geoid),
+                "Month/Year": hc.qtrLabel(*divmod(hq.qtrKey(quarter), 100)),
+                "n": sketch.n,
+                "error": sketch.error,
+                "stdError": sketch.stdError(),
+                "percentileError": 100.0 * sketch.error / n,
+                "percentileStdError": 100.0 * sketch.stdError() / n,
+                "exact": sketch.error == 0}
+
+    def percentile(self, geoid, quarter, rate, level="state"):
+
+        sketch = self.sketch(geoid, quarter, level)
+        rank = int(sketch.rank(rate))
+
+        answer = self.bounds(geoid, quarter, level, sketch)
+        answer.update({"rate": float(rate),
+                       "rank": rank,
+                       "percentile": 100.0 * rank / sketch.n
+                       if sketch.n else float("nan")})
+        return answer
+
+    def quantile(self, geoid, quarter, q, level="state"):
+
+        if not 0 <= q <= 1:
+            raise ValueError("quantile must be between 0 and 1: %r" % (q))
+        sketch = self.sketch(geoid, quarter, level)
+
+        answer = self.bounds(geoid, quarter, level, sketch)
+        answer.update({"q": float(q),
+                       "rate": float(sketch.quantile(q))})
+        return answer
@@ -0,0 +1,691 @@
+# ####################################################################
+#
+# Program:  hudSpatial.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module calculates the spatial autocorrelation of the tract
+# vacancy rate (RES_VAC / AMS_RES) for every quarter:  the global
+# Moran's I, and the local Moran's I (LISA) of every tract.
+#
+# The tract contiguity weights are built once from the shapefile which
+# ships with the HUD .dbf (the .shp of the same name), and cached as a
+# sparse matrix (.npz) keyed on the size and modification time of the
+# .shp and of the .dbf the GEOIDs come from.  Two tracts are neighbors
+# if they share a vertex (queen) or an edge (rook).  The .shp is read
+# directly, so neither pysal nor any geometry package is needed, and
+# the weights are row standardized.
+#
+# The rates of all quarters form one matrix (tracts x quarters), so
+# every statistic is a batched sparse product over all quarters at
+# once instead of one call per quarter.  A tract with no rate in a
+# quarter (not in the file, or no addresses) is left out of that
+# quarter:  the number of tracts, the moments and the weight sums (S0,
+# S1, S2) are those of the tracts with a rate, and each tract's weights
+# are standardized over its neighbors with a rate, as if the weights
+# had been built for that quarter's tracts alone.
+#
+# The inference is analytical:  the global statistic under the
+# normality assumption, and the local statistics under randomization
+# (Anselin, 1995), so no permutations are needed.
+#
+# The same weights give the Getis-Ord Gi* hot and cold spots of long
+# term vacancy:  the share of the addresses of a tract which have been
+# vacant for 24 months or more ((VAC_24_36R + VAC_36_RES) / AMS_RES).
+# Gi* uses the binary weights with each tract counted as its own
+# neighbor, and its z-scores are also calculated for the whole tract x
+# quarter panel at once.  As for Moran's I, a tract without a rate is
+# left out of the quarter:  the mean, standard deviation and n are
+# those of the tracts with a rate, and only the neighbors with a rate
+# count in a tract's sum and weight.
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import math
+import struct
+import hashlib
+import zipfile
+import numpy as np
+import pandas as pd
+import hudAggregate as ha
+import hudCatalog as hc
+import hudQuery as hq
+
+try:
+    from scipy.special import erfc      # optional, faster p-values
+except ImportError:
+    erfc = np.frompyfunc(math.erfc, 1, 1)
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# shape types with polygon (or polyline) parts:  Polygon, PolygonZ,
+# PolygonM
+polygonTypes = [5, 15, 25]
+
+# quarters per batch of the neighbor sums (bounds their memory)
+lagQuarters = 16
+
+# significance level of the LISA clusters
+defaultAlpha = 0.05
+
+# Gi* classes:  z-score thresholds of the 99%, 95% and 90% levels
+hotspotLevels = [(2.576, "99"), (1.960, "95"), (1.645, "90")]
+
+moranHeadings = ["Month/Year", "tracts", "I", "EI", "VI", "z", "p"]
+lisaHeadings = ["Month/Year", "GEOID", "rate", "Ii", "z", "p", "cluster"]
+gistarHeadings = ["Month/Year", "GEOID", "longTermRate", "z", "p", "class"]
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+readShapes
+
+This function: reads the polygon vertices of a shapefile (.shp).
+Returns the record number of every vertex, its x and y coordinates,
+and whether it starts a part (ring), as arrays, and the number of
+records.
+
+Arguments
+---------
+fileName  : string - .shp filename (or zip archive member)
+'''
+
+def readShapes(fileName):
+
+    inFile = hc.openInput(fileName)
+    try:
+        data = inFile.read()
+    finally:
+        inFile.close()
+        if hasattr(inFile, "archive"):
+            inFile.archive.close()
+
+    records = []
+    points = []
+    partStarts = []
+    pos = 100
+    record = 0
+    while pos + 8 <= len(data):
+        length = struct.unpack(">i", data[pos + 4:pos + 8])[0] * 2
+        content = data[pos + 8:pos + 8 + length]
+        pos += 8 + length
+        if len(content) >= 44 and \
+                struct.unpack("<i", content[:4])[0] in polygonTypes:
+            numParts, numPoints = struct.unpack("<ii", content[36:44])
+            parts = np.frombuffer(content, dtype="<i4", count=numParts,
+                                  offset=44)
+            xy = np.frombuffer(content, dtype="<f8", count=2 * numPoints,
+                               offset=44 + 4 * numParts).reshape(-1, 2)
+            starts = np.zeros(numPoints, dtype=bool)
+            starts[parts[parts < numPoints]] = True
+            points.append(xy)
+            partStarts.append(starts)
+            records.append(np.full(numPoints, record, dtype=np.int64))
+        record += 1
+
+    if not points:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0),
+                np.zeros(0, dtype=bool), record)
+
+    xy = np.concatenate(points)
+    return (np.concatenate(records), xy[:, 0], xy[:, 1],
+            np.concatenate(partStarts), record)
+
+# ####################################################################
+'''
+sharedPairs
+
+This function: returns the pairs of records (i, j), i != j, which have
+a key in common (a vertex, or an edge).
+
+Arguments
+---------
+records  : array - Record number of every key
+keys     : array - Integer key
+'''
+
+def sharedPairs(records, keys):
+
+    # each (record, key) once, sorted by key
+    order = np.lexsort((records, keys))
+    keys, records = keys[order], records[order]
+    first = np.r_[True, (keys[1:] != keys[:-1]) |
+                  (records[1:] != records[:-1])]
+    keys, records = keys[first], records[first]
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    sizes = np.diff(np.r_[starts, len(keys)])
+
+    pairs = []
+    for size in np.unique(sizes[sizes > 1]):
+        groups = records[starts[sizes == size][:, None] +
+                         np.arange(size)[None, :]]
+        i, j = np.triu_indices(size, 1)
+        pairs.append(np.stack([groups[:, i].ravel(), groups[:, j].ravel()]))
+
+    if not pairs:
+        return np.zeros((2, 0), dtype=np.int64)
+
+    return np.concatenate(pairs, axis=1)
+
+# ####################################################################
+'''
+contiguity
+
+This function: builds the binary contiguity matrix of a shapefile, in
+compressed sparse row form.  Returns (indptr, indices).
+
+Arguments
+---------
+fileName  : string - .shp filename
+rule      : string - "queen" (shared vertex) or "rook" (shared edge)
+'''
+
+def contiguity(fileName, rule="queen"):
+
+    records, x, y, partStarts, numRecords = readShapes(fileName)
+
+    # every distinct vertex gets an integer id
+    _, vertex = np.unique(x + 1j * y, return_inverse=True)
+    vertex = vertex.ravel().astype(np.int64)
+
+    if rule == "queen":
+        pairs = sharedPairs(records, vertex)
+    elif rule == "rook":
+        # edges join consecutive vertices of the same part
+        same = ~partStarts[1:]
+        a, b = vertex[:-1][same], vertex[1:][same]
+        edge = np.minimum(a, b) * (vertex.max() + 1) + np.maximum(a, b)
+        pairs = sharedPairs(records[:-1][same], edge)
+    else:
+        raise ValueError("unknown contiguity rule: %s" % (rule))
+
+    # both directions, each pair once
+    i = np.r_[pairs[0], pairs[1]]
+    j = np.r_[pairs[1], pairs[0]]
+    linked = np.unique(i * numRecords + j)
+    i, j = linked // numRecords, linked % numRecords
+
+    indptr = np.r_[0, np.cumsum(np.bincount(i, minlength=numRecords))]
+
+    return indptr, j
+
+# ####################################################################
+'''
+shapeGEOIDs
+
+This function: returns the GEOIDs of the records of a shapefile, from
+the .dbf which goes with it.
+
+Arguments
+---------
+dbfName  : string - .dbf filename (or zip archive member)
+'''
+
+def shapeGEOIDs(dbfName):
+
+    records = ha.readDBF(dbfName).rename(columns=str.upper)
+
+    return np.array(records["GEOID"].astype(str).tolist(), dtype="U")
+
+# ####################################################################
+'''
+dbfFor
+
+This function: returns the .dbf which goes with a .shp.
+
+Arguments
+---------
+shpName  : string - .shp filename (or zip archive member)
+'''
+
+def dbfFor(shpName):
+
+    base, ext = os.path.splitext(shpName)
+
+    return base + (".DBF" if ext == ".SHP" else ".dbf")
+
+# ####################################################################
+'''
+shapefileFor
+
+This function: returns the .shp which goes with a HUD input (the .shp
+of the same name, on disk or in the same zip archive).  Raises
+ValueError if there isn't one.
+
+Arguments
+---------
+fileName  : string - HUD input name
+'''
+
+def shapefileFor(fileName):
+
+    diskFile, member = hc.splitInput(fileName)
+    if hc.isZip(fileName):
+        member = hc.inputName(fileName)
+        shpMember = os.path.splitext(member)[0] + ".shp"
+        with zipfile.ZipFile(diskFile) as archive:
+            names = {name.lower(): name for name in archive.namelist()}
+        if shpMember.lower() in names:
+            return diskFile + hc.memberSeparator + names[shpMember.lower()]
+    else:
+        for ext in [".shp", ".SHP"]:
+            shpName = os.path.splitext(diskFile)[0] + ext
+            if os.path.exists(shpName):
+                return shpName
+
+    raise ValueError("no shapefile (.shp) next to %s" % (fileName))
+
+# ####################################################################
+'''
+shapefileKey
+
+This function: returns the cache key of data built from a shapefile:
+the SHA-1 of its path, the size and modification time of the .shp and
+of its .dbf, and any extra settings.
+
+Arguments
+---------
+shpName  : string - .shp filename (or zip archive member)
+extra    : any - Settings the data depends on
+'''
+
+def shapefileKey(shpName, *extra):
+
+    parts = [os.path.abspath(shpName)]
+    for fileName in [shpName, dbfFor(shpName)]:
+        stat = os.stat(hc.splitInput(fileName)[0])
+        parts += ["%i" % (stat.st_size), "%r" % (stat.st_mtime)]
+    parts += [str(value) for value in extra]
+
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+# ####################################################################
+'''
+loadWeights
+
+This function: returns the contiguity weights of a shapefile as a
+dictionary with the GEOIDs and the sparse matrix (indptr, indices),
+reading them from the cache directory if they were built before.
+
+Arguments
+---------
+shpName   : string - .shp filename (or zip archive member)
+cacheDir  : string - Directory for the cached weights
+rule      : string - "queen" or "rook"
+'''
+
+def loadWeights(shpName, cacheDir, rule="queen"):
+
+    key = shapefileKey(shpName, rule)
+    cacheName = os.path.join(cacheDir, "weights_%s_%s.npz" % (rule,
+                                                              key[:16]))
+
+    if os.path.exists(cacheName):
+        with np.load(cacheName, allow_pickle=False) as cached:
+            return {"geoids": cached["geoids"],
+                    "indptr": cached["indptr"],
+                    "indices": cached["indices"],
+                    "cache": cacheName}
+
+    indptr, indices = contiguity(shpName, rule)
+    geoids = shapeGEOIDs(dbfFor(shpName))
+    if len(geoids) != len(indptr) - 1:
+        raise ValueError("%s has %i shapes but %i records" %
+                         (shpName, len(indptr) - 1, len(geoids)))
+
+    tmpName = cacheName[:-len(".npz")] + ".tmp.npz"
+    np.savez_compressed(tmpName, geoids=geoids, indptr=indptr,
+                        indices=indices)
+    os.replace(tmpName, cacheName)
+
+    return {"geoids": geoids, "indptr": indptr, "indices": indices,
+            "cache": cacheName}
+
+# ####################################################################
+'''
+neighborSums
+
+This function: returns the sum of Z over the neighbors of every tract
+(the binary weights times Z), for the columns (quarters) of Z in
+batches of lagQuarters.
+
+Arguments
+---------
+indptr   : array - Row pointers of the contiguity matrix
+indices  : array - Column indices of the contiguity matrix
+Z        : array - Values (tracts x quarters)
+'''
+
+def neighborSums(indptr, indices, Z):
+
+    linked = np.diff(indptr) > 0
+    sums = np.zeros(Z.shape)
+    if len(indices):
+        for col in range(0, Z.shape[1], lagQuarters):
+            batch = Z[:, col:col + lagQuarters]
+            sums[linked, col:col + lagQuarters] = np.add.reduceat(
+                batch[indices], indptr[:-1][linked], axis=0)
+
+    return sums
+
+# ####################################################################
+'''
+rateMatrix
+
+This function: returns the vacancy rate of every tract of the weights
+(rows) in every quarter of the tract output (columns), NaN where the
+tract has no rate, and the quarters as Month/Year labels.
+
+Arguments
+---------
+index       : LevelIndex - Tract rows (see hudQuery)
+geoids      : array - GEOIDs of the weights
+vacantCols  : list - Vacant columns summed for the rate
+'''
+
+def rateMatrix(index, geoids, vacantCols=["RES_VAC"]):
+
+    quarters = index.quarters()
+    rows = pd.Index(geoids).get_indexer(index.geoids)
+    cols = np.searchsorted(quarters, index.keys)
+
+    units = index.values[:, hq.metricCols.index("AMS_RES")]
+    vacant = sum(index.values[:, hq.metricCols.index(col)]
+                 for col in vacantCols)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rate = np.where(units > 0, vacant / units, np.nan)
+
+    Y = np.full((len(geoids), len(quarters)), np.nan)
+    found = rows >= 0
+    Y[rows[found], cols[found]] = rate[found]
+
+    return Y, [hc.qtrLabel(*divmod(key, 100)) for key in quarters]
+
+# ####################################################################
+'''
+moranStats
+
+This function: calculates the global Moran's I of every quarter, and
+the local Moran's I of every tract in every quarter, as batched
+products over the tracts with a rate in each quarter (the weights are
+standardized over the neighbors with a rate).  Returns a dictionary of
+arrays:  per quarter I, EI, VI, z, p and the number of tracts with a
+rate; per tract and quarter Ii, z, p and the lag of the deviations.
+
+Arguments
+---------
+indptr   : array - Row pointers of the contiguity matrix
+indices  : array - Column indices of the contiguity matrix
+Y        : array - Rates (tracts x quarters), NaN where missing
+'''
+
+def moranStats(indptr, indices, Y):
+
+    # deviations from the quarter's mean, 0 where there is no rate
+    valid = np.isfinite(Y)
+    n = valid.sum(axis=0).astype(float)
+    with np.errstate(invalid="ignore"):
+        means = np.nanmean(np.where(valid, Y, np.nan), axis=0)
+    Z = np.where(valid, Y - means, 0.0)
+
+    # the weights of each quarter:  row standardized over the neighbors
+    # with a rate (rowSum 1 and rowSq 1 / neighbors, or 0 for none)
+    linked = neighborSums(indptr, indices, valid.astype(float))
+    with np.errstate(divide="ignore"):
+        rowSq = np.where(valid & (linked > 0), 1.0 / linked, 0.0)
+    rowSum = (rowSq > 0).astype(float)
+    lag = neighborSums(indptr, indices, Z) * rowSq
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        m2 = (Z ** 2).sum(axis=0) / n
+        m4 = (Z ** 4).sum(axis=0) / n
+
+    # global Moran's I, inference under normality.  A pair of
+    # neighbors (both with a rate) weighs w + wT, and every tract's
+    # column sum is the sum of its neighbors' 1 / neighbors
+    S0 = rowSum.sum(axis=0)
+    rows = np.repeat(np.arange(len(Y)), np.diff(indptr))
+    S1 = np.zeros(len(n))
+    for col in range(0, len(n), lagQuarters):
+        span = slice(col, col + lagQuarters)
+        pair = rowSq[rows, span] + rowSq[indices, span]
+        pair *= valid[rows, span] & valid[indices, span]
+        S1[span] = 0.5 * (pair ** 2).sum(axis=0)
+    colSum = neighborSums(indptr, indices, rowSq) * valid
+    S2 = ((rowSum + colSum) ** 2).sum(axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        I = (n / S0) * (Z * lag).sum(axis=0) / (Z ** 2).sum(axis=0)
+        EI = np.where(n > 1, -1.0 / (n - 1), np.nan)
+        VI = (n * n * S1 - n * S2 + 3 * S0 * S0) / \
+            ((n * n - 1) * S0 * S0) - EI * EI
+        zI = (I - EI) / np.sqrt(VI)
+
+        # local Moran's I, inference under randomization
+        b2 = m4 / (m2 * m2)
+        Ii = Z / m2 * lag
+        EIi = -rowSum / (n - 1)
+        VIi = (rowSq * (n - b2) / (n - 1) +
+               (rowSum ** 2 - rowSq) * (2 * b2 - n) /
+               ((n - 1) * (n - 2)) - EIi ** 2)
+        zIi = (Ii - EIi) / np.sqrt(VIi)
+
+    return {"I": I, "EI": EI, "VI": VI,
+            "z": zI, "p": normalP(zI), "tracts": n.astype(np.int64),
+            "Ii": Ii, "zIi": zIi, "pIi": normalP(zIi), "Z": Z, "lag": lag,
+            "valid": valid}
+
+# ####################################################################
+'''
+giStarStats
+
+This function: calculates the Getis-Ord Gi* z-score of every tract in
+every quarter, as batched products over the tracts with a value in
+each quarter.  The weights are binary, with each tract its own
+neighbor.  Returns the z-scores and their p-values (NaN where there is
+no value).
+
+Arguments
+---------
+indptr   : array - Row pointers of the contiguity matrix
+indices  : array - Column indices of the contiguity matrix
+X        : array - Values (tracts x quarters), NaN where missing
+'''
+
+def giStarStats(indptr, indices, X):
+
+    # the quarter's tracts with a value, and their mean and deviation
+    valid = np.isfinite(X)
+    n = valid.sum(axis=0)
+    with np.errstate(invalid="ignore"):
+        means = np.nanmean(np.where(valid, X, np.nan), axis=0)
+        stds = np.nanstd(np.where(valid, X, np.nan), axis=0)
+    X = np.where(valid, X, 0.0)
+
+    # sum over each tract and its neighbors with a value
+    sums = neighborSums(indptr, indices, X) + X
+    weight = neighborSums(indptr, indices, valid.astype(float)) + 1.0
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (sums - means * weight) / \
+            (stds * np.sqrt((n * weight - weight ** 2) / (n - 1)))
+    z[~valid] = np.nan
+
+    return {"z": z, "p": normalP(z), "valid": valid}
+
+# ####################################################################
+'''
+hotspotClasses
+
+This function: returns the Gi* class of every tract and quarter:
+"hot 99", "hot 95", "hot 90", the same for "cold", or "ns".
+
+Arguments
+---------
+z  : array - Gi* z-scores
+'''
+
+def hotspotClasses(z):
+
+    classes = np.full(z.shape, "ns", dtype="<U7")
+    with np.errstate(invalid="ignore"):
+        for threshold, level in reversed(hotspotLevels):
+            classes[z >= threshold] = "hot " + level
+            classes[z <= -threshold] = "cold " + level
+
+    return classes
+
+# ####################################################################
+'''
+normalP
+
+This function: returns the two-sided p-values of standard normal
+z-scores (NaN stays NaN).
+
+Arguments
+---------
+z  : array - z-scores
+'''
+
+def normalP(z):
+
+    z = np.asarray(z, dtype=float)
+    p = np.full(z.shape, np.nan)
+    finite = np.isfinite(z)
+    p[finite] = np.asarray(erfc(np.abs(z[finite]) / math.sqrt(2)),
+                           dtype=float)
+
+    return p
+
+# ####################################################################
+'''
+clusterLabels
+
+This function: returns the LISA cluster of every tract and quarter:
+HH (high rate among high), LL, HL, LH, or "ns" when the local
+statistic isn't significant (or the tract has no rate).
+
+Arguments
+---------
+stats  : dictionary - Result of moranStats
+alpha  : float - Significance level
+'''
+
+def clusterLabels(stats, alpha=defaultAlpha):
+
+    Z, lag = stats["Z"], stats["lag"]
+    labels = np.full(Z.shape, "ns", dtype="<U2")
+    significant = (stats["pIi"] < alpha) & stats["valid"]
+
+    labels[significant & (Z > 0) & (lag > 0)] = "HH"
+    labels[significant & (Z < 0) & (lag < 0)] = "LL"
+    labels[significant & (Z > 0) & (lag < 0)] = "HL"
+    labels[significant & (Z < 0) & (lag > 0)] = "LH"
+
+    return labels
+
+# ####################################################################
+'''
+writeSpatial
+
+This function: calculates the statistics for all quarters of the tract
+output in outdir and writes moran.csv (one row per quarter) and
+lisa.csv (one row per tract with a rate, per quarter).  Returns the
+number of rows of each.
+
+Arguments
+---------
+outdir   : string - Directory holding tract.csv
+weights  : dictionary - Contiguity weights (see loadWeights)
+alpha    : float - Significance level of the LISA clusters
+'''
+
+def writeSpatial(outdir, weights, alpha=defaultAlpha):
+
+    index = hq.HUDStore(outdir).level("tract")
+    Y, labels = rateMatrix(index, weights["geoids"])
+    stats = moranStats(weights["indptr"], weights["indices"], Y)
+    clusters = clusterLabels(stats, alpha)
+
+    moranRows = [[label, int(stats["tracts"][q]), stats["I"][q],
+                  stats["EI"][q], stats["VI"][q], stats["z"][q],
+                  stats["p"][q]]
+                 for q, label in enumerate(labels)]
+    outFile = open(os.path.join(outdir, "moran.csv"), "w")
+    outWriter = ha.newWriter(outFile)
+    outWriter.writerow(moranHeadings)
+    outWriter.writerows(moranRows)
+    outFile.close()
+
+    numLisa = 0
+    outFile = open(os.path.join(outdir, "lisa.csv"), "w")
+    outWriter = ha.newWriter(outFile)
+    outWriter.writerow(lisaHeadings)
+    geoids = weights["geoids"].tolist()
+    for q, label in enumerate(labels):
+        rows = np.flatnonzero(stats["valid"][:, q])
+        outWriter.writerows(
+            [label, geoids[r], rate, Ii, z, p, cluster]
+            for r, rate, Ii, z, p, cluster in zip(
+                rows.tolist(), Y[rows, q].tolist(),
+                stats["Ii"][rows, q].tolist(),
+                stats["zIi"][rows, q].tolist(),
+                stats["pIi"][rows, q].tolist(),
+                clusters[rows, q].tolist()))
+        numLisa += len(rows)
+    outFile.close()
+
+    return {"moran": len(moranRows), "lisa": numLisa}
+
+# ####################################################################
+'''
+writeHotspots
+
+This function: calculates the Gi* hot and cold spots of long term
+vacancy for all quarters of the tract output in outdir and writes
+gistar.csv (one row per tract with a rate, per quarter).  Returns the
+number of rows written.
+
+Arguments
+---------
+outdir   : string - Directory holding tract.csv
+weights  : dictionary - Contiguity weights (see loadWeights)
+'''
+
+def writeHotspots(outdir, weights):
+
+    index = hq.HUDStore(outdir).level("tract")
+    X, labels = rateMatrix(index, weights["geoids"],
+                           ["VAC_24_36R", "VAC_36_RES"])
+    stats = giStarStats(weights["indptr"], weights["indices"], X)
+    classes = hotspotClasses(stats["z"])
+
+    numRows = 0
+    outFile = open(os.path.join(outdir, "gistar.csv"), "w")
+    outWriter = ha.newWriter(outFile)
+    outWriter.writerow(gistarHeadings)
+    geoids = weights["geoids"].tolist()
+    for q, label in enumerate(labels):
+        rows = np.flatnonzero(stats["valid"][:, q])
+        outWriter.writerows(
+            [label, geoids[r], rate, z, p, hotspot]
+            for r, rate, z, p, hotspot in zip(
+                rows.tolist(), X[rows, q].tolist(),
+                stats["z"][rows, q].tolist(), stats["p"][rows, q].tolist(),
+                classes[rows, q].tolist()))
+        numRows += len(rows)
+    outFile.close()
+
+    return numRows
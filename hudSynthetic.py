@@ -0,0 +1,456 @@
+# ####################################################################
+#
+# Program:  hudSynthetic.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# The HUD data is not open source (see README.md), so it can't be
+# shared for testing or benchmarking.  This script writes synthetic
+# HUD tract files (*Data.dbf) which look like the real ones:
+#
+# - the same fields, with uppercase headings before 2015 and lowercase
+#   headings from 3/2015 on (as HUD does), and newer files unsorted
+# - GEOIDs built from the real state FIPS codes, with roughly the real
+#   number of counties and tracts in each state
+# - vacancy counts split into the VAC_* buckets so that they add up to
+#   RES_VAC, and tract values that drift from quarter to quarter
+#
+# The number of tracts is set by a scale factor (1 = national scale,
+# about 73,767 tracts) or directly, and any number of quarters can be
+# written.  The same seed always writes the same files.
+#
+# Usage:
+#
+#   python hudSynthetic.py --outdir DIR [--scale X | --tracts N]
+#                          [--quarters N] [--start MM/YYYY] [--seed N]
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import argparse
+import struct
+from datetime import date
+import numpy as np
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# number of census tracts in a national HUD file
+nationalTracts = 73767
+
+# state FIPS code : (number of counties, approximate number of tracts)
+stateSizes = {"01": (67, 1181), "02": (29, 167), "04": (15, 1526),
+              "05": (75, 686), "06": (58, 8057), "08": (64, 1249),
+              "09": (8, 833), "10": (3, 218), "11": (1, 179),
+              "12": (67, 4245), "13": (159, 1969), "15": (5, 351),
+              "16": (44, 298), "17": (102, 3123), "18": (92, 1511),
+              "19": (99, 825), "20": (105, 770), "21": (120, 1115),
+              "22": (64, 1148), "23": (16, 358), "24": (24, 1406),
+              "25": (14, 1478), "26": (83, 2813), "27": (87, 1338),
+              "28": (82, 664), "29": (115, 1393), "30": (56, 271),
+              "31": (93, 532), "32": (17, 687), "33": (10, 295),
+              "34": (21, 2010), "35": (33, 499), "36": (62, 4918),
+              "37": (100, 2195), "38": (53, 205), "39": (88, 2952),
+              "40": (77, 1046), "41": (36, 834), "42": (67, 3218),
+              "44": (5, 244), "45": (46, 1103), "46": (66, 222),
+              "47": (95, 1497), "48": (254, 5265), "49": (29, 588),
+              "50": (14, 184), "51": (134, 1907), "53": (39, 1458),
+              "54": (55, 484), "55": (72, 1409), "56": (23, 132),
+              "72": (78, 945)}
+
+# fields of a HUD tract file:  (name, type, length, decimals)
+hudFields = [("GEOID", "C", 11, 0),
+             ("AMS_RES", "N", 10, 0),
+             ("AMS_BUS", "N", 10, 0),
+             ("RES_VAC", "N", 10, 0),
+             ("BUS_VAC", "N", 10, 0),
+             ("AVG_VAC_R", "N", 12, 2),
+             ("VAC_3_RES", "N", 10, 0),
+             ("VAC_3_6_R", "N", 10, 0),
+             ("VAC_6_12R", "N", 10, 0),
+             ("VAC_12_24R", "N", 10, 0),
+             ("VAC_24_36R", "N", 10, 0),
+             ("VAC_36_RES", "N", 10, 0),
+             ("NOSTAT_RES", "N", 10, 0)]
+
+# the VAC_* buckets, and the share of vacant units in each
+bucketCols = ["VAC_3_RES", "VAC_3_6_R", "VAC_6_12R",
+              "VAC_12_24R", "VAC_24_36R", "VAC_36_RES"]
+bucketShares = [0.22, 0.14, 0.17, 0.17, 0.12, 0.18]
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+hudFileName
+
+This function: returns the filename used for a synthetic HUD file,
+which carries the year and month of the quarter.
+
+Arguments
+---------
+year   : int - Year of the quarter
+month  : int - Month of the quarter (3, 6, 9 or 12)
+'''
+
+def hudFileName(year, month):
+
+    return "USPS_vac_%04d_%02d_tract_2kx_Data.dbf" % (year, month)
+
+# ####################################################################
+'''
+quarterList
+
+This function: returns a list of (year, month) quarters, starting at
+a given quarter.
+
+Arguments
+---------
+start     : string - First quarter, as MM/YYYY
+quarters  : int - Number of quarters
+'''
+
+def quarterList(start, quarters):
+
+    month, year = [int(x) for x in start.split("/")]
+    result = []
+    for i in range(quarters):
+        result.append((year, month))
+        month += 3
+        if month > 12:
+            month -= 12
+            year += 1
+
+    return result
+
+# ####################################################################
+'''
+tractUniverse
+
+This function: returns the GEOIDs of every synthetic tract, in GEOID
+order, as a dictionary of numpy byte string arrays keyed by state.
+Tracts are spread over the counties of each state unevenly (a few
+large counties, many small ones), as in the real data.
+
+Arguments
+---------
+numTracts  : int - Total number of tracts
+seed       : int - Random seed
+'''
+
+def tractUniverse(numTracts, seed=0):
+
+    total = float(sum(n for _, n in stateSizes.values()))
+    universe = {}
+
+    for stateIndex, state in enumerate(sorted(stateSizes)):
+        rng = np.random.RandomState([seed, stateIndex])
+        numCounties, stateTracts = stateSizes[state]
+        n = max(numCounties, int(round(numTracts * stateTracts / total)))
+
+        # county FIPS codes are odd numbers:  001, 003, 005, ...
+        counties = np.arange(numCounties) * 2 + 1
+        weights = rng.lognormal(0.0, 1.0, numCounties)
+        perCounty = 1 + rng.multinomial(n - numCounties,
+                                        weights / weights.sum())
+
+        # tract codes like 000100, 000200, ... then 000101, ...
+        countyOf = np.repeat(counties, perCounty)
+        tracts = np.arange(n) - np.repeat(np.cumsum(perCounty) - perCounty,
+                                          perCounty)
+        codes = (tracts % 9900 + 1) * 100 + tracts // 9900
+
+        geoids = np.empty((n, 11), dtype=np.uint8)
+        geoids[:, 0:2] = np.frombuffer(state.encode("ascii"), dtype=np.uint8)
+        geoids[:, 2:5] = zeroPadded(countyOf, 3)
+        geoids[:, 5:11] = zeroPadded(codes, 6)
+        universe[state] = np.sort(geoids.view("S11").ravel())
+
+    return universe
+
+# ####################################################################
+'''
+tractValues
+
+This function: returns the synthetic values of one state's tracts for
+one quarter, as a dictionary of numpy arrays keyed by field name.
+Each tract keeps its size and typical vacancy rate across quarters,
+and the quarter adds a national cycle and some noise.
+
+Arguments
+---------
+numTracts     : int - Number of tracts in the state
+stateIndex    : int - Position of the state (for the random seed)
+quarterIndex  : int - Position of the quarter (for the random seed)
+seed          : int - Random seed
+'''
+
+def tractValues(numTracts, stateIndex, quarterIndex, seed=0):
+
+    # tract characteristics which don't change between quarters
+    base = np.random.RandomState([seed, stateIndex, 0])
+    amsRes = np.round(base.lognormal(7.3, 0.5, numTracts)).astype(np.int64)
+    amsBus = np.round(amsRes * base.uniform(0.02, 0.15, numTracts))
+    rate = base.beta(1.5, 40.0, numTracts)
+    avgDays = base.uniform(150.0, 600.0, numTracts)
+
+    # this quarter:  a slow national cycle plus noise for each tract
+    rng = np.random.RandomState([seed, stateIndex, quarterIndex + 1])
+    cycle = 1.0 + 0.25 * np.sin(quarterIndex / 8.0)
+    rate = np.clip(rate * cycle * rng.lognormal(0.0, 0.15, numTracts),
+                   0.0, 0.9)
+    amsRes = amsRes + rng.randint(-5, 6, numTracts)
+    amsRes = np.maximum(amsRes, 0)
+
+    resVac = rng.binomial(amsRes, rate)
+
+    # split the vacant units into the buckets (a multinomial draw for
+    # every tract, done one bucket at a time)
+    buckets = np.zeros((numTracts, len(bucketCols)), dtype=np.int64)
+    remaining = resVac.copy()
+    shareLeft = 1.0
+    for i, share in enumerate(bucketShares[:-1]):
+        buckets[:, i] = rng.binomial(remaining, min(1.0, share / shareLeft))
+        remaining -= buckets[:, i]
+        shareLeft -= share
+    buckets[:, -1] = remaining
+
+    values = {"AMS_RES": amsRes,
+              "AMS_BUS": amsBus,
+              "RES_VAC": resVac,
+              "BUS_VAC": rng.binomial(amsBus.astype(np.int64), 0.08),
+              "AVG_VAC_R": np.where(resVac > 0,
+                                    avgDays * rng.uniform(0.9, 1.1,
+                                                          numTracts),
+                                    0.0),
+              "NOSTAT_RES": rng.poisson(amsRes * 0.01)}
+    for i, col in enumerate(bucketCols):
+        values[col] = buckets[:, i]
+
+    return values
+
+# ####################################################################
+'''
+zeroPadded
+
+This function: formats an array of non-negative integers as zero
+padded ASCII digits.  Returns a (records x width) array of bytes.
+
+Arguments
+---------
+values  : array - Integers to be formatted
+width   : int - Number of digits
+'''
+
+def zeroPadded(values, width):
+
+    out = np.empty((len(values), width), dtype=np.uint8)
+    rest = np.asarray(values, dtype=np.int64).copy()
+    for i in range(width - 1, -1, -1):
+        out[:, i] = 48 + rest % 10
+        rest //= 10
+
+    return out
+
+# ####################################################################
+'''
+numericField
+
+This function: formats a numpy array as a right-justified, fixed
+width .dbf numeric field, without a Python loop over the records.
+Returns a (records x length) array of ASCII bytes.
+
+Arguments
+---------
+values    : array - Values to be formatted (non-negative)
+length    : int - Field length
+decimals  : int - Number of decimal places
+'''
+
+def numericField(values, length, decimals=0):
+
+    scaled = np.round(np.asarray(values, dtype=np.float64) *
+                      10 ** decimals).astype(np.int64)
+    digits = length - (1 if decimals else 0)
+
+    out = zeroPadded(scaled, digits)
+
+    # blank the leading zeros (but keep one digit before the point)
+    used = 1 + (scaled[:, np.newaxis] >=
+                10 ** np.arange(1, digits, dtype=np.int64)).sum(axis=1)
+    used = np.maximum(used, decimals + 1)
+    out[np.arange(digits)[np.newaxis, :] <
+        (digits - used)[:, np.newaxis]] = 32
+
+    if decimals:
+        point = np.full((len(scaled), 1), 46, dtype=np.uint8)
+        out = np.hstack([out[:, :digits - decimals], point,
+                         out[:, digits - decimals:]])
+
+    return out
+
+# ####################################################################
+'''
+dbfHeader
+
+This function: returns the header of a dBase III (.dbf) file.
+
+Arguments
+---------
+fields      : list - (name, type, length, decimals) for each field
+numRecords  : int - Number of records in the file
+'''
+
+def dbfHeader(fields, numRecords):
+
+    today = date.today()
+    headerLen = 32 + 32 * len(fields) + 1
+    recordLen = 1 + sum(field[2] for field in fields)
+
+    header = struct.pack("<BBBBIHH20x", 3, today.year - 1900, today.month,
+                         today.day, numRecords, headerLen, recordLen)
+    for name, fieldType, length, decimals in fields:
+        header += struct.pack("<11sc4xBB14x", name.encode("ascii"),
+                              fieldType.encode("ascii"), length, decimals)
+
+    return header + b"\r"
+
+# ####################################################################
+'''
+writeHUDFile
+
+This function: writes one synthetic HUD tract file for one quarter.
+The file is written one state at a time, so memory use is bounded by
+the largest state.  Returns the number of records written.
+
+Arguments
+---------
+fileName      : string - Output filename
+universe      : dictionary - Tract GEOIDs by state (tractUniverse)
+quarterIndex  : int - Position of the quarter (for the random seed)
+lowercase     : boolean - Write lowercase field names
+unsorted      : boolean - Write the records in no particular order
+seed          : int - Random seed
+'''
+
+def writeHUDFile(fileName, universe, quarterIndex, lowercase=False,
+                 unsorted=False, seed=0):
+
+    fields = [(name.lower() if lowercase else name, fieldType, length,
+               decimals) for name, fieldType, length, decimals in hudFields]
+    recordLen = 1 + sum(field[2] for field in hudFields)
+    numRecords = sum(len(geoids) for geoids in universe.values())
+
+    states = sorted(universe)
+    order = np.random.RandomState([seed, quarterIndex, 99])
+    if unsorted:
+        states = [states[i] for i in order.permutation(len(states))]
+
+    with open(fileName, "wb") as outFile:
+        outFile.write(dbfHeader(fields, numRecords))
+
+        for state in states:
+            geoids = universe[state]
+            n = len(geoids)
+            values = tractValues(n, sorted(universe).index(state),
+                                 quarterIndex, seed)
+
+            records = np.empty((n, recordLen), dtype=np.uint8)
+            records[:, 0] = 32          # not deleted
+            pos = 1
+            for name, fieldType, length, decimals in hudFields:
+                if fieldType == "C":
+                    records[:, pos:pos + length] = \
+                        geoids.view(np.uint8).reshape(n, length)
+                else:
+                    records[:, pos:pos + length] = \
+                        numericField(values[name], length, decimals)
+                pos += length
+
+            if unsorted:
+                records = records[order.permutation(n)]
+            outFile.write(records.tobytes())
+
+        outFile.write(b"\x1a")
+
+    return numRecords
+
+# ####################################################################
+'''
+writeHUDFiles
+
+This function: writes a synthetic HUD file for each quarter to outdir
+and returns the list of filenames.  As with the real files, quarters
+from 3/2015 on have lowercase field names and are not sorted.
+
+Arguments
+---------
+outdir     : string - Output directory
+numTracts  : int - Number of tracts in each file
+quarters   : int - Number of quarters
+start      : string - First quarter, as MM/YYYY
+seed       : int - Random seed
+'''
+
+def writeHUDFiles(outdir, numTracts=nationalTracts, quarters=4,
+                  start="3/2008", seed=0):
+
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    universe = tractUniverse(numTracts, seed)
+    fileNames = []
+
+    for quarterIndex, (year, month) in enumerate(quarterList(start,
+                                                             quarters)):
+        newer = year >= 2015
+        fileName = os.path.join(outdir, hudFileName(year, month))
+        writeHUDFile(fileName, universe, quarterIndex, lowercase=newer,
+                     unsorted=newer, seed=seed)
+        fileNames.append(fileName)
+
+    return fileNames
+
+# ####################################################################
+# main()
+# ####################################################################
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Write synthetic HUD tract files for testing")
+    parser.add_argument("--outdir", required=True,
+                        help="directory for the .dbf files")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="number of tracts, as a multiple of a "
+                             "national file (%i tracts)" % (nationalTracts))
+    parser.add_argument("--tracts", type=int, default=None,
+                        help="number of tracts (overrides --scale)")
+    parser.add_argument("--quarters", type=int, default=4,
+                        help="number of quarters")
+    parser.add_argument("--start", default="3/2008",
+                        help="first quarter, as MM/YYYY")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed")
+    args = parser.parse_args()
+
+    numTracts = args.tracts
+    if numTracts is None:
+        numTracts = int(round(args.scale * nationalTracts))
+
+    fileNames = writeHUDFiles(args.outdir, numTracts, args.quarters,
+                              args.start, args.seed)
+    for fileName in fileNames:
+        print(fileName)
+
+
+if __name__ == '__main__':
+    main()
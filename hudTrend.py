@@ -0,0 +1,212 @@
+# ####################################################################
+#
+# Program:  hudTrend.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module fits a straight line to the vacancy rate (RES_VAC /
+# AMS_RES) of every tract over all the quarters of tract.csv, to flag
+# the tracts whose vacancy is rising.
+#
+# The fits are ordinary least squares in closed form, for all tracts at
+# once:  with the rates as one matrix (tracts x quarters) and a mask of
+# the quarters each tract has a rate in, the sums of the normal
+# equations of every tract are two matrix products (mask x [1, t, t^2]
+# and rates x [1, t]), and the slope, intercept, R-squared and the t
+# statistic of the slope follow elementwise.  A quarter a tract has no
+# rate in (not in the file, or no addresses) just drops out of its
+# sums.
+#
+# Time is in years since the first quarter of tract.csv, so the slope
+# is the change of the rate per year and the intercept is the fitted
+# rate at the first quarter.  The p-value of the slope is two sided,
+# from Student's t with n - 2 degrees of freedom (from the normal
+# distribution if scipy isn't installed).
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import os
+import numpy as np
+import hudAggregate as ha
+import hudQuery as hq
+import hudSpatial as hsp
+
+try:
+    from scipy.special import stdtr     # optional, exact t p-values
+except ImportError:
+    stdtr = None
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# significance level of the trend classes
+defaultAlpha = 0.05
+
+# fewest quarters with a rate for a fit
+defaultMinQuarters = 4
+
+trendHeadings = ["GEOID", "quarters", "first", "last", "slope",
+                 "intercept", "r2", "se", "t", "p", "trend"]
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+quarterYears
+
+This function: returns the time of every quarter in years since the
+first one.
+
+Arguments
+---------
+keys  : list - Quarters as YYYYMM (see hudQuery.qtrKey)
+'''
+
+def quarterYears(keys):
+
+    keys = np.asarray(keys, dtype=np.int64)
+    months = keys // 100 * 12 + keys % 100
+
+    return (months - months[0]) / 12.0 if len(keys) else months / 12.0
+
+# ####################################################################
+'''
+trendStats
+
+This function: fits the rate of every tract against time, and returns
+a dictionary of arrays (one value per tract):  n, slope, intercept, r2,
+se (of the slope), t, p, and the first and last quarter with a rate.
+Tracts with fewer than minQuarters rates get NaN.
+
+Arguments
+---------
+Y            : array - Rates (tracts x quarters), NaN where missing
+t            : array - Time of every quarter
+minQuarters  : int - Fewest quarters with a rate for a fit
+'''
+
+def trendStats(Y, t, minQuarters=defaultMinQuarters):
+
+    mask = np.isfinite(Y)
+    Y0 = np.where(mask, Y, 0.0)
+    W = mask.astype(float)
+
+    # time centered on its mean, for the conditioning of the sums
+    tc = t - t.mean() if len(t) else t
+
+    # the sums of the normal equations of all tracts
+    G = W @ np.stack([np.ones(len(tc)), tc, tc * tc], axis=1)
+    H = Y0 @ np.stack([np.ones(len(tc)), tc], axis=1)
+    n, Sx, Sxx = G[:, 0], G[:, 1], G[:, 2]
+    Sy, Sxy = H[:, 0], H[:, 1]
+    Syy = (Y0 * Y0).sum(axis=1)
+
+    fit = n >= max(minQuarters, 3)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sxx = Sxx - Sx * Sx / n
+        sxy = Sxy - Sx * Sy / n
+        syy = np.maximum(Syy - Sy * Sy / n, 0.0)
+        slope = sxy / sxx
+        intercept = Sy / n - slope * (Sx / n - (t[0] - t.mean()
+                                                if len(t) else 0.0))
+        r2 = np.where(syy > 0, sxy * sxy / (sxx * syy), 0.0)
+        sse = np.maximum(syy - slope * sxy, 0.0)
+        se = np.sqrt(sse / (n - 2) / sxx)
+        tStat = slope / se
+    fit &= np.isfinite(slope)
+
+    df = np.maximum(n - 2, 1)
+    p = np.full(len(n), np.nan)
+    finite = fit & np.isfinite(tStat)
+    if stdtr is not None:
+        p[finite] = 2 * stdtr(df[finite], -np.abs(tStat[finite]))
+    else:
+        p[finite] = hsp.normalP(tStat[finite])
+    # a perfect fit
+    p[fit & (se == 0) & (slope != 0)] = 0.0
+
+    first = np.where(mask.any(axis=1), mask.argmax(axis=1), -1)
+    last = np.where(mask.any(axis=1),
+                    mask.shape[1] - 1 - mask[:, ::-1].argmax(axis=1), -1)
+
+    stats = {"n": n.astype(np.int64), "first": first, "last": last}
+    for name, values in [("slope", slope), ("intercept", intercept),
+                         ("r2", r2), ("se", se), ("t", tStat), ("p", p)]:
+        stats[name] = np.where(fit, values, np.nan)
+    stats["fit"] = fit
+
+    return stats
+
+# ####################################################################
+'''
+trendClasses
+
+This function: returns the trend class of every tract:  "rising" or
+"falling" when the slope is significant, "flat" when it isn't, and
+"none" when the tract wasn't fit.
+
+Arguments
+---------
+stats  : dictionary - Result of trendStats
+alpha  : float - Significance level
+'''
+
+def trendClasses(stats, alpha=defaultAlpha):
+
+    classes = np.full(len(stats["n"]), "none", dtype="<U7")
+    classes[stats["fit"]] = "flat"
+    with np.errstate(invalid="ignore"):
+        significant = stats["fit"] & (stats["p"] < alpha)
+        classes[significant & (stats["slope"] > 0)] = "rising"
+        classes[significant & (stats["slope"] < 0)] = "falling"
+
+    return classes
+
+# ####################################################################
+'''
+writeTrends
+
+This function: fits the vacancy rate trend of every tract of the
+tract output in outdir and writes trend.csv (one row per tract which
+could be fit).  Returns the number of tracts of each trend class.
+
+Arguments
+---------
+outdir       : string - Directory holding tract.csv
+alpha        : float - Significance level of the trend classes
+minQuarters  : int - Fewest quarters with a rate for a fit
+'''
+
+def writeTrends(outdir, alpha=defaultAlpha, minQuarters=defaultMinQuarters):
+
+    index = hq.HUDStore(outdir).level("tract")
+    geoids = np.array(sorted(index.offsets), dtype="U")
+    Y, labels = hsp.rateMatrix(index, geoids)
+    stats = trendStats(Y, quarterYears(index.quarters()), minQuarters)
+    classes = trendClasses(stats, alpha)
+
+    rows = np.flatnonzero(stats["fit"])
+    outFile = open(os.path.join(outdir, "trend.csv"), "w")
+    outWriter = ha.newWriter(outFile)
+    outWriter.writerow(trendHeadings)
+    outWriter.writerows(
+        [geoid, n, labels[first], labels[last], slope, intercept, r2, se,
+         t, p, trend]
+        for geoid, n, first, last, slope, intercept, r2, se, t, p, trend
+        in zip(geoids[rows].tolist(), stats["n"][rows].tolist(),
+               stats["first"][rows].tolist(), stats["last"][rows].tolist(),
+               *[stats[name][rows].tolist() for name in
+                 ["slope", "intercept", "r2", "se", "t", "p"]],
+               classes[rows].tolist()))
+    outFile.close()
+
+    return {trend: int((classes == trend).sum())
+            for trend in ["rising", "falling", "flat", "none"]}
@@ -0,0 +1,187 @@
+# ####################################################################
+#
+# Program:  hudValidate.py
+#
+# Author:  Dolores Jane Forbes (dolores.j.forbes@census.gov)  x39323
+#
+# Python Version:  3.6.0
+#
+# Branch:  Geographic Research & Innovation Staff/Geography
+#
+# This module checks the HUD tract records of each quarter as they are
+# read, before they are summarized.  The checks are:
+#
+#   buckets     VAC_3_RES ... VAC_36_RES don't add up to RES_VAC
+#   negative    a count is less than zero
+#   vacant      RES_VAC is greater than AMS_RES
+#   duplicate   the GEOID appears more than once in the file
+#   missing     a value is missing (NaN)
+#
+# Each check is a vectorized mask over the whole data frame, computed
+# in the same pass that decodes the file, so the checks add very little
+# to the run time.  The result is a compact report per quarter with
+# the number of offending records and (the first few of) their GEOIDs.
+#
+# Optionally, the offending records can be quarantined, i.e. removed
+# before the summaries are calculated and kept aside for inspection.
+# For duplicate GEOIDs only the second and later copies are removed.
+#
+# ####################################################################
+# import libraries
+# ####################################################################
+
+import numpy as np
+
+# ####################################################################
+# global constants
+# ####################################################################
+
+# the VAC_* buckets, which should add up to RES_VAC
+bucketCols = ["VAC_3_RES",
+              "VAC_3_6_R",
+              "VAC_6_12R",
+              "VAC_12_24R",
+              "VAC_24_36R",
+              "VAC_36_RES"]
+
+# the count columns (everything except the Average Days Vacant)
+countCols = ["AMS_RES", "RES_VAC"] + bucketCols
+
+# the checks, in report order
+checkNames = ["buckets", "negative", "vacant", "duplicate", "missing"]
+
+# number of GEOIDs listed for each check in the report
+maxGEOIDs = 20
+
+# ####################################################################
+# functions
+# ####################################################################
+
+'''
+anomalyMasks
+
+This function: computes a boolean mask (one value per record) for
+each check.  The data frame must be sorted by GEOID, as returned by
+hudAggregate.projectDF.
+
+Arguments
+---------
+pandasDF  : data frame - Records for one quarter
+'''
+
+def anomalyMasks(pandasDF):
+
+    counts = pandasDF[countCols].values
+    buckets = pandasDF[bucketCols].values
+    geoids = pandasDF["GEOID"].values
+
+    # with the records sorted, a repeated GEOID follows its first copy
+    repeated = np.zeros(len(geoids), dtype=bool)
+    if len(geoids) > 1:
+        repeated[1:] = geoids[1:] == geoids[:-1]
+    duplicate = repeated.copy()
+    duplicate[:-1] |= repeated[1:]
+
+    with np.errstate(invalid="ignore"):
+        masks = {"buckets": (buckets.sum(axis=1) !=
+                             pandasDF["RES_VAC"].values),
+                 "negative": (counts < 0).any(axis=1),
+                 "vacant": (pandasDF["RES_VAC"].values >
+                            pandasDF["AMS_RES"].values),
+                 "duplicate": duplicate,
+                 "missing": np.isnan(pandasDF[countCols +
+                                              ["AVG_VAC_R"]].values
+                                     ).any(axis=1)}
+
+    # a missing value makes the bucket sum unequal, report it only once
+    masks["buckets"] &= ~masks["missing"]
+
+    return masks, repeated
+
+# ####################################################################
+'''
+validateDF
+
+This function: checks the records of one quarter and returns the
+records to be summarized, an anomaly report, and the quarantined
+records (None unless quarantine is set).
+
+The report is a dictionary:
+
+    {"Month/Year": ..., "records": ..., "anomalies": ...,
+     "quarantined": ...,
+     "checks": {"buckets": {"count": ..., "geoids": [...]}, ...}}
+
+where anomalies is the number of records failing at least one check.
+
+Arguments
+---------
+pandasDF    : data frame - Records for one quarter (sorted by GEOID)
+qtrYear     : string - Month/Year label for this file
+quarantine  : boolean - Remove the offending records
+'''
+
+def validateDF(pandasDF, qtrYear, quarantine=False):
+
+    masks, repeated = anomalyMasks(pandasDF)
+    geoids = pandasDF["GEOID"].values
+
+    report = {"Month/Year": qtrYear,
+              "records": len(pandasDF),
+              "checks": {}}
+
+    anyBad = np.zeros(len(pandasDF), dtype=bool)
+    for name in checkNames:
+        mask = masks[name]
+        anyBad |= mask
+        offending = geoids[mask]
+        if name == "duplicate":
+            offending = np.unique(offending)
+        report["checks"][name] = {"count": int(mask.sum()),
+                                  "geoids": [str(g) for g in
+                                             offending[:maxGEOIDs]]}
+
+    report["anomalies"] = int(anyBad.sum())
+
+    if not quarantine:
+        report["quarantined"] = 0
+        return pandasDF, report, None
+
+    # remove every record failing a check, except the first copy of a
+    # duplicate GEOID
+    remove = repeated.copy()
+    for name in checkNames:
+        if name != "duplicate":
+            remove |= masks[name]
+
+    report["quarantined"] = int(remove.sum())
+
+    return (pandasDF[~remove].reset_index(drop=True), report,
+            pandasDF[remove].reset_index(drop=True))
+
+# ####################################################################
+'''
+reportLine
+
+This function: returns a one line summary of an anomaly report, e.g.
+
+    03/2015: 12 of 73767 records failed (buckets 10, vacant 2)
+
+Arguments
+---------
+report  : dictionary - Anomaly report from validateDF
+'''
+
+def reportLine(report):
+
+    failed = ["%s %i" % (name, report["checks"][name]["count"])
+              for name in checkNames if report["checks"][name]["count"]]
+    line = "%s: %i of %i records failed" % (report["Month/Year"],
+                                            report["anomalies"],
+                                            report["records"])
+    if failed:
+        line += " (" + ", ".join(failed) + ")"
+    if report["quarantined"]:
+        line += ", %i quarantined" % (report["quarantined"])
+
+    return line